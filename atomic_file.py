@@ -0,0 +1,10 @@
+import os
+
+# Helper function: Write a file through a temporary file next to it that replaces it only once complete, so an
+# interrupted write never leaves a truncated file
+# Input: String (file path), function writing the contents to an open binary file
+def write_atomic(file_path, write):
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        write(file)
+    os.replace(temp_path, file_path)
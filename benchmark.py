@@ -0,0 +1,777 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import cv2
+from sklearn.cluster import KMeans
+from scipy.spatial import cKDTree
+from rdp import rdp
+import image_processing as img_processing
+from job_index import JobIndex
+import simplify
+import curve_fitting
+import waypoint_file
+import robot_link
+import trajectory
+
+# Bundled images and the k used for each in the pipeline notes
+bench_images = [('penn_logo_sharp.png', 3), ('minnesota_wild.png', 5)]
+border_size = 2
+
+# Helper function: Run a function and return its result along with the elapsed wall time
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+# Reference implementation: the original per-pixel nearest-center loop from s1_reduce_img_rgbs
+def legacy_s1_assign(img_rgb, selected_rgbs):
+    img_height, img_width, _ = img_rgb.shape
+    k = len(selected_rgbs)
+    img_reduced_rgb = np.zeros_like(img_rgb)
+    for y in range(img_height):
+        for x in range(img_width):
+            rgb_errors = np.zeros((k))
+            pixel_rgb = img_rgb[y, x, :]
+            for i in range((k)):
+                rgb_errors[i] = np.sqrt(np.mean((selected_rgbs[i] - pixel_rgb) ** 2))
+            rgb_index = np.argmin(rgb_errors)
+            img_reduced_rgb[y, x] = selected_rgbs[rgb_index]
+    return img_reduced_rgb
+
+# Compare the per-pixel s1 assignment loop against the batched assignment engine
+def bench_s1_assignment():
+    print('s1 nearest-palette assignment')
+    for image_path, k in bench_images:
+        img_rgb = img_processing.s0_prepare_img(image_path, border_size=border_size)
+        pixels = img_rgb.reshape(-1, 3)
+        kmeans = KMeans(n_clusters = k, random_state = 0).fit(pixels)
+        selected_rgbs = np.round(kmeans.cluster_centers_).astype(int)
+
+        legacy_rgb, legacy_time = timed(legacy_s1_assign, img_rgb, selected_rgbs)
+        labels, batched_time = timed(img_processing.assign_nearest_rgbs, pixels, selected_rgbs)
+        batched_rgb = selected_rgbs[labels].reshape(img_rgb.shape).astype(img_rgb.dtype)
+
+        print(f'  {image_path} {img_rgb.shape[:2]}: loop {legacy_time:.2f}s, '
+              f'batched {batched_time:.3f}s, speedup {legacy_time / batched_time:.0f}x, '
+              f'identical {np.array_equal(legacy_rgb, batched_rgb)}')
+
+# Helper function: Mean squared RGB error of an image's pixels against their nearest palette RGB
+def palette_error(pixels, selected_rgbs):
+    labels = img_processing.assign_nearest_rgbs(pixels, selected_rgbs)
+    return np.mean((pixels.astype(float) - selected_rgbs[labels]) ** 2)
+
+# Compare s1 palette fit time and quality of each fit mode against the full-image fit
+def bench_s1_fit_modes():
+    print('s1 palette fit modes')
+    for image_path, k in bench_images:
+        img_rgb = img_processing.s0_prepare_img(image_path, border_size=border_size)
+        pixels = img_rgb.reshape(-1, 3)
+        full_rgbs, full_time = timed(img_processing.fit_palette, pixels, k, fit_mode='full')
+        full_error = palette_error(pixels, full_rgbs)
+        print(f'  {image_path} {img_rgb.shape[:2]}: full fit {full_time:.3f}s, error {full_error:.2f}')
+        for fit_mode in ['unique', 'sample']:
+            selected_rgbs, fit_time = timed(img_processing.fit_palette, pixels, k, fit_mode=fit_mode)
+            error = palette_error(pixels, selected_rgbs)
+            print(f'    {fit_mode}: {fit_time:.3f}s ({full_time / fit_time:.0f}x), '
+                  f'error {error:.2f} ({error / full_error:.3f} of full)')
+
+# Reference implementation: the original per-pixel 2x2 RGB set scan from s2_generate_edges
+def legacy_s2_generate_edges(img_rgb):
+    img_height, img_width, _ = img_rgb.shape
+    img_edges = np.zeros_like(img_rgb[:, :, 0])
+    y_range = [0, 1]
+    x_range = [0, 1]
+    for y in range(img_height):
+        for x in range(img_width):
+            tracked_rgbs = set()
+            for y_offset in y_range:
+                for x_offset in x_range:
+                    y_neighbor, x_neighbor = y + y_offset, x + x_offset
+                    if 0 <= y_neighbor < img_height and 0 <= x_neighbor < img_width:
+                        neighbor_rgb = tuple(img_rgb[y_neighbor, x_neighbor])
+                        tracked_rgbs.add(neighbor_rgb)
+            if len(tracked_rgbs) > 1:
+                img_edges[y, x] = 255
+    return img_edges
+
+# Check the shifted-array edge detector against the original 2x2 set scan and time both
+def bench_s2_edges():
+    print('s2 edge detection')
+    for image_path, k in bench_images:
+        img_rgb = img_processing.s0_prepare_img(image_path, border_size=border_size)
+        img_labels, selected_rgbs = img_processing.s1_reduce_img_rgbs(img_rgb, k=k, fit_mode='unique')
+        legacy_edges, legacy_time = timed(legacy_s2_generate_edges,
+                                          img_processing.labels_to_rgb(img_labels, selected_rgbs))
+        img_edges, vectorized_time = timed(img_processing.s2_generate_edges, img_labels)
+        identical = np.array_equal(legacy_edges, img_edges)
+        print(f'  {image_path} {img_rgb.shape[:2]}: loop {legacy_time:.2f}s, '
+              f'vectorized {vectorized_time:.4f}s, speedup {legacy_time / vectorized_time:.0f}x, '
+              f'identical {identical}')
+        assert identical, f'Edge mismatch on {image_path}'
+        for connectivity in [None, 4, 8]:
+            for thin in [False, True]:
+                img_edges = img_processing.s2_generate_edges(img_labels, connectivity=connectivity, thin=thin)
+                print(f'    connectivity {connectivity}, thin {thin}: {np.count_nonzero(img_edges)} edge pixels')
+
+    # Thin boundaries must be found whichever side holds the lower label
+    for connectivity in [None, 4, 8]:
+        for img_labels in [np.repeat([[1, 1, 1, 0, 0, 0]], 6, axis=0), np.repeat([[0, 0, 0, 1, 1, 1]], 6, axis=0)]:
+            for labels in [img_labels, img_labels.T]:
+                img_edges = img_processing.s2_generate_edges(labels.astype(np.uint8), connectivity=connectivity,
+                                                             thin=True)
+                assert np.count_nonzero(img_edges) == 6, f'Thin edges missed with connectivity {connectivity}'
+    print('  thin boundaries found for every label order and connectivity')
+
+# Helper function: Approximate memory held by nested lists of (y, x) tuples of Python ints
+def nested_tuples_size(edges):
+    size = sys.getsizeof(edges)
+    for edge in edges:
+        size += sys.getsizeof(edge)
+        for path in edge:
+            size += sys.getsizeof(path)
+            size += sum(sys.getsizeof(point) + sys.getsizeof(point[0]) + sys.getsizeof(point[1]) for point in path)
+    return size
+
+# Compare the memory of the flat PathBuffer against nested lists of tuples on an upscaled image
+def bench_path_buffer():
+    print('s3 edge container memory')
+    image_path, k = bench_images[1]
+    img_rgb = img_processing.s0_prepare_img(image_path, border_size=border_size)
+    img_labels, _ = img_processing.s1_reduce_img_rgbs(img_rgb, k=k, fit_mode='unique')
+    # Upscale the label image so the edges hold well over 100k pixels
+    img_labels = np.kron(img_labels, np.ones((6, 6), dtype=np.uint8))
+    img_edges = img_processing.s2_generate_edges(img_labels)
+    edges, group_time = timed(img_processing.s3_group_edges, img_edges)
+    buffer_size = edges.coords.nbytes + edges.path_offsets.nbytes + edges.edge_offsets.nbytes
+    tuples_size = nested_tuples_size(edges.to_lists())
+    print(f'  {image_path} x6 {img_labels.shape}: {edges}, grouped in {group_time:.3f}s')
+    print(f'    buffer {buffer_size / 1e6:.2f} MB, nested tuples {tuples_size / 1e6:.2f} MB '
+          f'({tuples_size / buffer_size:.0f}x)')
+
+# Reference implementation: the original full-scan nearest-pixel ordering from s4_order_edges, for one edge.
+# It recurses once per pixel, so it needs the raised recursion limit the pipeline used to set
+def legacy_closest_point(curr, points):
+    min_dist = float('inf')
+    min_point = None
+    for point in points:
+        dist = np.linalg.norm(np.array(curr) - np.array(point))
+        if dist < min_dist:
+            min_dist = dist
+            min_point = point
+    return min_dist, min_point
+
+def legacy_helper(curr, remaining, all_sections, ordered_section, mode, dist_thresh, section_size_thresh):
+    if len(remaining) == 0:
+        all_sections.append(ordered_section)
+        return
+    min_dist, min_point = legacy_closest_point(curr, remaining)
+    if min_dist < dist_thresh:
+        if mode == 'forward':
+            ordered_section.append(min_point)
+        else:
+            ordered_section.insert(0, min_point)
+        remaining.remove(min_point)
+        legacy_helper(min_point, remaining, all_sections, ordered_section, mode, dist_thresh, section_size_thresh)
+    elif mode == 'forward':
+        legacy_helper(ordered_section[0], remaining, all_sections, ordered_section, 'backward', dist_thresh,
+                      section_size_thresh)
+    else:
+        if len(ordered_section) > section_size_thresh:
+            all_sections.append(ordered_section)
+        curr = remaining.pop()
+        legacy_helper(curr, remaining, all_sections, [curr], 'forward', dist_thresh, section_size_thresh)
+
+def legacy_s4_order_edge(edge, dist_thresh, section_size_thresh):
+    remaining = set(map(tuple, edge.tolist()))
+    curr = remaining.pop()
+    all_sections = []
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 20000))
+    legacy_helper(curr, remaining, all_sections, [curr], 'forward', dist_thresh, section_size_thresh)
+    return all_sections
+
+# Helper function: Synthetic edge of about num_points pixels, a two-pixel-wide ring like the ones s2 produces
+def ring_edge(num_points):
+    radius = max(num_points / (4 * np.pi), 2)
+    size = int(2 * radius) + 5
+    y, x = np.mgrid[:size, :size] - size // 2
+    dist = np.sqrt(y ** 2 + x ** 2)
+    return np.argwhere((dist >= radius - 1) & (dist < radius + 1)).astype(np.int32)
+
+# Compare how the full-scan and grid-indexed s4 orderings scale with the number of pixels in an edge
+def bench_s4_scaling():
+    print('s4 edge ordering scaling')
+    for num_points in [250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000]:
+        edge = ring_edge(num_points)
+        edges = img_processing.PathBuffer.from_paths(edge, [0, len(edge)])
+        ordered_edges, grid_time = timed(img_processing.s4_order_edges, edges, 5, 10)
+        line = f'  {len(edge)} pixels: grid {grid_time:.3f}s ({ordered_edges.num_paths} sections)'
+        if num_points <= 2000:
+            all_sections, legacy_time = timed(legacy_s4_order_edge, edge, 5, 10)
+            line += f', full scan {legacy_time:.3f}s ({len(all_sections)} sections), ' \
+                    f'speedup {legacy_time / grid_time:.0f}x'
+        print(line)
+
+# Compare the greedy and skeleton s4 engines by section count, waypoint count after RDP and runtime
+def bench_s4_engines():
+    print('s4 ordering engines')
+    for image_path, k in bench_images:
+        img_rgb = img_processing.s0_prepare_img(image_path, border_size=border_size)
+        img_labels, _ = img_processing.s1_reduce_img_rgbs(img_rgb, k=k, fit_mode='unique')
+        edges = img_processing.s3_group_edges(img_processing.s2_generate_edges(img_labels))
+        print(f'  {image_path}: {edges}')
+        for engine in ['greedy', 'skeleton']:
+            ordered_edges, order_time = timed(img_processing.s4_order_edges, edges, 5, 10, engine=engine)
+            num_waypoints = sum(len(rdp(path, epsilon=1.4)) for path in ordered_edges.paths())
+            print(f'    {engine}: {order_time:.3f}s, {ordered_edges.num_paths} sections, '
+                  f'{ordered_edges.num_points} pixels, {num_waypoints} waypoints')
+
+# Time s4 and s5 with an increasing number of worker processes on a busy image, checking against the serial output
+def bench_s45_workers():
+    print(f's4 + s5 worker scaling ({os.cpu_count()} cores available)')
+    image_path, k = bench_images[1]
+    img_rgb = img_processing.s0_prepare_img(image_path, border_size=border_size)
+    img_labels, _ = img_processing.s1_reduce_img_rgbs(img_rgb, k=k, fit_mode='unique')
+    # Tile the label image 2x2 to get more independent edge groups
+    img_labels = np.tile(img_labels, (2, 2))
+    edges = img_processing.s3_group_edges(img_processing.s2_generate_edges(img_labels))
+    print(f'  {image_path} tiled 2x2: {edges}')
+    serial_result = None
+    serial_time = None
+    for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+        result, run_time = timed(img_processing.s45_order_and_simplify, edges, 5, 10, 1.4, workers=workers)
+        if serial_result is None:
+            serial_result, serial_time = result, run_time
+        matches = all(np.array_equal(getattr(buffer, name), getattr(serial_buffer, name))
+                      for buffer, serial_buffer in zip(result, serial_result)
+                      for name in ['coords', 'path_offsets', 'edge_offsets'])
+        print(f'    {workers} workers: {run_time:.3f}s, speedup {serial_time / run_time:.2f}x, matches serial {matches}')
+
+# Helper function: Mean distance from the pixels of one PathBuffer to the nearest pixel of another (or another
+# reduction of the distances). The reference paths are drawn as connected polylines
+def mean_distance_to(buffer, reference, shape, reduce = np.mean):
+    img_reference = np.full(shape, 255, dtype=np.uint8)
+    cv2.polylines(img_reference, [path[:, ::-1].reshape(-1, 1, 2) for path in reference.paths()], False, 0)
+    distances = cv2.distanceTransform(img_reference, cv2.DIST_L2, 5)
+    return reduce(distances[buffer.coords[:, 0], buffer.coords[:, 1]])
+
+# Compare contour mode against the s2 -> s3 -> s4 chain by runtime and by how closely the traced boundaries match
+def bench_contour_mode():
+    print('contour mode vs s2-s4 chain')
+    for image_path, k in bench_images:
+        img_rgb = img_processing.s0_prepare_img(image_path, border_size=border_size)
+        img_labels, _ = img_processing.s1_reduce_img_rgbs(img_rgb, k=k, fit_mode='unique')
+        start = time.perf_counter()
+        edges = img_processing.s3_group_edges(img_processing.s2_generate_edges(img_labels))
+        ordered_edges = img_processing.s4_order_edges(edges, 5, 10)
+        chain_time = time.perf_counter() - start
+        contour_edges, contour_time = timed(img_processing.s234_trace_contours, img_labels)
+        chain_waypoints = img_processing.s5_simplify_path(ordered_edges, 1.4).num_points
+        contour_waypoints = img_processing.s5_simplify_path(contour_edges, 1.4).num_points
+        print(f'  {image_path}: chain {chain_time:.3f}s, contours {contour_time:.4f}s '
+              f'({chain_time / contour_time:.0f}x)')
+        print(f'    chain {ordered_edges.num_paths} paths / {chain_waypoints} waypoints, '
+              f'contours {contour_edges.num_paths} paths / {contour_waypoints} waypoints')
+        print(f'    mean distance contour -> chain {mean_distance_to(contour_edges, ordered_edges, img_labels.shape):.2f}px, '
+              f'chain -> contour {mean_distance_to(ordered_edges, contour_edges, img_labels.shape):.2f}px')
+
+# Helper function: Total length of a list of paths
+def total_path_length(paths):
+    return sum(np.sqrt((np.diff(path, axis=0) ** 2).sum(axis=1)).sum() for path in paths)
+
+# Compare the shared boundary graph with contour mode and the s2-s4 chain by planning time and painted length
+def bench_boundary_graph():
+    print('shared boundary graph vs contours and s2-s4 chain')
+    for image_path, k in bench_images:
+        img_rgb = img_processing.s0_prepare_img(image_path, border_size=border_size)
+        img_labels, _ = img_processing.s1_reduce_img_rgbs(img_rgb, k=k, fit_mode='unique')
+        start = time.perf_counter()
+        edges = img_processing.s3_group_edges(img_processing.s2_generate_edges(img_labels))
+        chain_edges = img_processing.s4_order_edges(edges, 5, 10)
+        chain_time = time.perf_counter() - start
+        contour_edges, contour_time = timed(img_processing.s234_trace_contours, img_labels)
+        (boundary_edges, boundary_labels, _), boundary_time = timed(img_processing.s234_boundary_graph, img_labels)
+        print(f'  {image_path}:')
+        for name, ordered_edges, run_time in [('chain', chain_edges, chain_time),
+                                              ('contours', contour_edges, contour_time),
+                                              ('boundary graph', boundary_edges, boundary_time)]:
+            # Simplify every path (not only the first section of each edge) so all methods are compared in full
+            simplified_paths = [rdp(path, epsilon=1.4) for path in ordered_edges.paths()]
+            painted_length = total_path_length(simplified_paths)
+            simplified_buffer = img_processing.s5_simplify_path(ordered_edges, 1.4)
+            sequenced_paths, _ = img_processing.s56_sequence_strokes(simplified_buffer)
+            job_time = trajectory.estimate_job_time(sequenced_paths)
+            print(f'    {name}: {run_time:.3f}s, {ordered_edges.num_paths} paths, {ordered_edges.num_points} points, '
+                  f'{sum(map(len, simplified_paths))} waypoints, painted length {painted_length:.0f}px, '
+                  f'estimated job time {job_time:.0f}s')
+        print(f'    boundary graph label pairs: {len(np.unique(boundary_labels, axis=0))}')
+        # Every boundary the chain paints must also be painted by the boundary graph (the chain follows edge pixels,
+        # the graph pixel corners, so they lie within about a pixel of each other)
+        distances, _ = cKDTree(boundary_edges.coords).query(chain_edges.coords)
+        print(f'    chain points more than 2px from the boundary graph: {np.sum(distances > 2)}')
+        assert np.all(distances <= 2)
+
+# Report pen-up travel before and after stroke sequencing for the chain and boundary graph outputs
+def bench_sequencing():
+    print('s56 stroke sequencing')
+    for image_path, k in bench_images:
+        img_rgb = img_processing.s0_prepare_img(image_path, border_size=border_size)
+        img_labels, _ = img_processing.s1_reduce_img_rgbs(img_rgb, k=k, fit_mode='unique')
+        edges = img_processing.s3_group_edges(img_processing.s2_generate_edges(img_labels))
+        chain_paths = img_processing.s5_simplify_path(img_processing.s4_order_edges(edges, 5, 10), 1.4)
+        boundary_paths = img_processing.s5_simplify_path(img_processing.s234_boundary_graph(img_labels)[0], 1.4)
+        for name, simplified_paths in [('chain', chain_paths), ('boundary graph', boundary_paths)]:
+            (_, travel), run_time = timed(img_processing.s56_sequence_strokes, simplified_paths)
+            print(f'  {image_path} {name}: {simplified_paths.num_paths} strokes sequenced in {run_time:.3f}s, '
+                  f'travel {travel["original"]:.0f} -> {travel["improved"]:.0f}px '
+                  f'({1 - travel["improved"] / travel["original"]:.0%} less)')
+
+# Helper function: Long closed edge tracing a wobbly circle, as a one-pixel-wide boundary would
+def wobbly_loop(num_points):
+    angles = np.linspace(0, 2 * np.pi, num_points, endpoint=False)
+    radii = num_points / (2 * np.pi) * (1 + 0.05 * np.sin(7 * angles))
+    return np.round(np.stack([radii * np.sin(angles), radii * np.cos(angles)], axis=1)).astype(np.int32)
+
+# Compare the batched RDP of simplify.py against the rdp package on the pipeline's paths and on long edges
+def bench_rdp():
+    print('s5 RDP: simplify.rdp_buffer vs rdp package')
+    for image_path, k in bench_images:
+        img_rgb = img_processing.s0_prepare_img(image_path, border_size=border_size)
+        img_labels, _ = img_processing.s1_reduce_img_rgbs(img_rgb, k=k, fit_mode='unique')
+        ordered_edges = img_processing.s234_boundary_graph(img_labels)[0]
+        reference, reference_time = timed(lambda: [rdp(path, epsilon=1.4) for path in ordered_edges.paths()])
+        simplified, run_time = timed(simplify.rdp_buffer, ordered_edges, 1.4)
+        matches = all(np.array_equal(path, expected) for path, expected in zip(simplified.paths(), reference))
+        print(f'  {image_path}: {ordered_edges.num_paths} paths, {ordered_edges.num_points} points, '
+              f'rdp {reference_time:.3f}s, batched {run_time:.4f}s ({reference_time / run_time:.0f}x), '
+              f'matches {matches}')
+    for num_points in [1000, 10000, 50000, 200000]:
+        edge = wobbly_loop(num_points)
+        simplified, run_time = timed(simplify.rdp_path, edge, 1.4)
+        line = f'  edge of {num_points} points: batched {run_time:.4f}s, {len(simplified)} waypoints'
+        if num_points <= 50000:
+            reference, reference_time = timed(rdp, edge, epsilon=1.4)
+            line += (f', rdp {reference_time:.3f}s ({reference_time / run_time:.0f}x), '
+                     f'matches {np.array_equal(simplified, reference)}')
+        print(line)
+
+# Compare the waypoint budget methods by worst-case error against RDP with epsilon 1.4 at the same waypoint counts
+def bench_waypoint_budget():
+    print('s5 waypoint budget')
+    for image_path, k in bench_images:
+        img_rgb = img_processing.s0_prepare_img(image_path, border_size=border_size)
+        img_labels, _ = img_processing.s1_reduce_img_rgbs(img_rgb, k=k, fit_mode='unique')
+        ordered_edges = img_processing.s234_boundary_graph(img_labels, edge_threshold=0)[0]
+        coords, path_offsets = ordered_edges.coords, ordered_edges.path_offsets
+        keep = simplify.rdp_mask(coords, path_offsets, 1.4)
+        num_waypoints = int(keep.sum())
+        print(f'  {image_path}: {ordered_edges.num_paths} paths, {ordered_edges.num_points} points, '
+              f'epsilon 1.4 gives {num_waypoints} waypoints, error {simplify.max_deviation(coords, path_offsets, keep):.2f}px')
+        for budget in [10, num_waypoints // 2, num_waypoints, num_waypoints * 3]:
+            for method in ['rdp', 'visvalingam']:
+                (simplified, max_error, num_dropped), run_time = timed(simplify.budget_buffer, ordered_edges, budget,
+                                                                       method=method)
+                print(f'    budget {budget} {method}: {simplified.num_points} waypoints, error {max_error:.2f}px, '
+                      f'{num_dropped} paths dropped, {run_time:.3f}s')
+                # The budget is a hard limit, and no kept path (in particular no closed loop) collapses to one point
+                assert simplified.num_points <= budget, f'Budget {budget} exceeded on {image_path}'
+                assert np.all(simplified.path_lengths() >= np.minimum(ordered_edges.path_lengths().max(), 2)), \
+                    f'Path collapsed on {image_path}'
+                assert all(len(np.unique(path, axis=0)) >= 2 for path in simplified.paths()
+                           if np.any(path[0] != path[-1]) or len(path) > 1), f'Loop collapsed on {image_path}'
+
+        # Closing points added by s56 (near-closed strokes) and by s6 (every path, with close_paths=True) are counted
+        with tempfile.TemporaryDirectory() as output_dir:
+            output_file = os.path.join(output_dir, 'waypoints.txt')
+            for budget in [50, 200, 1000]:
+                simplified = img_processing.s5_simplify_path(ordered_edges, 1.4, max_waypoints=budget)
+                sequenced, _ = img_processing.s56_sequence_strokes(simplified)
+                simplified = img_processing.s5_simplify_path(ordered_edges, 1.4, max_waypoints=budget, loop_gap=np.inf)
+                img_processing.s6_generate_output(img_processing.s56_sequence_strokes(simplified)[0], output_file)
+                with open(output_file) as file:
+                    num_written = sum(1 for _ in file)
+                print(f'    budget {budget}: {sequenced.num_points} waypoints after s56, {num_written} written by s6 '
+                      f'closing every path')
+                assert sequenced.num_points <= budget and num_written <= budget, f'Budget {budget} exceeded'
+
+# Report how much curve fitting shrinks the waypoint stream and how far the sampled curves stray from the edges
+def bench_curve_fitting():
+    print('s57 curve fitting')
+    with tempfile.TemporaryDirectory() as output_dir:
+        waypoints_file = os.path.join(output_dir, 'waypoints.txt')
+        curves_file = os.path.join(output_dir, 'curves.txt')
+        for image_path, k in bench_images:
+            img_rgb = img_processing.s0_prepare_img(image_path, border_size=border_size)
+            img_labels, _ = img_processing.s1_reduce_img_rgbs(img_rgb, k=k, fit_mode='unique')
+            ordered_edges = img_processing.s234_boundary_graph(img_labels)[0]
+            simplified_paths = simplify.rdp_buffer(ordered_edges, 1.4)
+            print(f'  {image_path}:')
+            for name, paths in [('edge pixels', ordered_edges), ('s5 waypoints', simplified_paths)]:
+                curves, run_time = timed(curve_fitting.fit_curves, paths, 1.0)
+                img_processing.s6_generate_output(paths, waypoints_file, close_paths=False)
+                curve_fitting.write_curves(curves, curves_file)
+                round_trip = curve_fitting.read_curves(curves_file)
+                matches = np.array_equal(round_trip.to_paths().coords, curves.to_paths().coords)
+                print(f'    {name}: {paths.num_points} waypoints ({os.path.getsize(waypoints_file)} bytes) -> '
+                      f'{curves.num_primitives} primitives, {curves.num_arcs} arcs ({os.path.getsize(curves_file)} '
+                      f'bytes) in {run_time:.3f}s, max distance from edge pixels '
+                      f'{mean_distance_to(ordered_edges, curves.to_paths(), img_labels.shape, reduce=np.max):.2f}px, '
+                      f'file round trip matches {matches}')
+
+# Compare the text and binary waypoint formats by write and read time and file size on a large job
+def bench_waypoint_file():
+    print('s6 waypoint file formats')
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as output_dir:
+        for num_waypoints in [10000, 1000000]:
+            path_lengths = rng.integers(2, 200, size=num_waypoints // 100)
+            coords = rng.integers(0, 4000, size=(int(path_lengths.sum()), 2)).astype(np.int32)
+            paths = img_processing.PathBuffer.from_paths(coords, np.concatenate([[0], np.cumsum(path_lengths)]))
+            text_file = os.path.join(output_dir, 'waypoints.txt')
+            binary_file = os.path.join(output_dir, 'waypoints.wpt')
+            _, text_write_time = timed(img_processing.s6_generate_output, paths, text_file, close_paths=False)
+            _, binary_write_time = timed(img_processing.s6_generate_output, paths, binary_file, close_paths=False,
+                                         output_format='binary')
+            text_waypoints, text_read_time = timed(np.loadtxt, text_file, delimiter=',', dtype=np.int64)
+            (binary_coords, path_offsets, toggles), binary_read_time = timed(waypoint_file.read_waypoints, binary_file)
+            matches = np.array_equal(binary_coords, text_waypoints[:, :2]) and \
+                np.array_equal(toggles, text_waypoints[:, 2]) and np.array_equal(path_offsets, paths.path_offsets)
+            print(f'  {paths.num_points} waypoints: text {os.path.getsize(text_file)} bytes, write '
+                  f'{text_write_time:.3f}s, read {text_read_time:.3f}s; binary {os.path.getsize(binary_file)} bytes, '
+                  f'write {binary_write_time:.4f}s, read {binary_read_time * 1000:.2f}ms; matches {matches}')
+
+# Reference implementations: the original line-by-line loaders of gui.py for path files and waypoint files
+def legacy_load_path_file(file_path):
+    points = []
+    with open(file_path, "r") as file:
+        for line in file:
+            x, y = map(float, line.strip().split(" "))
+            points.append((x, y))
+    return np.array(points)
+
+def legacy_load_waypoint_file(file_path):
+    points = []
+    with open(file_path, "r") as file:
+        for line in file:
+            x, y, z = map(float, line.strip().split(", "))
+            points.append((x, y))
+    return np.array(points)
+
+# Compare the GUI's bulk waypoint loader against the original line-by-line loaders, and check that trailing blank
+# lines (which the original loaders fail on) are skipped
+def bench_waypoint_loader():
+    print('GUI waypoint loader')
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as output_dir:
+        for num_waypoints in [10000, 1000000]:
+            coords = rng.integers(0, 4000, size=(num_waypoints, 2))
+            toggles = rng.integers(0, 2, size=num_waypoints)
+            waypoints_file = os.path.join(output_dir, 'image_waypoints.txt')
+            np.savetxt(waypoints_file, np.column_stack([coords, toggles]), fmt='%d', delimiter=', ')
+            path_points = rng.uniform(0, 4000, size=(num_waypoints, 2))
+            path_file = os.path.join(output_dir, 'path.txt')
+            np.savetxt(path_file, path_points, fmt='%.6f', delimiter=' ')
+            for name, file_path, legacy_loader, expected in [('waypoints', waypoints_file, legacy_load_waypoint_file,
+                                                              coords), ('path', path_file, legacy_load_path_file,
+                                                                        np.round(path_points, 6))]:
+                legacy_points, legacy_time = timed(legacy_loader, file_path)
+                (points, loaded_toggles), load_time = timed(waypoint_file.load_waypoints, file_path)
+                with open(file_path, 'a') as file:
+                    file.write('\n\n')
+                trailing_points, _ = waypoint_file.load_waypoints(file_path)
+                matches = np.array_equal(points, legacy_points) and np.allclose(points, expected) and \
+                    np.array_equal(trailing_points, points) and \
+                    (loaded_toggles is None or np.array_equal(loaded_toggles, toggles))
+                print(f'  {num_waypoints} {name} lines: line by line {legacy_time:.3f}s, bulk {load_time:.3f}s '
+                      f'({legacy_time / load_time:.1f}x); matches {matches}')
+
+# Helper function: Largest distance from any trajectory sample to the job's polyline, sampled every 0.05 units
+def max_polyline_deviation(positions, paths, start_point = (0, 0)):
+    vertices, _, _ = trajectory.job_polyline(paths, start_point)
+    deltas = np.diff(vertices, axis=0)
+    steps = np.maximum(np.ceil(np.hypot(deltas[:, 0], deltas[:, 1]) / 0.05).astype(np.int64), 1)
+    segment_ids = np.repeat(np.arange(len(deltas)), steps)
+    fractions = (np.arange(len(segment_ids)) - np.repeat(np.cumsum(steps) - steps, steps)) / steps[segment_ids]
+    dense = np.concatenate([vertices[segment_ids] + deltas[segment_ids] * fractions[:, None], vertices[-1:]])
+    distances, _ = cKDTree(dense).query(positions)
+    return float(distances.max())
+
+# Helper function: Speed, acceleration and jerk magnitudes of a sampled trajectory, by finite differences
+def trajectory_limits(robot_trajectory, control_rate):
+    velocities = np.diff(robot_trajectory.positions, axis=0) * control_rate
+    accelerations = np.diff(velocities, axis=0) * control_rate
+    jerks = np.diff(accelerations, axis=0) * control_rate
+    return np.hypot(*velocities.T), np.hypot(*accelerations.T), np.hypot(*jerks.T)
+
+# Compare estimated job times of stopping at every waypoint against blended corners, of the unsmoothed plan against
+# the jerk-limited trajectory, and of unsequenced against sequenced strokes; assert the samples respect the limits
+def bench_trajectory():
+    print('s58 trajectory generation')
+    limits = {'paint_speed': 3.0, 'travel_speed': 6.0, 'max_accel': 3.0, 'corner_tolerance': 0.25, 'control_rate': 50}
+    max_jerk = 20.0
+    for image_path, k in bench_images:
+        img_rgb = img_processing.s0_prepare_img(image_path, border_size=border_size)
+        img_labels, _ = img_processing.s1_reduce_img_rgbs(img_rgb, k=k, fit_mode='unique')
+        edges = img_processing.s3_group_edges(img_processing.s2_generate_edges(img_labels))
+        _, simplified_paths = img_processing.s45_order_and_simplify(edges, 5, 10, 1.4)
+        sequenced_paths, _ = img_processing.s56_sequence_strokes(simplified_paths)
+        stop_time = trajectory.estimate_job_time(sequenced_paths, **dict(limits, corner_tolerance=0))
+        unsequenced_time = trajectory.estimate_job_time(simplified_paths, **limits)
+        print(f'  {image_path}: {sequenced_paths.num_points} waypoints; stopping at every waypoint {stop_time:.1f}s, '
+              f'unsequenced strokes {unsequenced_time:.1f}s')
+        trapezoidal_time = trajectory.estimate_job_time(sequenced_paths, max_jerk=None, **limits)
+        robot_trajectory, run_time = timed(trajectory.generate_trajectory, sequenced_paths, max_jerk=max_jerk,
+                                           **limits)
+        speeds, accelerations, jerks = trajectory_limits(robot_trajectory, limits['control_rate'])
+        painting = robot_trajectory.painting[1:]
+        print(f'    jerk-limited: job time {robot_trajectory.job_time:.1f}s (unsmoothed plan {trapezoidal_time:.1f}s, '
+              f'{robot_trajectory.paint_time:.1f}s painting), {robot_trajectory.num_samples} samples in '
+              f'{run_time:.3f}s; peak painting speed {speeds[painting].max():.2f}, travel speed {speeds.max():.2f}, '
+              f'acceleration {accelerations.max():.2f}, jerk {jerks.max():.1f}, deviation '
+              f'{max_polyline_deviation(robot_trajectory.positions, sequenced_paths):.3f}')
+        assert speeds[painting].max() <= limits['paint_speed'] * 1.001
+        assert speeds.max() <= limits['travel_speed'] * 1.001
+        assert accelerations.max() <= limits['max_accel'] * 1.001
+        assert jerks.max() <= max_jerk * 1.001
+
+    # Scaling on a large synthetic job
+    rng = np.random.default_rng(0)
+    path_lengths = rng.integers(2, 200, size=10000)
+    steps = rng.normal(0, 3, size=(int(path_lengths.sum()), 2))
+    coords = np.round(np.cumsum(steps, axis=0)).astype(np.int32)
+    paths = img_processing.PathBuffer.from_paths(coords, np.concatenate([[0], np.cumsum(path_lengths)]))
+    job_time, estimate_time = timed(trajectory.estimate_job_time, paths, **limits)
+    stop_time = trajectory.estimate_job_time(paths, **dict(limits, corner_tolerance=0))
+    # Sampling the whole job would take millions of samples, so the trajectory is generated for its first 100 strokes
+    first_paths = img_processing.PathBuffer.from_paths(coords[:paths.path_offsets[100]], paths.path_offsets[:101])
+    robot_trajectory, run_time = timed(trajectory.generate_trajectory, first_paths, max_jerk=max_jerk, **limits)
+    _, accelerations, jerks = trajectory_limits(robot_trajectory, limits['control_rate'])
+    assert accelerations.max() <= limits['max_accel'] * 1.001 and jerks.max() <= max_jerk * 1.001
+    print(f'  synthetic {paths.num_points} waypoints: job time estimated in {estimate_time:.3f}s ({job_time:.0f}s, '
+          f'{stop_time:.0f}s stopping at every waypoint); '
+          f'{first_paths.num_points} waypoints: jerk-limited trajectory of {robot_trajectory.num_samples} samples in '
+          f'{run_time:.3f}s')
+
+# Compare the s0 -> s5 pipeline at native resolution against images resampled to the painted line width, by runtime
+# and by how far the resampled edges (mapped back to native pixels) are from the native ones, in line widths
+def bench_line_width_resampling():
+    print('s0 line width resampling')
+    target_width = 20.0
+    for image_path, k in bench_images:
+        start = time.perf_counter()
+        img_rgb = img_processing.s0_prepare_img(image_path, border_size=border_size)
+        img_labels, _ = img_processing.s1_reduce_img_rgbs(img_rgb, k=k, fit_mode='unique')
+        edges = img_processing.s3_group_edges(img_processing.s2_generate_edges(img_labels))
+        native_edges, native_paths = img_processing.s45_order_and_simplify(edges, 5, 10, 1.4)
+        native_time = time.perf_counter() - start
+        native_width = img_rgb.shape[1] - 2 * border_size
+        print(f'  {image_path}: native {native_time:.3f}s, {native_paths.num_points} waypoints')
+        for line_width in [0.05, 0.1, 0.2]:
+            for resample_mode in ['nearest', 'area']:
+                start = time.perf_counter()
+                img_rgb, scale = img_processing.s0_prepare_img(image_path, border_size=border_size,
+                                                               target_width=target_width, line_width=line_width,
+                                                               resample_mode=resample_mode, return_scale=True)
+                img_labels, _ = img_processing.s1_reduce_img_rgbs(img_rgb, k=k, fit_mode='unique')
+                edges = img_processing.s3_group_edges(img_processing.s2_generate_edges(img_labels))
+                ordered_edges, simplified_paths = img_processing.s45_order_and_simplify(edges, 5, 10, 1.4)
+                run_time = time.perf_counter() - start
+                native_coords = img_processing.to_native_pixels(ordered_edges.coords, scale, border_size=border_size,
+                                                                resample_mode=resample_mode)
+                mapped_edges = img_processing.PathBuffer(np.clip(native_coords, 0, np.array(img_labels.shape) / scale),
+                                                         ordered_edges.path_offsets, ordered_edges.edge_offsets)
+                native_shape = (int(round(img_labels.shape[0] / scale)) + 1, int(round(img_labels.shape[1] / scale)) + 1)
+                line_pixels = line_width / target_width * native_width
+                extra = mean_distance_to(mapped_edges, native_edges, native_shape) / line_pixels
+                missed = mean_distance_to(native_edges, mapped_edges, native_shape) / line_pixels
+                # s6 writes the waypoints in native pixels, so the painted image keeps its native size
+                with tempfile.TemporaryDirectory() as output_dir:
+                    output_file = os.path.join(output_dir, 'waypoints.txt')
+                    img_processing.s6_generate_output(simplified_paths, output_file, scale=scale,
+                                                      border_size=border_size, resample_mode=resample_mode)
+                    written = np.loadtxt(output_file, delimiter=',', dtype=np.int64, ndmin=2)[:, :2]
+                size_error = np.abs(np.ptp(written, axis=0) - np.ptp(native_paths.coords, axis=0)).max() / line_pixels
+                print(f'    line width {line_width}, {resample_mode}: scale {scale:.3f}, {run_time:.3f}s '
+                      f'({native_time / run_time:.1f}x), {simplified_paths.num_points} waypoints; mean distance to '
+                      f'native edges {extra:.2f} line widths, from native edges {missed:.2f} line widths; written '
+                      f'size off by {size_error:.2f} line widths')
+                assert size_error <= 2
+
+# Compare time to first waypoint of the streaming mode against the batch s4 -> s5 -> s56 -> s6 pipeline
+def bench_streaming():
+    print('streaming mode: time to first waypoint')
+    with tempfile.TemporaryDirectory() as output_dir:
+        output_file = os.path.join(output_dir, 'image_waypoints.txt')
+        for image_path, k in bench_images:
+            img_rgb = img_processing.s0_prepare_img(image_path, border_size=border_size)
+            img_labels, _ = img_processing.s1_reduce_img_rgbs(img_rgb, k=k, fit_mode='unique')
+            for scale in [1, 3]:
+                scaled_labels = cv2.resize(img_labels, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+                edges = img_processing.s3_group_edges(img_processing.s2_generate_edges(scaled_labels))
+                start = time.perf_counter()
+                _, simplified_paths = img_processing.s45_order_and_simplify(edges, 5, 10, 1.4)
+                sequenced_paths, travel = img_processing.s56_sequence_strokes(simplified_paths)
+                img_processing.s6_generate_output(sequenced_paths, output_file, close_paths=False)
+                batch_time = time.perf_counter() - start
+                stats = img_processing.s6_stream_output(img_processing.s45_stream_strokes(edges, 5, 10, 1.4),
+                                                        output_file)
+                print(f'  {image_path} x{scale}: batch first waypoint after {batch_time:.3f}s; streaming first '
+                      f'waypoint after {stats["first_waypoint_time"]:.3f}s, last after '
+                      f'{stats["last_waypoint_time"]:.3f}s, {stats["num_waypoints"]} waypoints')
+
+# Measure throughput and acknowledgement latency of streaming waypoints to the stand-in robot, and check that a job
+# interrupted by a dropped link resumes without losing or repeating waypoints
+def bench_robot_link():
+    print('robot link')
+    rng = np.random.default_rng(0)
+    num_waypoints = 100000
+    coords = rng.integers(0, 4000, size=(num_waypoints, 2)).astype(np.int32)
+    toggles = rng.integers(0, 2, size=num_waypoints).astype(np.uint8)
+    for window in [32, 256]:
+        robot = robot_link.StandInRobot(buffer_size=window)
+        connection = robot_link.connect_tcp(robot.start_tcp())
+        stats = robot_link.send_waypoints(connection, coords, toggles, window=window)
+        connection.close()
+        robot.stop()
+        print(f'  TCP, window {window}: {stats["throughput"]:.0f} waypoints/s, round trip mean '
+              f'{stats["mean_round_trip"] * 1000:.2f}ms, p95 {stats["p95_round_trip"] * 1000:.2f}ms, '
+              f'max buffered {robot.max_buffered}/{window}')
+
+    # Byte pipe to a robot painting at 5000 waypoints per second with a 64-waypoint buffer
+    robot_read, sender_write = os.pipe()
+    sender_read, robot_write = os.pipe()
+    robot = robot_link.StandInRobot(buffer_size=64, paint_rate=5000)
+    robot_thread = threading.Thread(target=robot.serve_link, args=(robot_link.FdLink(robot_read, robot_write),))
+    robot_thread.start()
+    link = robot_link.FdLink(sender_read, sender_write)
+    stats = robot_link.send_waypoints(link, coords[:10000], toggles[:10000], window=64, frame_size=16)
+    link.close()
+    robot_thread.join()
+    print(f'  pipe, robot painting 5000/s: {stats["throughput"]:.0f} waypoints/s, round trip mean '
+          f'{stats["mean_round_trip"] * 1000:.2f}ms, max buffered {robot.max_buffered}/64, '
+          f'overflowed {robot.overflowed}')
+
+    # Drop the link partway and resume from the checkpoint
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        checkpoint_file = os.path.join(checkpoint_dir, 'checkpoint.json')
+        robot = robot_link.StandInRobot(buffer_size=256, drop_after=num_waypoints // 3)
+        address = robot.start_tcp()
+        for attempt in range(2):
+            connection = robot_link.connect_tcp(address)
+            try:
+                stats = robot_link.send_waypoints(connection, coords, toggles, checkpoint_file=checkpoint_file)
+            except ConnectionError:
+                with open(checkpoint_file) as file:
+                    print(f'  link dropped, {json.load(file)["acked"]} waypoints checkpointed')
+            finally:
+                connection.close()
+        robot.stop()
+        painted = next(iter(robot.painted.values()))
+        painted = np.array(painted, dtype=robot_link.waypoint_dtype)
+        matches = np.array_equal(np.stack([painted['y'], painted['x']], axis=1), coords) and \
+            np.array_equal(painted['toggle'], toggles)
+        print(f'  resumed from waypoint {stats["resumed_from"]}, painted {len(painted)}/{num_waypoints} waypoints '
+              f'exactly once in order: {matches}')
+
+    # Drop the link and restart the robot: only the waypoints painted after the last acknowledgement are repainted
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        checkpoint_file = os.path.join(checkpoint_dir, 'checkpoint.json')
+        robot = robot_link.StandInRobot(buffer_size=256, drop_after=1500)
+        address = robot.start_tcp()
+        for attempt in range(2):
+            connection = robot_link.connect_tcp(address)
+            try:
+                robot_link.send_waypoints(connection, coords[:5000], toggles[:5000], checkpoint_file=checkpoint_file)
+            except ConnectionError:
+                with open(checkpoint_file) as file:
+                    checkpointed = json.load(file)['acked']
+                robot.progress.clear()
+            finally:
+                connection.close()
+        robot.stop()
+        num_painted = len(next(iter(robot.painted.values())))
+        print(f'  link dropped after 1500 waypoints painted, {checkpointed} checkpointed; robot restarted, painted '
+              f'{num_painted} waypoints for a 5000-waypoint job')
+        assert num_painted - 5000 == 1500 - checkpointed < robot.ack_every
+
+    # A slow robot acknowledging rarely keeps the link alive with heartbeats
+    robot = robot_link.StandInRobot(buffer_size=64, paint_rate=2, ack_every=32, heartbeat=0.25)
+    connection = robot_link.connect_tcp(robot.start_tcp())
+    stats = robot_link.send_waypoints(connection, coords[:8], toggles[:8], window=64, timeout=1.0)
+    connection.close()
+    robot.stop()
+    print(f'  robot painting 2/s, acknowledging every 32: {stats["total"]} waypoints in {stats["elapsed"]:.1f}s with a '
+          f'1s timeout')
+
+    # Resume from a checkpoint ahead of a robot that has lost track of the job (e.g. after a restart)
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        checkpoint_file = os.path.join(checkpoint_dir, 'checkpoint.json')
+        key = robot_link.job_key(robot_link.pack_waypoints(coords[:1000], toggles[:1000]))
+        robot_link.save_checkpoint(checkpoint_file, key, 500)
+        robot = robot_link.StandInRobot(buffer_size=64)
+        connection = robot_link.connect_tcp(robot.start_tcp())
+        stats = robot_link.send_waypoints(connection, coords[:1000], toggles[:1000], window=64,
+                                          checkpoint_file=checkpoint_file, timeout=5.0)
+        connection.close()
+        robot.stop()
+        painted = robot.painted_waypoints(key)
+        matches = np.array_equal(np.stack([painted['y'], painted['x']], axis=1), coords[500:1000]) and \
+            np.array_equal(painted['toggle'], toggles[500:1000])
+        print(f'  fresh robot, checkpoint at 500: resumed from waypoint {stats["resumed_from"]}, painted '
+              f'{len(painted)} waypoints, the remaining ones in order: {matches}')
+
+def bench_job_index():
+    print('Perceptual hash job index')
+    with tempfile.TemporaryDirectory() as index_dir:
+        job_index = JobIndex(index_dir=index_dir)
+        for image_path, k in bench_images:
+            img_rgb = img_processing.s0_prepare_img(image_path, border_size=border_size)
+            job_index.add(img_rgb, {'k': k}, np.zeros((k, 3), dtype=int), img_processing.PathBuffer.from_edges([]))
+        for image_path, _ in bench_images:
+            img_rgb = img_processing.s0_prepare_img(image_path, border_size=border_size)
+            height, width = img_rgb.shape[:2]
+            resized = cv2.resize(img_rgb, (width * 2 // 3, height * 2 // 3), interpolation=cv2.INTER_AREA)
+            recompressed = cv2.imdecode(cv2.imencode('.jpg', img_rgb, [cv2.IMWRITE_JPEG_QUALITY, 70])[1], 1)
+            flipped = img_rgb[::-1]
+            for name, variant in [('resized', resized), ('jpeg', recompressed), ('flipped', flipped)]:
+                job_id, distance = job_index.find(variant)
+                print(f'  {image_path} {name}: matched job {job_id} (distance {distance})')
+
+        # Lookup time with tens of thousands of stored jobs
+        rng = np.random.default_rng(0)
+        for num_jobs in [1000, 10000, 50000]:
+            job_index.hashes = rng.integers(0, 2 ** 63, size=num_jobs, dtype=np.int64).astype(np.uint64)
+            job_index.log_aspects = np.zeros(num_jobs)
+            _, run_time = timed(job_index.find, img_rgb)
+            print(f'  {num_jobs} jobs: lookup {run_time * 1000:.2f}ms')
+
+benchmarks = {
+    's1_assignment': bench_s1_assignment,
+    's1_fit_modes': bench_s1_fit_modes,
+    's2_edges': bench_s2_edges,
+    'path_buffer': bench_path_buffer,
+    's4_scaling': bench_s4_scaling,
+    's4_engines': bench_s4_engines,
+    's45_workers': bench_s45_workers,
+    'contour_mode': bench_contour_mode,
+    'boundary_graph': bench_boundary_graph,
+    'sequencing': bench_sequencing,
+    'job_index': bench_job_index,
+    'rdp': bench_rdp,
+    'waypoint_budget': bench_waypoint_budget,
+    'curve_fitting': bench_curve_fitting,
+    'waypoint_file': bench_waypoint_file,
+    'waypoint_loader': bench_waypoint_loader,
+    'streaming': bench_streaming,
+    'robot_link': bench_robot_link,
+    'trajectory': bench_trajectory,
+    'line_width_resampling': bench_line_width_resampling,
+}
+
+if __name__ == "__main__":
+    # Run the benchmarks named on the command line, or all of them
+    for name in (sys.argv[1:] or benchmarks):
+        benchmarks[name]()
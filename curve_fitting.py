@@ -0,0 +1,216 @@
+import numpy as np
+from path_buffer import PathBuffer
+
+# Compression of paths into line and circular arc primitives.
+# Each path is walked from its first point, and at every point the longest run of following points that one line or
+# one arc passes within tolerance of (points and the segments between them) is replaced by that primitive. Arcs are
+# taken through the run's first, middle and last points, so consecutive primitives always join exactly at path points.
+# Arc directions are signs in the plane of the first and second coordinates: 1 if the angle increases from start to
+# end, -1 if it decreases.
+
+line_kind = 0
+arc_kind = 1
+
+# Compact container for fitted paths, laid out like a PathBuffer: primitive_offsets[j]:primitive_offsets[j + 1] are the
+# primitives of path j, which starts at start_points[j]. Each primitive ends at its end point; arcs also have a center
+# and a direction (centers are NaN and directions 0 for lines).
+class CurveBuffer:
+    def __init__(self, start_points, primitive_offsets, kinds, end_points, centers, directions):
+        self.start_points = np.asarray(start_points, dtype=np.int32).reshape(-1, 2)
+        self.primitive_offsets = np.asarray(primitive_offsets, dtype=np.int64)
+        self.kinds = np.asarray(kinds, dtype=np.int8)
+        self.end_points = np.asarray(end_points, dtype=np.int32).reshape(-1, 2)
+        self.centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        self.directions = np.asarray(directions, dtype=np.int8)
+
+    @property
+    def num_paths(self):
+        return len(self.start_points)
+
+    @property
+    def num_primitives(self):
+        return len(self.kinds)
+
+    @property
+    def num_arcs(self):
+        return int((self.kinds == arc_kind).sum())
+
+    # Sample every path back into a polyline, with arcs split into chords deviating at most max_chord_error from them
+    # Output: PathBuffer of single-path edges
+    def to_paths(self, max_chord_error = 0.25):
+        paths = []
+        for j in range(self.num_paths):
+            points = [self.start_points[j][None, :].astype(np.float64)]
+            previous = self.start_points[j].astype(np.float64)
+            for p in range(self.primitive_offsets[j], self.primitive_offsets[j + 1]):
+                end = self.end_points[p].astype(np.float64)
+                if self.kinds[p] == arc_kind:
+                    points.append(sample_arc(previous, end, self.centers[p], self.directions[p], max_chord_error))
+                else:
+                    points.append(end[None, :])
+                previous = end
+            paths.append(np.round(np.concatenate(points)).astype(np.int32))
+        path_lengths = [len(path) for path in paths]
+        coords = np.concatenate(paths) if paths else np.empty((0, 2), dtype=np.int32)
+        return PathBuffer.from_paths(coords, np.concatenate([[0], np.cumsum(path_lengths, dtype=np.int64)]))
+
+    def __repr__(self):
+        return f'CurveBuffer(paths={self.num_paths}, primitives={self.num_primitives}, arcs={self.num_arcs})'
+
+# Helper function: Angle of each point around a center, measured from a start angle in the given direction
+# Output: Array of angles in [0, 2 * pi)
+def swept_angles(points, center, start_angle, direction):
+    angles = np.arctan2(points[:, 1] - center[1], points[:, 0] - center[0])
+    return np.mod((angles - start_angle) * direction, 2 * np.pi)
+
+# Helper function: Points along an arc after its start point, up to and including its end point
+# Input: Arrays of start, end and center coordinates, int (direction), float
+# Output: Array of coordinates of shape (n, 2)
+def sample_arc(start, end, center, direction, max_chord_error):
+    radius = np.hypot(*(start - center))
+    start_angle = np.arctan2(start[1] - center[1], start[0] - center[0])
+    sweep = swept_angles(end[None, :], center, start_angle, direction)[0]
+    # A chord spanning angle a deviates from its arc by radius * (1 - cos(a / 2))
+    max_step = 2 * np.arccos(max(1 - max_chord_error / radius, -1.0)) if radius > 0 else np.pi
+    num_steps = max(int(np.ceil(sweep / max(max_step, 1e-6))), 1)
+    angles = start_angle + direction * sweep * np.arange(1, num_steps + 1) / num_steps
+    points = center + radius * np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    points[-1] = end
+    return points
+
+# Helper function: Whether a line from points[0] to points[-1] passes within tolerance of all the points
+def line_fits(points, tolerance):
+    start, end = points[0], points[-1]
+    direction = end - start
+    length_squared = float(direction @ direction)
+    if length_squared == 0:
+        return False
+    t = np.clip(((points - start) @ direction) / length_squared, 0, 1)
+    return bool(np.all(np.hypot(*(points - start - t[:, None] * direction).T) <= tolerance))
+
+# Helper function: The arc through points[0], the middle point and points[-1], if it passes within tolerance of all
+# the points and of the segments between them, in order, and sweeps less than a full turn
+# Output: Array of center coordinates, int (direction), or None, None
+def fit_arc(points, tolerance):
+    start, middle, end = points[0], points[len(points) // 2], points[-1]
+    # Circumcenter of the three points
+    b, c = middle - start, end - start
+    cross = b[0] * c[1] - b[1] * c[0]
+    if abs(cross) < 1e-9:
+        return None, None
+    b_squared, c_squared = b @ b, c @ c
+    center = start + np.array([c[1] * b_squared - b[1] * c_squared, b[0] * c_squared - c[0] * b_squared]) / (2 * cross)
+    radius = np.hypot(*(start - center))
+    if np.any(np.abs(np.hypot(*(points - center).T) - radius) > tolerance):
+        return None, None
+    direction = 1 if cross > 0 else -1
+    start_angle = np.arctan2(start[1] - center[1], start[0] - center[0])
+    angles = swept_angles(points[1:], center, start_angle, direction)
+    # The points must advance around the arc in order
+    steps = np.diff(np.concatenate([[0], angles]))
+    if np.any(steps < -1e-9) or np.any(angles[:-1] == 0):
+        return None, None
+    # The arc between consecutive points must also stay within tolerance of the segment joining them
+    if np.any(radius * (1 - np.cos(steps / 2)) > tolerance):
+        return None, None
+    return center, direction
+
+# Helper function: Longest run length from 2 up to max_length for which fits(run_length) holds, found by doubling and
+# then bisecting (assumes that fitting runs shorten rather than lengthen a run)
+def longest_fit(fits, max_length, min_length):
+    if max_length < min_length or not fits(min_length):
+        return 0
+    good, bad = min_length, None
+    while bad is None:
+        candidate = min(good * 2, max_length)
+        if candidate == good:
+            return good
+        if fits(candidate):
+            good = candidate
+        else:
+            bad = candidate
+    while bad - good > 1:
+        candidate = (good + bad) // 2
+        if fits(candidate):
+            good = candidate
+        else:
+            bad = candidate
+    return good
+
+# Input: PathBuffer, float (largest distance allowed from a path point to its primitive)
+# Output: CurveBuffer with one path per non-empty input path
+def fit_curves(paths, tolerance = 1.0):
+    start_points, primitive_offsets = [], [0]
+    kinds, end_points, centers, directions = [], [], [], []
+    for path in paths.paths():
+        if len(path) == 0:
+            continue
+        points = path.astype(np.float64)
+        start_points.append(path[0])
+        i = 0
+        while i < len(points) - 1:
+            remaining = len(points) - i
+            # Number of points covered by the longest fitting line and the longest fitting arc starting at point i
+            line_length = longest_fit(lambda n: line_fits(points[i:i + n], tolerance), remaining, 2)
+            arc_length = longest_fit(lambda n: fit_arc(points[i:i + n], tolerance)[0] is not None, remaining, 4)
+            if arc_length > max(line_length, 2):
+                center, direction = fit_arc(points[i:i + arc_length], tolerance)
+                kinds.append(arc_kind)
+                centers.append(center)
+                directions.append(direction)
+                i += arc_length - 1
+            else:
+                kinds.append(line_kind)
+                centers.append((np.nan, np.nan))
+                directions.append(0)
+                i += max(line_length, 2) - 1
+            end_points.append(path[i])
+        primitive_offsets.append(len(kinds))
+    return CurveBuffer(np.array(start_points).reshape(-1, 2), primitive_offsets, kinds,
+                       np.array(end_points).reshape(-1, 2), np.array(centers).reshape(-1, 2), directions)
+
+# Input: CurveBuffer, string
+# Writes one command per line: "M a, b" moves (pen up) to a path's start, "L a, b" paints a line to (a, b) and
+# "A a, b, center_a, center_b, direction" paints an arc to (a, b). Coordinates are in the same order as s6's waypoints
+def write_curves(curves, output_file):
+    lines = ['# curves v1\n']
+    for j in range(curves.num_paths):
+        lines.append('M {}, {}\n'.format(*curves.start_points[j].tolist()))
+        for p in range(curves.primitive_offsets[j], curves.primitive_offsets[j + 1]):
+            a, b = curves.end_points[p].tolist()
+            if curves.kinds[p] == arc_kind:
+                center_a, center_b = curves.centers[p].tolist()
+                lines.append(f'A {a}, {b}, {center_a:.3f}, {center_b:.3f}, {curves.directions[p]}\n')
+            else:
+                lines.append(f'L {a}, {b}\n')
+    with open(output_file, 'w') as file:
+        file.writelines(lines)
+
+# Input: String (file written by write_curves)
+# Output: CurveBuffer
+def read_curves(input_file):
+    start_points, primitive_offsets = [], []
+    kinds, end_points, centers, directions = [], [], [], []
+    with open(input_file) as file:
+        for line in file:
+            if not line.strip() or line.startswith('#'):
+                continue
+            command, values = line[0], [float(value) for value in line[1:].split(', ')]
+            if command == 'M':
+                start_points.append(values)
+                primitive_offsets.append(len(kinds))
+            elif command == 'L':
+                kinds.append(line_kind)
+                end_points.append(values)
+                centers.append((np.nan, np.nan))
+                directions.append(0)
+            elif command == 'A':
+                kinds.append(arc_kind)
+                end_points.append(values[:2])
+                centers.append(values[2:4])
+                directions.append(int(values[4]))
+            else:
+                raise ValueError(f'Invalid curve command: {command}')
+    primitive_offsets.append(len(kinds))
+    return CurveBuffer(np.array(start_points).reshape(-1, 2), primitive_offsets, kinds,
+                       np.array(end_points).reshape(-1, 2), np.array(centers).reshape(-1, 2), directions)
@@ -1,10 +1,16 @@
 import customtkinter
+import os
 import tkinter as tk
 from tkinter import filedialog
 from tkintermapview import TkinterMapView
 from PIL import Image, ImageTk
 import geocoder
+import numpy as np
 import image_processing as img_processing
+from stage_cache import StageCache, run_cached_stages, stage_keys
+from job_index import JobIndex, rescale_paths
+import waypoint_file
+import trajectory
 
 customtkinter.set_default_color_theme("blue")
 
@@ -15,15 +21,67 @@ def process_image(uploaded_image_path):
     min_points_per_edge = 50
     max_dist_betw_points = 5
     min_section_size = 10
+    epsilon = 1.4
+    workers = os.cpu_count()
     waypoints_output_filename = 'image_waypoints.txt'
-    img_rgb = img_processing.s0_prepare_img(uploaded_image_path, border_size=border_size, display=False)
-    img_reduced_rgb = img_processing.s1_reduce_img_rgbs(img_rgb, k=k, display=False)
-
-    img_edges = img_processing.s2_generate_edges(img_reduced_rgb, display=False)
-    grouped_edges = img_processing.s3_group_edges(img_edges, edge_threshold=min_points_per_edge)
-    ordered_edges = img_processing.s4_order_edges(grouped_edges, dist_thresh=max_dist_betw_points, section_size_thresh=min_section_size)
-    simplified_paths = img_processing.s5_simplify_path(ordered_edges, epsilon=1.4)
-    img_processing.s6_generate_output(simplified_paths, waypoints_output_filename)
+    waypoints_binary_filename = 'image_waypoints.wpt'
+
+    job_params = {'k': k, 'border_size': border_size, 'min_points_per_edge': min_points_per_edge,
+                  'max_dist_betw_points': max_dist_betw_points, 'min_section_size': min_section_size, 'epsilon': epsilon}
+
+    # Stages s0 to s5 are cached on disk, so only the stages downstream of a changed parameter are recomputed
+    def pipeline_stages(palette):
+        return [
+            ('s0', {'border_size': border_size},
+             lambda image_path: img_processing.s0_prepare_img(image_path, border_size=border_size, display=False)),
+            ('s1', {'k': k, 'fit_mode': 'unique', 'selected_rgbs': None if palette is None else palette.tolist()},
+             lambda img_rgb: img_processing.s1_reduce_img_rgbs(img_rgb, k=k, display=False, fit_mode='unique',
+                                                               selected_rgbs=palette)),
+            ('s2', {},
+             lambda reduced: img_processing.s2_generate_edges(reduced[0], display=False)),
+            ('s3', {'edge_threshold': min_points_per_edge},
+             lambda img_edges: img_processing.s3_group_edges(img_edges, edge_threshold=min_points_per_edge)),
+            # s4 and s5 run together so that a single worker pool orders and simplifies each chunk of edges
+            ('s45', {'dist_thresh': max_dist_betw_points, 'section_size_thresh': min_section_size, 'epsilon': epsilon},
+             lambda grouped_edges: img_processing.s45_order_and_simplify(
+                 grouped_edges, dist_thresh=max_dist_betw_points, section_size_thresh=min_section_size,
+                 epsilon=epsilon, workers=workers)[1]),
+        ]
+
+    cache = StageCache()
+    file_key = StageCache.file_key(uploaded_image_path)
+    stages = pipeline_stages(None)
+    simplified_paths = None
+    job_index = JobIndex()
+    new_job = not cache.contains(stage_keys(file_key, stages)[1])
+    if new_job:
+        # The exact image has not been processed before, so a previous job on a near-identical image (e.g. a resized
+        # or re-exported copy) provides its waypoints, rescaled, if it used the same parameters, or otherwise its palette
+        img_rgb, _ = run_cached_stages(cache, file_key, uploaded_image_path, stages[:1])
+        job_id, distance = job_index.find(img_rgb)
+        job = job_index.load(job_id) if job_id is not None else None
+        if job is not None and job['params'] == job_params:
+            print(f'Reusing the waypoints of job {job_id} (hash distance {distance})')
+            simplified_paths = rescale_paths(job['simplified_paths'], job['shape'], img_rgb.shape)
+            new_job = False
+        elif job is not None and len(job['selected_rgbs']) == k:
+            print(f'Reusing the palette of job {job_id} (hash distance {distance})')
+            stages = pipeline_stages(job['selected_rgbs'])
+
+    if simplified_paths is None:
+        simplified_paths, kept = run_cached_stages(cache, file_key, uploaded_image_path, stages, keep=('s0', 's1'))
+        print(cache.report())
+        if new_job:
+            job_index.add(kept['s0'], job_params, kept['s1'][1], simplified_paths)
+
+    sequenced_paths, travel = img_processing.s56_sequence_strokes(simplified_paths, start_point=(0, 0))
+    img_processing.s6_generate_output(sequenced_paths, waypoints_binary_filename, close_paths=False,
+                                      output_format='binary')
+    # Text export of the same waypoints, for the loader below and older consumers
+    img_processing.s6_generate_output(sequenced_paths, waypoints_output_filename, close_paths=False)
+    # Job time from the motion plan alone; the sampled trajectory is only needed by the robot's controller
+    job_time = trajectory.estimate_job_time(sequenced_paths, start_point=(0, 0), max_jerk=20.0)
+    print(f'Estimated job time: {job_time:.1f}s')
 
 
 class RobotPainterGUI(customtkinter.CTk):
@@ -40,7 +98,8 @@ class RobotPainterGUI(customtkinter.CTk):
         self.paint_image = None
         self.start_location_marker = None
         self.start_location = None  # Stores the chosen starting lat/lon
-        self.cartesian_points = []  # Stores the (x, y) coordinates
+        self.cartesian_points = np.empty((0, 2))  # Stores the (x, y) coordinates
+        self.paint_toggles = None  # Stores the painting toggle of each point (None for path files)
         self.path_coordinates = []  # Stores the lat/lon coordinates
         self.marker_list = []
 
@@ -124,21 +183,14 @@ class RobotPainterGUI(customtkinter.CTk):
             self.map_widget.set_zoom(15)
 
     def load_cartesian_coordinates(self):
-        file_path = filedialog.askopenfilename(filetypes=[("Text files", "*.txt"), ("CSV files", "*.csv")])
+        file_path = filedialog.askopenfilename(filetypes=[("Text files", "*.txt"), ("CSV files", "*.csv"),
+                                                          ("Waypoint files", "*.wpt")])
         if file_path:
-            self.cartesian_points.clear()
-            with open(file_path, "r") as file:
-                for line in file:
-                    x, y = map(float, line.strip().split(" "))
-                    self.cartesian_points.append((x, y))
-            self.plot_coordinates_on_map()
-
-    def load_coordinates_triple(self,file_path):
-        self.cartesian_points.clear()
-        with open(file_path, "r") as file:
-            for line in file:
-                x, y, z = map(float, line.strip().split(", "))
-                self.cartesian_points.append((x, y))
+            self.load_waypoint_file(file_path)
+
+    # Loads a path file (x y), a text waypoint file (x, y, toggle) or a binary waypoint file, detected from its contents
+    def load_waypoint_file(self, file_path):
+        self.cartesian_points, self.paint_toggles = waypoint_file.load_waypoints(file_path)
         self.plot_coordinates_on_map()
 
     def simulate_robot_movement(self):
@@ -171,19 +223,17 @@ class RobotPainterGUI(customtkinter.CTk):
             start_lon = float(self.lon_entry.get() if self.lon_entry.get() else self.start_location)
         else:
             start_lat, start_lon = self.start_location
-        polyline_points = [] 
-
-        for x, y in self.cartesian_points:
-            lat = start_lat - (y * 0.0000015) 
-            lon = start_lon + (x * 0.0000015)  
-            self.path_coordinates.append((lat, lon))
-            polyline_points.append((lat, lon))  
+        lats = start_lat - self.cartesian_points[:, 1] * 0.0000015
+        lons = start_lon + self.cartesian_points[:, 0] * 0.0000015
+        polyline_points = list(zip(lats.tolist(), lons.tolist()))
+        self.path_coordinates.extend(polyline_points)
 
         if polyline_points:
             self.map_widget.set_path(polyline_points, color="blue", width=2)
 
     def clear_path(self):
-        self.cartesian_points.clear()
+        self.cartesian_points = np.empty((0, 2))
+        self.paint_toggles = None
         self.path_coordinates.clear()
         self.map_widget.delete_all_marker()
         self.map_widget.delete_all_path()
@@ -208,7 +258,7 @@ class RobotPainterGUI(customtkinter.CTk):
         if file_path:
             process_image(file_path)
             print(f"Processed image: {file_path}")
-            self.load_coordinates_triple("image_waypoints.txt")
+            self.load_waypoint_file("image_waypoints.wpt")
 
 
     def start(self):
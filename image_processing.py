@@ -2,26 +2,78 @@ import numpy as np
 from PIL import Image
 import cv2
 import matplotlib.pyplot as plt
-from scipy.interpolate import splprep, splev, CubicSpline
 from sklearn.cluster import KMeans
 import random
 from matplotlib.animation import FuncAnimation
 import matplotlib.animation as animation
 import matplotlib.transforms as transforms
-from rdp import rdp
-import copy
-import sys
+import hashlib
+import time
 import os
+import traceback
 from matplotlib.widgets import Button
 from matplotlib.image import imread
-sys.setrecursionlimit(20000)
-
-# Input: Image path
-# Output: RGB Image of shape (h, w, 3)
-
-def s0_prepare_img(img_path, border_size = 2, display = False):
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from path_buffer import PathBuffer
+import curve_fitting
+import simplify
+import skeleton
+import stroke_sequencing
+import trajectory
+import waypoint_file
+from atomic_file import write_atomic
+
+# Helper function: Resample an image to the coarsest resolution that still has pixels_per_line pixels across a painted
+# line (it is never upsampled), since the robot cannot reproduce finer detail
+# Input: RGB image of shape (h, w, 3), floats (physical width of the painted image and painted line width, in the same
+#        units), int, string ('nearest' keeps exact colors, 'area' averages the pixels each output pixel covers)
+# Output: Resampled RGB image, float (scale)
+def resample_to_line_width(img_rgb, target_width, line_width, pixels_per_line = 2, resample_mode = 'nearest'):
+    if resample_mode not in ('nearest', 'area'):
+        raise ValueError(f'Invalid resample mode: {resample_mode}')
+    img_height, img_width, _ = img_rgb.shape
+    scale = min(1.0, target_width / line_width * pixels_per_line / img_width)
+    new_width, new_height = max(int(round(img_width * scale)), 1), max(int(round(img_height * scale)), 1)
+    if scale < 1:
+        interpolation = cv2.INTER_NEAREST if resample_mode == 'nearest' else cv2.INTER_AREA
+        img_rgb = cv2.resize(img_rgb, (new_width, new_height), interpolation=interpolation)
+        # The scale actually applied, after rounding to whole pixels
+        scale = new_width / img_width
+    print(f'Resampled to scale {scale:.3f}: {new_width}x{new_height} from {img_width}x{img_height} '
+          f'({img_width * img_height / (new_width * new_height):.1f}x fewer pixels than native)')
+    return img_rgb, scale
+
+# Helper function: Map coordinates in the pixels of an image resampled by s0_prepare_img back to the pixels of the
+# same image prepared at native resolution (with the same border)
+# Input: Array of y and x coordinates of shape (n, 2), float (scale from s0_prepare_img), int, string (resample mode
+#        given to s0_prepare_img)
+# Output: Array of y and x coordinates of shape (n, 2)
+def to_native_pixels(coords, scale, border_size = 2, resample_mode = 'nearest'):
+    coords = np.asarray(coords).reshape(-1, 2)
+    if scale == 1:
+        return coords
+    # INTER_NEAREST samples native pixel i / scale, INTER_AREA averages around pixel center (i + 0.5) / scale
+    center_offset = 0.5 if resample_mode == 'area' else 0.0
+    return np.round((coords - border_size + center_offset) / scale - center_offset + border_size).astype(np.int32)
+
+# Input: Image path, int, bool, floats (physical width of the painted image and painted line width, in the same units,
+#        or None to keep the native resolution), int, string, bool
+# Output: RGB Image of shape (h, w, 3), and with return_scale the scale it was resampled by (1.0 at native resolution)
+# Given the physical width of the painted image and the painted line width (in the same units), the image is first
+# resampled to the coarsest resolution that resolves features at that width (see resample_to_line_width); the border
+# is added afterwards, so border_size stays in output pixels. Later stages work in the resampled pixels; give the scale
+# to s6_generate_output (or to_native_pixels) to get the waypoints back in native pixels
+
+def s0_prepare_img(img_path, border_size = 2, display = False, target_width = None, line_width = None,
+                   pixels_per_line = 2, resample_mode = 'nearest', return_scale = False):
     img = cv2.imread(img_path)
     img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    scale = 1.0
+    if target_width is not None and line_width is not None:
+        img_rgb, scale = resample_to_line_width(img_rgb, target_width, line_width, pixels_per_line=pixels_per_line,
+                                                resample_mode=resample_mode)
 
     # Obtain image background color (assumed top-left pixel)
     background_color = img_rgb[0, 0].tolist()
@@ -41,73 +93,180 @@ def s0_prepare_img(img_path, border_size = 2, display = False):
         plt.axis('off')
         plt.show()
 
+    if return_scale:
+        return img_with_border, scale
     return img_with_border
 
-# Input: RGB image of shape (h, w, 3)
+# Helper function: Assign every pixel the index of its most similar RGB in a palette
+# Input: Array of pixel RGBs of shape (n, 3), array of palette RGBs of shape (k, 3), int
+# Output: Array of palette indices of shape (n,)
+def assign_nearest_rgbs(pixels, selected_rgbs, chunk_size = 262144):
+    selected_rgbs = np.asarray(selected_rgbs, dtype=np.int32)
+    labels = np.empty(len(pixels), dtype=np.intp)
+    # Process pixels in bounded-size chunks so the (chunk, k, 3) difference array stays small
+    for start in range(0, len(pixels), chunk_size):
+        chunk = pixels[start:start + chunk_size].astype(np.int32)
+        # Squared RGB error is exact in integers and ranks centers the same way as the RMS error
+        rgb_errors = ((chunk[:, None, :] - selected_rgbs[None, :, :]) ** 2).sum(axis=2)
+        # Select RGB with lowest error (ties go to the lowest index, as with np.argmin per pixel)
+        labels[start:start + chunk_size] = np.argmin(rgb_errors, axis=1)
+    return labels
+
+# Helper function: Fit k palette RGBs to a set of pixels using k-means
+# Input: Array of pixel RGBs of shape (n, 3), int, string, int
+# Output: Array of palette RGBs of shape (k, 3)
+# fit_mode 'full' clusters every pixel, 'unique' clusters each distinct RGB once weighted by its pixel
+# count (the same k-means objective, at a cost set by the number of colors rather than the resolution),
+# and 'sample' clusters a fixed-seed random sample of at most sample_size pixels
+def fit_palette(pixels, k, fit_mode = 'full', sample_size = 20000):
+    kmeans = KMeans(n_clusters = k, random_state = 0)
+    if fit_mode == 'full':
+        kmeans.fit(pixels)
+    elif fit_mode == 'unique':
+        # Pack each RGB into a single integer so the unique colors are found with a 1D sort
+        codes = (pixels[:, 0].astype(np.int32) << 16) | (pixels[:, 1].astype(np.int32) << 8) | pixels[:, 2]
+        unique_codes, counts = np.unique(codes, return_counts=True)
+        unique_rgbs = np.stack([unique_codes >> 16, (unique_codes >> 8) & 255, unique_codes & 255], axis=1)
+        kmeans.fit(unique_rgbs, sample_weight=counts)
+    elif fit_mode == 'sample':
+        if len(pixels) > sample_size:
+            rng = np.random.default_rng(0)
+            pixels = pixels[rng.choice(len(pixels), size=sample_size, replace=False)]
+        kmeans.fit(pixels)
+    else:
+        raise ValueError(f'Invalid fit mode: {fit_mode}')
+    return np.round(kmeans.cluster_centers_).astype(int)
+
+# Helper function: Convert RGBs to CIE Lab so that euclidean distance approximates perceived color difference
+# Input: Array of RGBs of shape (n, 3) with values in [0, 255]
+# Output: Array of Lab values of shape (n, 3)
+def rgbs_to_lab(rgbs):
+    rgbs = np.asarray(rgbs, dtype=np.float32).reshape(-1, 1, 3) / 255
+    return cv2.cvtColor(rgbs, cv2.COLOR_RGB2Lab).reshape(-1, 3)
+
+# Helper function: Build a lookup table mapping every quantized RGB to its perceptually closest paint color
+# Input: Array of paint RGBs of shape (m, 3), int (bits kept per RGB channel)
+# Output: Array of paint indices of shape (2 ** lut_bits, 2 ** lut_bits, 2 ** lut_bits)
+def build_palette_lut(paint_rgbs, lut_bits = 6):
+    levels = 2 ** lut_bits
+    bin_size = 256 // levels
+    # Represent each LUT cell by the RGB at the center of the range of values it covers
+    centers = np.arange(levels) * bin_size + (bin_size - 1) / 2
+    cell_rgbs = np.stack(np.meshgrid(centers, centers, centers, indexing='ij'), axis=-1).reshape(-1, 3)
+    cell_labs = rgbs_to_lab(cell_rgbs)
+    paint_labs = rgbs_to_lab(paint_rgbs)
+    lut = np.empty(len(cell_labs), dtype=np.uint8)
+    chunk_size = 65536
+    for start in range(0, len(cell_labs), chunk_size):
+        chunk = cell_labs[start:start + chunk_size]
+        lab_errors = ((chunk[:, None, :] - paint_labs[None, :, :]) ** 2).sum(axis=2)
+        lut[start:start + chunk_size] = np.argmin(lab_errors, axis=1)
+    return lut.reshape(levels, levels, levels)
+
+# Helper function: Load the lookup table for a paint palette from the on-disk cache, building it on a miss
+# Input: Array of paint RGBs of shape (m, 3), int, string (cache directory)
+# Output: Array of paint indices of shape (2 ** lut_bits, 2 ** lut_bits, 2 ** lut_bits)
+def load_palette_lut(paint_rgbs, lut_bits = 6, lut_cache_dir = 'palette_luts'):
+    paint_rgbs = np.asarray(paint_rgbs, dtype=np.uint8).reshape(-1, 3)
+    if not 0 < len(paint_rgbs) <= 256:
+        raise ValueError('Invalid number of paint colors')
+    # Cache files are named by a hash of the palette and quantization so each paint set gets its own table
+    palette_hash = hashlib.sha1(paint_rgbs.tobytes() + bytes([lut_bits])).hexdigest()[:16]
+    lut_path = os.path.join(lut_cache_dir, f'lut_{palette_hash}.npy')
+    if os.path.exists(lut_path):
+        return np.load(lut_path)
+    lut = build_palette_lut(paint_rgbs, lut_bits=lut_bits)
+    os.makedirs(lut_cache_dir, exist_ok=True)
+    write_atomic(lut_path, lambda file: np.save(file, lut))
+    return lut
+
+# Helper function: Rebuild the RGB image represented by a label image, for display
+# Input: Label image of shape (h, w), array of palette RGBs of shape (k, 3)
 # Output: RGB image of shape (h, w, 3)
+def labels_to_rgb(img_labels, selected_rgbs):
+    return np.asarray(selected_rgbs, dtype=np.uint8)[img_labels]
 
-def s1_reduce_img_rgbs(img_rgb, k = 4, display = False):
+# Input: RGB image of shape (h, w, 3)
+# Output: Label image of shape (h, w) (uint8 palette index per pixel), array of palette RGBs of shape (k, 3)
+# If paint_rgbs is given, pixels are mapped to the closest of those paint colors (in Lab) through a
+# cached lookup table instead of to a palette discovered with k-means. If selected_rgbs is given, k-means is skipped
+# and pixels are assigned to those RGBs
+
+def s1_reduce_img_rgbs(img_rgb, k = 4, display = False, fit_mode = 'full',
+                       sample_size = 20000, paint_rgbs = None, lut_bits = 6, lut_cache_dir = 'palette_luts',
+                       selected_rgbs = None):
     # Reshape input image for RGB processing
     img_height, img_width, _ = img_rgb.shape
     pixels = img_rgb.reshape(img_height * img_width, 3)
+    # Labels are stored as uint8, which bounds the palette size
+    palette_rgbs = paint_rgbs if paint_rgbs is not None else selected_rgbs
+    if (k if palette_rgbs is None else len(palette_rgbs)) > 256:
+        raise ValueError('Invalid number of palette colors')
+
+    if paint_rgbs is not None:
+        # Map all image pixels to the available paint colors with a single lookup table index
+        selected_rgbs = np.asarray(paint_rgbs, dtype=int).reshape(-1, 3)
+        lut = load_palette_lut(paint_rgbs, lut_bits=lut_bits, lut_cache_dir=lut_cache_dir)
+        shift = 8 - lut_bits
+        img_labels = lut[img_rgb[:, :, 0] >> shift, img_rgb[:, :, 1] >> shift, img_rgb[:, :, 2] >> shift]
+    else:
+        # Obtain center RGB values of k clusters using k-means, unless a palette is given (e.g. reused from a
+        # previous job on a similar image)
+        if selected_rgbs is None:
+            selected_rgbs = fit_palette(pixels, k, fit_mode=fit_mode, sample_size=sample_size)
+        selected_rgbs = np.asarray(selected_rgbs).reshape(-1, 3)
 
-    # Obtain center RGB values of k clusters using k-means
-    kmeans = KMeans(n_clusters = k, random_state = 0)
-    kmeans.fit(pixels)
-    selected_rgbs = np.round(kmeans.cluster_centers_).astype(int)
-
-    # Initialize output image
-    img_reduced_rgb = np.zeros_like(img_rgb)
-
-    # Iterate through all image pixels and assign new output image pixel RGBs as the most similar K-means center
-    for y in range(img_height):
-        for x in range(img_width):
-            rgb_errors = np.zeros((k))
-            pixel_rgb = img_rgb[y, x, :]
-            # Compute the error between the image pixel RGB and each k-means cluster center
-            for i in range((k)):
-                rgb_errors[i] = np.sqrt(np.mean((selected_rgbs[i] - pixel_rgb) ** 2))
-            # Select RGB with lowest error and assign to the correpsonding output image pixel
-            rgb_index = np.argmin(rgb_errors)
-            img_reduced_rgb[y, x] = selected_rgbs[rgb_index]
+        # Assign all image pixels the most similar K-means center at once
+        labels = assign_nearest_rgbs(pixels, selected_rgbs)
+        img_labels = labels.astype(np.uint8).reshape(img_height, img_width)
 
     if display == True:
         plt.imshow([selected_rgbs])
         plt.show()
-        plt.imshow(img_reduced_rgb)
+        plt.imshow(labels_to_rgb(img_labels, selected_rgbs))
         plt.show()
 
-    return img_reduced_rgb
+    return img_labels, selected_rgbs
 
-# Input: RGB image
+# Input: Label image of shape (h, w)
 # Output: Binary image of shape (h, w, 1)
+# connectivity None uses the 2x2 forward neighborhood (the pixel itself, right, below and below-right);
+# 4 or 8 compares each pixel with its 4 or 8 surrounding pixels. With thin, only the pixel on the lower-label
+# side of each color change is marked, giving a single-pixel-wide boundary; the forward neighborhood is then also
+# compared backward, so changes toward a lower label to the right or below are marked too
 
-def s2_generate_edges(img_rgb, display = False):
+def s2_generate_edges(img_labels, display = False, connectivity = None, thin = False):
     # Initialize output edges image
-    img_height, img_width, _ = img_rgb.shape
-    img_edges = np.zeros_like(img_rgb[:, :, 0])
-
-    # Establish pixel range for 'neighbor' processing
-    y_range = [0, 1]
-    x_range = [0, 1]
-
-    # Iterate over all image pixels
-    for y in range(img_height):
-        for x in range(img_width):
-            # Initialize a set to track all discovered RGBs among itself and its neighbors
-            tracked_rgbs = set()
-            # Iterate over relevant pixels (itself and its neighbors)
-            for y_offset in y_range:
-                for x_offset in x_range:
-                    y_neighbor, x_neighbor = y + y_offset, x + x_offset
-                    # Ensure pixel is within image dimesnion range
-                    if 0 <= y_neighbor < img_height and 0 <= x_neighbor < img_width:
-                        # Add discovered RGB to the tracked_rgbs set
-                        neighbor_rgb = tuple(img_rgb[y_neighbor, x_neighbor])
-                        tracked_rgbs.add(neighbor_rgb)
-            # If more than one RGB is discovered within the pixel's range, set pixel as an edge
-            if len(tracked_rgbs) > 1:
-                img_edges[y, x] = 255
+    img_height, img_width = img_labels.shape
+    is_edge = np.zeros((img_height, img_width), dtype=bool)
+
+    # Establish pixel offsets for 'neighbor' processing
+    if connectivity is None:
+        offsets = [(0, 1), (1, 0), (1, 1)]
+    elif connectivity == 4:
+        offsets = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+    elif connectivity == 8:
+        offsets = [(0, 1), (1, 0), (0, -1), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+    else:
+        raise ValueError(f'Invalid connectivity: {connectivity}')
+    if thin and connectivity is None:
+        offsets = offsets + [(-y_offset, -x_offset) for y_offset, x_offset in offsets]
+
+    # Compare the whole image against a copy shifted by each offset (neighbors outside the image are skipped).
+    # A pixel is an edge if any neighbor has a different label, i.e. more than one label is in its range
+    for y_offset, x_offset in offsets:
+        y_pixels = slice(max(-y_offset, 0), img_height - max(y_offset, 0))
+        x_pixels = slice(max(-x_offset, 0), img_width - max(x_offset, 0))
+        y_neighbors = slice(max(y_offset, 0), img_height - max(-y_offset, 0))
+        x_neighbors = slice(max(x_offset, 0), img_width - max(-x_offset, 0))
+        pixel_labels = img_labels[y_pixels, x_pixels]
+        neighbor_labels = img_labels[y_neighbors, x_neighbors]
+        if thin:
+            is_edge[y_pixels, x_pixels] |= pixel_labels < neighbor_labels
+        else:
+            is_edge[y_pixels, x_pixels] |= pixel_labels != neighbor_labels
+
+    img_edges = is_edge.astype(np.uint8) * 255
 
     if display == True:
         plt.imshow(img_edges)
@@ -116,136 +275,598 @@ def s2_generate_edges(img_rgb, display = False):
     return img_edges
 
 # Input: Binary image
-# Output: List of arrays of tuples (List length: number of edges; array length: number of pixels in given edge; tuples: pixel y and x coordinates)
+# Output: PathBuffer (one edge per connected component, each holding a single unordered path of pixel y and x coordinates)
 def s3_group_edges(img_edges, edge_threshold = 50):
-    # Initialize list of edges
-    edges = []
-    # Obtain connected compoennts
-    num_labels, img_labels = cv2.connectedComponents(img_edges)
-    for label in range(1, num_labels):
-        edge_points = np.argwhere(img_labels == label)
-        # Condition on minimum edge length
-        if len(edge_points) >= edge_threshold:
-            # Format and add edges to the output list
-            edge_points_set = {tuple(point) for point in edge_points}
-            edges.append(np.array(list(edge_points_set)))
-    return edges
-
-# Helper function: Identify the closest pixel to a given current pixel
-def closest_point(curr, points):
-    if len(points) == 0:
+    # Obtain connected components along with their pixel counts
+    num_labels, img_labels, stats, _ = cv2.connectedComponentsWithStats(img_edges)
+    edge_sizes = stats[:, cv2.CC_STAT_AREA]
+    # Group the coordinates of all edge pixels by component in a single pass: a stable sort of the
+    # flat pixel indices by label puts each component's pixels in one contiguous block
+    flat_labels = img_labels.ravel()
+    pixel_indices = np.flatnonzero(flat_labels)
+    pixel_indices = pixel_indices[np.argsort(flat_labels[pixel_indices], kind='stable')]
+    # Condition on minimum edge length, dropping the pixels of small components before building the coordinates
+    kept_labels = np.flatnonzero(edge_sizes[1:] >= edge_threshold) + 1
+    pixel_indices = pixel_indices[edge_sizes[flat_labels[pixel_indices]] >= edge_threshold]
+    edge_points = np.stack(np.divmod(pixel_indices, img_labels.shape[1]), axis=1).astype(np.int32)
+    # Each kept component becomes one contiguous block of y and x coordinates in the buffer
+    path_offsets = np.concatenate([[0], np.cumsum(edge_sizes[kept_labels])])
+    return PathBuffer.from_paths(edge_points, path_offsets)
+
+# Helper class: Uniform grid hash over the remaining pixels of an edge, supporting deletion and nearest-pixel
+# queries within a distance threshold. With cells as wide as the threshold, any pixel within range of the
+# current pixel lies in its own cell or one of the eight surrounding cells
+class PixelGrid:
+    def __init__(self, points, cell_size):
+        self.cell_size = max(int(np.ceil(cell_size)), 1)
+        self.cells = {}
+        self.count = 0
+        for point in points:
+            self.add(point)
+
+    def __len__(self):
+        return self.count
+
+    def cell(self, point):
+        return (point[0] // self.cell_size, point[1] // self.cell_size)
+
+    def add(self, point):
+        self.cells.setdefault(self.cell(point), set()).add(point)
+        self.count += 1
+
+    def remove(self, point):
+        cell = self.cell(point)
+        self.cells[cell].remove(point)
+        if not self.cells[cell]:
+            del self.cells[cell]
+        self.count -= 1
+
+    # Remove and return an arbitrary remaining pixel
+    def pop(self):
+        if self.count == 0:
+            raise ValueError('Invalid number of remaining points')
+        cell, cell_points = next(iter(self.cells.items()))
+        point = cell_points.pop()
+        if not cell_points:
+            del self.cells[cell]
+        self.count -= 1
+        return point
+
+# Helper function: Identify the closest remaining pixel to a given current pixel, searching only the
+# grid cells that can hold pixels closer than dist_thresh (ties go to the smallest y and x coordinates)
+def closest_point(curr, remaining, dist_thresh):
+    if len(remaining) == 0:
         raise ValueError('Invalid number of remaining points')
     min_dist = float('inf')
     min_point = None
-    # Iterate through all remaining pixels
-    for i, point in enumerate(points):
-        # Calculate the distance between the current point and the remaining pixels
-        dist = np.linalg.norm(np.array(curr) - np.array(point))
-        # Update pixel if it has the shortest distance among traversed pixels
-        if dist < min_dist:
-            min_dist = dist
-            min_point = point
+    cell_y, cell_x = remaining.cell(curr)
+    reach = int(np.ceil(dist_thresh / remaining.cell_size))
+    # Iterate through the remaining pixels of the surrounding cells
+    for y_cell in range(cell_y - reach, cell_y + reach + 1):
+        for x_cell in range(cell_x - reach, cell_x + reach + 1):
+            for point in remaining.cells.get((y_cell, x_cell), ()):
+                # Calculate the distance between the current point and the remaining pixel
+                dist = ((curr[0] - point[0]) ** 2 + (curr[1] - point[1]) ** 2) ** 0.5
+                # Update pixel if it has the shortest distance among traversed pixels
+                if dist < min_dist or (dist == min_dist and point < min_point):
+                    min_dist = dist
+                    min_point = point
     return min_dist, min_point
 
+# Helper function: Split the remaining pixels of an edge into ordered sections, appending them to all_sections.
+# Sections grow forward from the current pixel and then backward from their first pixel, so they are held in a
+# deque to extend either end in constant time. Runs as a loop, so edge size is not bound by the recursion limit
 def helper(curr, remaining, all_sections, ordered_section, mode, dist_thresh,
            section_size_thresh):
-    # Return if there are no longer any remaining pixels
-    if len(remaining) == 0:
-        all_sections.append(ordered_section)
-        return
-
-    # Obtain the closest remaining pixel to the current pixel
-    min_dist, min_point = closest_point(curr, remaining)
-    # The closest pixel is within the predetermined distance threhold
-    if min_dist < dist_thresh:
-        # Add pixel to end of ordered section when in forward mode
-        if mode == 'forward':
-            ordered_section.append(min_point)
-        # Add pixel to start of ordered section when in backward mode
-        else:
-            ordered_section.insert(0, min_point)
-        # Update remaining pixels and current pixel
-        remaining.remove(min_point)
-        curr = min_point
-        # Call the function again
-        helper(curr, remaining, all_sections, ordered_section, mode, dist_thresh,
-               section_size_thresh)
-    # The closest pixel is beyond the predetermined distance threshold
-    else:
-        # If in forward mode, update to backward mode, update current pixel and call the function again
-        if mode == 'forward':
+    ordered_section = deque(ordered_section)
+    while True:
+        # Return if there are no longer any remaining pixels
+        if len(remaining) == 0:
+            all_sections.append(list(ordered_section))
+            return
+
+        # Obtain the closest remaining pixel to the current pixel
+        min_dist, min_point = closest_point(curr, remaining, dist_thresh)
+        # The closest pixel is within the predetermined distance threhold
+        if min_dist < dist_thresh:
+            # Add pixel to end of ordered section when in forward mode
+            if mode == 'forward':
+                ordered_section.append(min_point)
+            # Add pixel to start of ordered section when in backward mode
+            else:
+                ordered_section.appendleft(min_point)
+            # Update remaining pixels and current pixel
+            remaining.remove(min_point)
+            curr = min_point
+        # The closest pixel is beyond the predetermined distance threshold
+        # If in forward mode, update to backward mode and update current pixel
+        elif mode == 'forward':
             mode = 'backward'
             curr = ordered_section[0]
-            helper(curr, remaining, all_sections, ordered_section, mode, dist_thresh,
-                   section_size_thresh)
         # If in backward mode and section is above minimum length, it is appended to the sections list and a new current pixel is identified
-        elif mode == 'backward':
+        else:
             if len(ordered_section) > section_size_thresh:
-              all_sections.append(ordered_section)
-            ordered_section = []
+                all_sections.append(list(ordered_section))
             curr = remaining.pop()
-            ordered_section.append(curr)
+            ordered_section = deque([curr])
             mode = 'forward'
-            helper(curr, remaining, all_sections, ordered_section, mode, dist_thresh,
-                   section_size_thresh)
-
-# Input: List of arrays of tuples, int, int
-# Output: List of arrays of tuples (List length: number of edges; array length: number of pixels in given edge; tuples: pixel y and x coordinates)
-def s4_order_edges(edges, dist_thresh, section_size_thresh):
-    ordered_edges = []
-    for edge in edges:
-        edge = list(map(tuple, edge))
-        ordered_edge = []
-        ordered_section = []
-        remaining = set(edge)
-        curr = remaining.pop()
-        ordered_section.append(curr)
-        mode = 'forward'
-        all_sections = []
-
-        helper(curr, remaining, all_sections, ordered_section, mode, dist_thresh,
-               section_size_thresh)
-
-        ordered_edges.append(all_sections)
-
-    return ordered_edges
-
-# List of arrays of tuples, int
-# Output: List of arrays of tuples (List length: number of edges; array length: number of pixels in given edge; tuples: pixel y and x coordinates)
-def s5_simplify_path(ordered_edges, epsilon):
-    simplified_paths = []
-    for edge in ordered_edges:
-        edge = edge[0]
-        simplified_edge = rdp(edge, epsilon=epsilon)
-        simplified_paths.append(simplified_edge)
-    return simplified_paths
-
-# Input: List of arrays of tuples, string (output file path)
-def s6_generate_output(simplified_paths, output_file):
-  for i in range(len(simplified_paths)):
-    if simplified_paths[i][-1] != simplified_paths[i][0]:
-      simplified_paths[i].append(simplified_paths[i][0])
-  painting_toggle = 1
-  all_waypoints = []
-  for i, path in enumerate(simplified_paths):
-    for j, coord in enumerate(path):
-      x, y = coord
-      if j == len(path) - 1:
-        painting_toggle = 1
-      all_waypoints.append((x, y, painting_toggle))
-      painting_toggle = 0
-    painting_toggle = 1
 
-  with open(output_file, "w") as file:
-    for waypoint in all_waypoints:
-      file.write(f"{waypoint[0]}, {waypoint[1]}, {waypoint[2]}\n")
+# Helper function: Order the pixels of one edge into sections with the greedy nearest-pixel walk
+# Input: Array of edge pixel y and x coordinates of shape (n, 2), int, int
+# Output: List of sections (lists of pixel y and x coordinate tuples)
+def order_edge_greedy(edge_points, dist_thresh, section_size_thresh):
+    ordered_section = []
+    remaining = PixelGrid(map(tuple, edge_points.tolist()), dist_thresh)
+    curr = remaining.pop()
+    ordered_section.append(curr)
+    mode = 'forward'
+    all_sections = []
+
+    helper(curr, remaining, all_sections, ordered_section, mode, dist_thresh,
+           section_size_thresh)
+    return all_sections
+
+# Helper function: Order the pixels of one edge into sections by thinning it to a skeleton and tracing its strokes
+# Input: Array of edge pixel y and x coordinates of shape (n, 2), int
+# Output: List of sections (lists of pixel y and x coordinate tuples), longest first
+def order_edge_skeleton(edge_points, section_size_thresh):
+    strokes = sorted(skeleton.trace_edge(edge_points), key=len, reverse=True)
+    # Keep strokes above the minimum section length, but always keep the longest one
+    return strokes[:1] + [stroke for stroke in strokes[1:] if len(stroke) > section_size_thresh]
+
+# Helper function: Order the pixels of one edge into sections with the given engine (see s4_order_edges)
+def order_edge(edge_points, dist_thresh, section_size_thresh, engine = 'greedy'):
+    if engine == 'greedy':
+        return order_edge_greedy(edge_points, dist_thresh, section_size_thresh)
+    elif engine == 'skeleton':
+        return order_edge_skeleton(edge_points, section_size_thresh)
+    raise ValueError(f'Invalid ordering engine: {engine}')
+
+# Input: PathBuffer, int, int, string, int
+# Output: PathBuffer (one edge per input edge, each holding its ordered sections of pixel y and x coordinates)
+# engine 'greedy' walks from pixel to nearest pixel (see helper); 'skeleton' thins each edge to a one-pixel-wide
+# skeleton and traces it as a graph of strokes between endpoints and junctions. With more than one worker, edge groups
+# are ordered in a process pool (see parallel_edge_map)
+def s4_order_edges(edges, dist_thresh, section_size_thresh, engine = 'greedy', workers = 1):
+    workers = resolve_workers(workers, edges)
+    if workers > 1:
+        return parallel_edge_map(s4_order_edges, edges, workers, dist_thresh=dist_thresh,
+                                 section_size_thresh=section_size_thresh, engine=engine)
+    # Ordered sections are (at most) the input pixels, so they are written into one buffer of the input size
+    coords = np.empty_like(edges.coords)
+    path_offsets = [0]
+    edge_offsets = [0]
+    for i in range(edges.num_edges):
+        all_sections = order_edge(edges.edge_coords(i), dist_thresh, section_size_thresh, engine=engine)
+        for section in all_sections:
+            start = path_offsets[-1]
+            # Skeleton strokes share their junction pixels, so grow the buffer in the rare case it fills up
+            if start + len(section) > len(coords):
+                coords = np.concatenate([coords, np.empty_like(coords)])
+            coords[start:start + len(section)] = section
+            path_offsets.append(start + len(section))
+        edge_offsets.append(len(path_offsets) - 1)
+
+    return PathBuffer(coords[:path_offsets[-1]], path_offsets, edge_offsets)
+
+# Input: Label image of shape (h, w), int
+# Output: PathBuffer (one edge per contour, each holding a single ordered closed path of pixel y and x coordinates)
+# Contour mode: replaces s2, s3 and s4 for clean flat-color images by tracing the boundary of each color region with
+# cv2.findContours, which returns boundaries already ordered. Each outer boundary is followed by the boundaries of
+# its holes. The background region (the color of the top-left pixel) is skipped, as its outer boundary is the image
+# frame and its holes are the outer boundaries of the regions inside it
+def s234_trace_contours(img_labels, edge_threshold = 50):
+    contour_paths = []
+    background_label = img_labels[0, 0]
+    for label in np.unique(img_labels):
+        if label == background_label:
+            continue
+        mask = (img_labels == label).astype(np.uint8)
+        contours, hierarchy = cv2.findContours(mask, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_NONE)
+        if not contours:
+            continue
+        hierarchy = hierarchy[0]
+        # Outer boundaries have no parent; their holes are linked through the first child and next sibling entries
+        for outer in np.flatnonzero(hierarchy[:, 3] == -1):
+            group = [outer]
+            hole = hierarchy[outer, 2]
+            while hole != -1:
+                group.append(hole)
+                hole = hierarchy[hole, 0]
+            for index in group:
+                # Condition on minimum edge length, converting the x and y contour points to y and x coordinates
+                if len(contours[index]) >= edge_threshold:
+                    contour_paths.append(contours[index].reshape(-1, 2)[:, ::-1])
+    path_lengths = [len(path) for path in contour_paths]
+    coords = np.concatenate(contour_paths) if contour_paths else np.empty((0, 2), dtype=np.int32)
+    return PathBuffer.from_paths(coords, np.concatenate([[0], np.cumsum(path_lengths, dtype=np.int64)]))
+
+# Input: Label image of shape (h, w), int
+# Output: PathBuffer (one edge per stroke, each holding a single ordered path of pixel corner y and x coordinates),
+#         array of the pair of labels separated by each boundary piece of shape (n, 2), array of the index in the
+#         PathBuffer's coordinates at which each piece starts of shape (n,)
+# Boundary graph mode: replaces s2, s3 and s4 by building the planar graph of the 'cracks' between differently
+# labeled neighboring pixels. Graph vertices are pixel corners (corner (y, x) is the top-left corner of pixel (y, x)).
+# Boundaries run between vertices where three or more regions meet, or where the pair of labels changes, so each
+# stretch of boundary between two colors is extracted exactly once, however many regions meet around it. Pieces
+# meeting where only the pair of labels changes are joined into one stroke. Like the connected edges of s3, strokes
+# meeting at junctions form a network, and networks with fewer than edge_threshold cracks in total, such as the
+# slivers left by antialiasing, are dropped whole; boundaries between junctions of a larger network are always kept
+def s234_boundary_graph(img_labels, edge_threshold = 50):
+    img_height, img_width = img_labels.shape
+    corner_width = img_width + 1
+    # Horizontal cracks between vertically neighboring pixels, from corner (y, x) to corner (y, x + 1)
+    h_y, h_x = np.nonzero(img_labels[:-1, :] != img_labels[1:, :])
+    h_y = h_y + 1
+    h_pairs = np.stack([img_labels[h_y - 1, h_x], img_labels[h_y, h_x]], axis=1)
+    # Vertical cracks between horizontally neighboring pixels, from corner (y, x) to corner (y + 1, x)
+    v_y, v_x = np.nonzero(img_labels[:, :-1] != img_labels[:, 1:])
+    v_x = v_x + 1
+    v_pairs = np.stack([img_labels[v_y, v_x - 1], img_labels[v_y, v_x]], axis=1)
+    crack_starts = np.concatenate([h_y * corner_width + h_x, v_y * corner_width + v_x])
+    crack_ends = np.concatenate([h_y * corner_width + h_x + 1, (v_y + 1) * corner_width + v_x])
+    crack_pairs = np.sort(np.concatenate([h_pairs, v_pairs]), axis=1)
+    crack_pair_ids = crack_pairs[:, 0].astype(np.int32) * 256 + crack_pairs[:, 1]
+    num_cracks = len(crack_starts)
+
+    # Cracks incident to each vertex, grouped by vertex with a single sort
+    incident_vertices = np.concatenate([crack_starts, crack_ends])
+    incident_cracks = np.concatenate([np.arange(num_cracks), np.arange(num_cracks)])
+    order = np.argsort(incident_vertices, kind='stable')
+    incident_vertices, incident_cracks = incident_vertices[order], incident_cracks[order]
+    vertices, first_incident, degrees = np.unique(incident_vertices, return_index=True, return_counts=True)
+    vertex_index = dict(zip(vertices.tolist(), range(len(vertices))))
+    incident_cracks = incident_cracks.tolist()
+    first_incident = first_incident.tolist()
+    degrees = degrees.tolist()
+    crack_starts, crack_ends, crack_pair_ids = crack_starts.tolist(), crack_ends.tolist(), crack_pair_ids.tolist()
+
+    def cracks_at(vertex):
+        i = vertex_index[vertex]
+        return incident_cracks[first_incident[i]:first_incident[i] + degrees[i]]
+
+    # A vertex is a node unless exactly two cracks separating the same pair of labels pass through it
+    def is_node(vertex):
+        cracks = cracks_at(vertex)
+        return len(cracks) != 2 or crack_pair_ids[cracks[0]] != crack_pair_ids[cracks[1]]
+
+    visited = [False] * num_cracks
+    boundaries = []
+    boundary_pairs = []
+
+    # Helper function: Follow cracks from a vertex until reaching a node or returning to the start
+    def walk(start, crack):
+        boundary = [start]
+        curr = start
+        while True:
+            visited[crack] = True
+            curr = crack_ends[crack] if crack_starts[crack] == curr else crack_starts[crack]
+            boundary.append(curr)
+            if curr == start or is_node(curr):
+                break
+            crack = next(c for c in cracks_at(curr) if c != crack)
+        boundaries.append(boundary)
+        boundary_pairs.append(crack_pair_ids[crack])
+
+    # Open boundaries between nodes, then closed boundaries that never pass through a node
+    for vertex in vertices.tolist():
+        if is_node(vertex):
+            for crack in cracks_at(vertex):
+                if not visited[crack]:
+                    walk(vertex, crack)
+    for crack in range(num_cracks):
+        if not visited[crack]:
+            walk(crack_starts[crack], crack)
+
+    # Join the pieces meeting at vertices where only the pair of labels changes into one stroke, so that the robot
+    # does not stop wherever the color on one side changes; each piece keeps its own label pair
+    piece_ends = {}
+    for i, boundary in enumerate(boundaries):
+        for end in (boundary[0], boundary[-1]):
+            if len(cracks_at(end)) == 2:
+                piece_ends.setdefault(end, []).append(i)
+    used = [False] * len(boundaries)
+
+    # Helper function: Extend a stroke from the far end of its last piece through pair-change vertices
+    def join(stroke, stroke_pieces, first):
+        i = first
+        while True:
+            used[i] = True
+            piece = boundaries[i] if boundaries[i][0] == stroke[-1] else boundaries[i][::-1]
+            stroke_pieces.append((len(stroke) - 1, boundary_pairs[i]))
+            stroke.extend(piece[1:])
+            i = next((j for j in piece_ends.get(stroke[-1], []) if not used[j]), None)
+            if i is None:
+                return
+
+    # Strokes start at junctions (or the open end of a piece), then the remaining pieces form closed strokes
+    strokes = []
+    for start_at_node in (True, False):
+        for i, boundary in enumerate(boundaries):
+            if used[i]:
+                continue
+            if start_at_node:
+                starts = [end for end in (boundary[0], boundary[-1]) if len(cracks_at(end)) != 2]
+                if not starts:
+                    continue
+                stroke = [starts[0]]
+            else:
+                stroke = [boundary[0]]
+            stroke_pieces = []
+            join(stroke, stroke_pieces, i)
+            strokes.append((stroke, stroke_pieces))
+
+    # Networks of strokes sharing an end vertex (found with union-find) with fewer than edge_threshold cracks in total
+    # are dropped
+    network = list(range(len(strokes)))
+
+    def root(j):
+        while network[j] != j:
+            network[j] = network[network[j]]
+            j = network[j]
+        return j
+
+    stroke_at_end = {}
+    for j, (stroke, _) in enumerate(strokes):
+        for end in (stroke[0], stroke[-1]):
+            network[root(j)] = root(stroke_at_end.setdefault(end, j))
+    network_sizes = {}
+    for j, (stroke, _) in enumerate(strokes):
+        network_sizes[root(j)] = network_sizes.get(root(j), 0) + len(stroke) - 1
+    kept = [(stroke, stroke_pieces) for j, (stroke, stroke_pieces) in enumerate(strokes)
+            if network_sizes[root(j)] >= edge_threshold]
+    path_lengths = [len(stroke) for stroke, _ in kept]
+    corners = np.array([corner for stroke, _ in kept for corner in stroke], dtype=np.int64)
+    coords = np.stack(np.divmod(corners, corner_width), axis=1).astype(np.int32) if len(corners) \
+        else np.empty((0, 2), dtype=np.int32)
+    stroke_offsets = np.concatenate([[0], np.cumsum(path_lengths, dtype=np.int64)])
+    piece_offsets = np.array([stroke_offsets[j] + start for j, (_, stroke_pieces) in enumerate(kept)
+                              for start, _ in stroke_pieces], dtype=np.int64)
+    pair_ids = np.array([pair_id for _, stroke_pieces in kept for _, pair_id in stroke_pieces], dtype=np.int32)
+    boundary_labels = np.stack([pair_ids // 256, pair_ids % 256], axis=1)
+    ordered_edges = PathBuffer.from_paths(coords, stroke_offsets)
+    return ordered_edges, boundary_labels, piece_offsets
+
+# Input: PathBuffer, int, int
+# Output: PathBuffer (one edge per input edge, each holding its simplified sections of pixel y and x coordinates)
+# With max_waypoints, epsilon is ignored and the sections are simplified to at most max_waypoints waypoints in total,
+# removing the least significant points of the whole image first (budget_method 'rdp' or 'visvalingam'). Sections
+# whose ends are within loop_gap are closed first, as s56 closes them, so their closing points count against the
+# budget; pass the loop_gap given to s56, or np.inf when s6 closes every path (close_paths=True)
+def s5_simplify_path(ordered_edges, epsilon, workers = 1, max_waypoints = None, budget_method = 'rdp', loop_gap = 5):
+    if max_waypoints is not None:
+        # The budget is shared by all sections, so they are simplified together rather than split across workers
+        simplified_paths, max_error, num_dropped = simplify.budget_buffer(ordered_edges, max_waypoints,
+                                                                          method=budget_method, loop_gap=loop_gap)
+        print(f'Waypoint budget: {simplified_paths.num_points} of {max_waypoints} waypoints used, '
+              f'worst-case error {max_error:.2f}px, {num_dropped} sections dropped to fit the budget')
+        return simplified_paths
+    workers = resolve_workers(workers, ordered_edges)
+    if workers > 1:
+        return parallel_edge_map(s5_simplify_path, ordered_edges, workers, epsilon=epsilon)
+    # Every section is simplified with RDP in one batched call over the buffer
+    return simplify.rdp_buffer(ordered_edges, epsilon)
+
+# Helper function: Run a stage on a range of edges whose coordinates are held in shared memory (run in a worker)
+# Input: Shared memory name, int (number of coordinates), arrays of path and edge offsets for the range, stage
+#        function and its keyword arguments
+# Output: The stage function's result for the range
+def edge_chunk_task(shm_name, num_coords, path_offsets, edge_offsets, stage_function, stage_kwargs):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    coords = edges = None
+    try:
+        coords = np.ndarray((num_coords, 2), dtype=np.int32, buffer=shm.buf)
+        edges = PathBuffer(coords, path_offsets, edge_offsets)
+        return stage_function(edges, **stage_kwargs)
+    except BaseException as error:
+        # The frames of the traceback hold views of the shared buffer (the stage function's arguments and locals)
+        traceback.clear_frames(error.__traceback__)
+        raise
+    finally:
+        # Drop every view of the shared buffer before detaching from it, whether or not the stage succeeded
+        coords = edges = None
+        shm.close()
+
+# Helper function: Split edges into contiguous ranges holding roughly equal numbers of pixels
+# Input: PathBuffer, int
+# Output: List of (first edge, last edge + 1) ranges
+def split_edge_ranges(edges, num_chunks):
+    edge_ends = edges.path_offsets[edges.edge_offsets[1:]]
+    # Cut after the edge where the running pixel count passes each multiple of the chunk target
+    targets = np.arange(1, num_chunks) * edges.num_points / num_chunks
+    cuts = np.unique(np.concatenate([[0], np.searchsorted(edge_ends, targets) + 1, [edges.num_edges]]))
+    cuts = np.minimum(cuts, edges.num_edges)
+    return [(start, end) for start, end in zip(cuts[:-1], cuts[1:]) if end > start]
+
+# Helper function: Run a per-edge stage over edge groups in a process pool
+# Input: Stage function (taking a PathBuffer first), PathBuffer, int, int, the stage function's keyword arguments
+# Output: The stage function's result (a PathBuffer or tuple of PathBuffers) for all edges
+# Edge groups are split into chunks of similar pixel count. The edge coordinates are handed to the workers through
+# shared memory, and results are joined in the original edge order, so the output matches the serial run
+def parallel_edge_map(stage_function, edges, workers, chunks_per_worker = 4, **stage_kwargs):
+    shm = shared_memory.SharedMemory(create=True, size=max(edges.coords.nbytes, 1))
+    try:
+        np.ndarray(edges.coords.shape, dtype=np.int32, buffer=shm.buf)[:] = edges.coords
+        tasks = []
+        for start, end in split_edge_ranges(edges, workers * chunks_per_worker):
+            edge_offsets = edges.edge_offsets[start:end + 1]
+            path_offsets = edges.path_offsets[edge_offsets[0]:edge_offsets[-1] + 1]
+            tasks.append((shm.name, edges.num_points, path_offsets, edge_offsets - edge_offsets[0]))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(edge_chunk_task, *task, stage_function, stage_kwargs) for task in tasks]
+            results = [future.result() for future in futures]
+    finally:
+        shm.close()
+        shm.unlink()
+    if isinstance(results[0], tuple):
+        return tuple(PathBuffer.concatenate(list(parts)) for parts in zip(*results))
+    return PathBuffer.concatenate(results)
+
+# Helper function: Resolve the number of worker processes to use for a stage (None means one per core)
+def resolve_workers(workers, edges):
+    if workers is None:
+        workers = os.cpu_count() or 1
+    return workers if edges.num_edges > 1 else 1
+
+# Input: PathBuffer, int, int, float, string, int, int
+# Output: PathBuffer (ordered edges, as s4_order_edges), PathBuffer (simplified paths, as s5_simplify_path)
+# Runs s4 and s5 together, so that with more than one worker each chunk of edge groups is ordered and simplified by
+# the same process (see parallel_edge_map)
+def s45_order_and_simplify(edges, dist_thresh, section_size_thresh, epsilon, engine = 'greedy', workers = 1,
+                           chunks_per_worker = 4):
+    workers = resolve_workers(workers, edges)
+    if workers > 1:
+        return parallel_edge_map(s45_order_and_simplify, edges, workers, chunks_per_worker=chunks_per_worker,
+                                 dist_thresh=dist_thresh, section_size_thresh=section_size_thresh, epsilon=epsilon,
+                                 engine=engine)
+    ordered_edges = s4_order_edges(edges, dist_thresh, section_size_thresh, engine=engine)
+    return ordered_edges, s5_simplify_path(ordered_edges, epsilon)
+
+# Input: PathBuffer (grouped edges from s3), int, int, float, tuple (robot start y and x coordinates), string
+# Output: Generator of strokes (arrays of waypoint y and x coordinates), in painting order
+# Streaming mode of s4 and s5: edges are ordered and simplified one at a time, starting with the edge that has the
+# pixel closest to the robot, then the one closest to where the previous edge's last stroke ended, and so on. Each
+# edge's sections are yielded as soon as they are simplified, nearest end first, so the first strokes are ready after
+# planning a single edge. Candidate pixels are held in a KD-tree that is rebuilt without finished edges when needed
+def s45_stream_strokes(edges, dist_thresh, section_size_thresh, epsilon, start_point = (0, 0), engine = 'greedy'):
+    if edges.num_edges == 0:
+        return
+    edge_ids = np.repeat(np.arange(edges.num_edges), np.diff(edges.path_offsets[edges.edge_offsets]))
+    search = stroke_sequencing.NearestUnfinished(edges.coords, edge_ids, k=16)
+    finished = np.zeros(edges.num_edges, dtype=bool)
+    curr = np.asarray(start_point, dtype=float)
+    for _ in range(edges.num_edges):
+        # Closest pixel of an unfinished edge
+        i = edge_ids[search.query(curr, finished)]
+        finished[i] = True
+
+        sections = [simplify.rdp_path(np.asarray(section, dtype=np.int32).reshape(-1, 2), epsilon)
+                    for section in order_edge(edges.edge_coords(i), dist_thresh, section_size_thresh, engine=engine)]
+        while sections:
+            # Next section: the one with the end closest to the current position, started from that end
+            end_distances = [min(np.hypot(*(section[0] - curr)), np.hypot(*(section[-1] - curr)))
+                             for section in sections]
+            section = sections.pop(int(np.argmin(end_distances)))
+            if np.hypot(*(section[-1] - curr)) < np.hypot(*(section[0] - curr)):
+                section = section[::-1]
+            curr = section[-1].astype(float)
+            yield section
+
+# Input: PathBuffer, tuple (robot start y and x coordinates), float, int
+# Output: PathBuffer (one edge per stroke, in painting order), dict of pen-up travel distances
+# Runs between s5 and s6. Takes every section of every edge as a stroke and picks the painting order, the end each
+# open stroke starts from and the vertex each closed loop starts at, to minimize travel with the paint off. Strokes
+# whose ends are within loop_gap are closed into loops. The order is built by moving to the nearest unpainted stroke
+# and then improved with 2-opt and Or-opt moves (see stroke_sequencing)
+def s56_sequence_strokes(simplified_paths, start_point = (0, 0), loop_gap = 5, max_passes = 10):
+    strokes, travel = stroke_sequencing.sequence_strokes(list(simplified_paths.paths()), start_point=start_point,
+                                                         loop_gap=loop_gap, max_passes=max_passes)
+    print(f"Pen-up travel: {travel['original']:.1f} before sequencing, {travel['nearest_neighbor']:.1f} nearest "
+          f"neighbor, {travel['improved']:.1f} after improvement")
+    return PathBuffer.from_edges([[stroke] for stroke in strokes]), travel
+
+# Input: PathBuffer (simplified or sequenced paths), float (largest distance from a waypoint to its primitive)
+# Output: CurveBuffer (line and circular arc primitives, one path per non-empty input path)
+def s57_fit_curves(simplified_paths, tolerance = 1.0):
+    curves = curve_fitting.fit_curves(simplified_paths, tolerance=tolerance)
+    print(f'Curve fitting: {simplified_paths.num_points} waypoints -> {curves.num_primitives} primitives '
+          f'({curves.num_arcs} arcs)')
+    return curves
+
+# Input: PathBuffer (sequenced paths), tuple (robot start coordinates), floats (painting and travel speed limits in
+#        waypoint units per second, acceleration limit, jerk limit, largest distance a corner may be cut by, samples
+#        per second, seconds held at each path start and end)
+# Output: Trajectory (positions, velocities and painting states sampled at the control rate, with the job time)
+def s58_generate_trajectory(sequenced_paths, start_point = (0, 0), paint_speed = 3.0, travel_speed = 6.0,
+                            max_accel = 3.0, max_jerk = 20.0, corner_tolerance = 0.25, control_rate = 50,
+                            toggle_dwell = 0.1):
+    robot_trajectory = trajectory.generate_trajectory(
+        sequenced_paths, start_point=start_point, paint_speed=paint_speed, travel_speed=travel_speed,
+        max_accel=max_accel, max_jerk=max_jerk, corner_tolerance=corner_tolerance, control_rate=control_rate,
+        toggle_dwell=toggle_dwell)
+    print(f'Estimated job time: {robot_trajectory.job_time:.1f}s ({robot_trajectory.paint_time:.1f}s painting), '
+          f'{robot_trajectory.num_samples} samples at {control_rate}Hz')
+    return robot_trajectory
+
+# Input: CurveBuffer, string (output file path)
+# Consumers that only follow waypoints can read the file back with curve_fitting.read_curves and sample it with
+# to_paths, or be given s6_generate_output(curves.to_paths(), ...)
+def s6_generate_curve_output(curves, output_file):
+    curve_fitting.write_curves(curves, output_file)
+    print('Generated Curves at ', output_file)
+
+# Input: PathBuffer, string (output file path), bool, string ('text' or 'binary'), float (scale the image was
+#        resampled by in s0_prepare_img), int, string (border size and resample mode given to s0_prepare_img)
+# The binary format (see waypoint_file.py) holds the same waypoints and toggles along with a path offset table, and
+# can be read back in place with waypoint_file.read_waypoints; the text format is kept for export. Waypoints are
+# always written in native image pixels, so the painted size does not depend on the resampling scale
+def s6_generate_output(simplified_paths, output_file, close_paths = True, output_format = 'text', scale = 1.0,
+                       border_size = 2, resample_mode = 'nearest'):
+  # Close every path by returning to its first point (open boundaries from s234_boundary_graph are left open)
+  closed_paths = []
+  for path in simplified_paths.paths():
+    if close_paths and np.any(path[-1] != path[0]):
+      path = np.vstack([path, path[:1]])
+    closed_paths.append(path)
+  all_waypoints = np.concatenate(closed_paths) if closed_paths else np.empty((0, 2), dtype=np.int32)
+  all_waypoints = to_native_pixels(all_waypoints, scale, border_size=border_size, resample_mode=resample_mode)
+
+  # Painting toggle is set on the first and last waypoint of each path
+  painting_toggles = np.zeros(len(all_waypoints), dtype=np.int32)
+  path_lengths = np.array([len(path) for path in closed_paths], dtype=np.int64)
+  path_ends = np.cumsum(path_lengths)
+  painting_toggles[path_ends - path_lengths] = 1
+  painting_toggles[path_ends - 1] = 1
+
+  if output_format == 'binary':
+    waypoint_file.write_waypoints(output_file, all_waypoints, np.concatenate([[0], path_ends]), painting_toggles)
+  elif output_format == 'text':
+    with open(output_file, "w") as file:
+      file.writelines(f"{x}, {y}, {toggle}\n" for (x, y), toggle in zip(all_waypoints.tolist(), painting_toggles.tolist()))
+  else:
+    raise ValueError(f'Invalid output format: {output_format}')
 
   print('Generated Waypoints at ', output_file)
 
+# Input: Iterable of strokes (arrays of waypoint y and x coordinates), string (output file path), bool, float (time
+#        planning started, by default when the first stroke is requested), float, int, string (as s6_generate_output)
+# Output: Dict of the number of strokes and waypoints written and the times (in seconds since start_time) at which
+#         the first and last waypoints were written
+# Streaming version of s6_generate_output (text format only, as the binary format starts with its offset table):
+# each stroke is written and flushed as soon as it arrives, so a consumer following the file can start painting the
+# first strokes while later ones are still being planned
+def s6_stream_output(strokes, output_file, close_paths = False, start_time = None, scale = 1.0, border_size = 2,
+                     resample_mode = 'nearest'):
+  start_time = time.perf_counter() if start_time is None else start_time
+  stats = {'num_strokes': 0, 'num_waypoints': 0, 'first_waypoint_time': None, 'last_waypoint_time': None}
+  with open(output_file, "w") as file:
+    for stroke in strokes:
+      stroke = np.asarray(stroke).reshape(-1, 2)
+      if len(stroke) == 0:
+        continue
+      if close_paths and np.any(stroke[-1] != stroke[0]):
+        stroke = np.vstack([stroke, stroke[:1]])
+      stroke = to_native_pixels(stroke, scale, border_size=border_size, resample_mode=resample_mode)
+      # Painting toggle is set on the first and last waypoint of each stroke
+      painting_toggles = np.zeros(len(stroke), dtype=np.int32)
+      painting_toggles[[0, -1]] = 1
+      file.writelines(f"{x}, {y}, {toggle}\n" for (x, y), toggle in zip(stroke.tolist(), painting_toggles.tolist()))
+      file.flush()
+      stats['last_waypoint_time'] = time.perf_counter() - start_time
+      if stats['first_waypoint_time'] is None:
+        stats['first_waypoint_time'] = stats['last_waypoint_time']
+      stats['num_strokes'] += 1
+      stats['num_waypoints'] += len(stroke)
+
+  if stats['num_strokes']:
+    print(f"Streamed {stats['num_waypoints']} waypoints in {stats['num_strokes']} strokes to {output_file}: first "
+          f"waypoint after {stats['first_waypoint_time']:.3f}s, last after {stats['last_waypoint_time']:.3f}s")
+  return stats
+
 def s7_animate_output(paths, animation_output_filename):
   # First and second sets of corners
-  corners1 = copy.deepcopy(paths[0])  # Replace with your first set
-  corners2 = copy.deepcopy(paths[1])  # Replace with your second set
+  corners1 = np.array(paths.path(0))  # Replace with your first set
+  corners2 = np.array(paths.path(1))  # Replace with your second set
 
   # Function to generate equidistant points along the trajectory
   def generate_equidistant_points(points, num_points=100):
@@ -367,21 +988,25 @@ def s7_animate_output(paths, animation_output_filename):
 ###### **s0_prepare_img**
 
 ###### The s0_prepare_img function reads the uploaded .jpg, .png or other compatible file as an RGB image with shape (height, width, 3), where 3 represents the red, green and blue color channels. The A border of width 'border_size = 2' is added to the image, and is returned by the function.
+
+###### Detail finer than the robot's painted line cannot be reproduced, yet every later stage pays for it. Given the physical width of the painted image (target_width) and the painted line width (line_width), in the same units, s0_prepare_img first resamples the image to the coarsest resolution that still has pixels_per_line pixels across a line, and prints the chosen scale and how many times fewer pixels this gives than the native resolution. The image is never upsampled. The default resample_mode 'nearest' keeps every pixel an exact original color, so color edges stay sharp and no blended colors reach s1. 'area' averages the pixels each output pixel covers. On the bundled logos painted 20 units wide with a 0.1 to 0.2 unit line, s0 to s5 run 2.6 to 8 times faster, and the edges stay within 0.2 line widths of the native ones on average. Pixel-based parameters such as min_points_per_edge apply to the resampled image. With return_scale=True, s0_prepare_img also returns the scale; giving it to s6_generate_output (or s6_stream_output) writes the waypoints back in native pixels, so the painted size does not change with the line width. For stages working on the waypoints directly, such as s58_generate_trajectory, map them first with to_native_pixels.
 """
 
 # img_rgb = s0_prepare_img(uploaded_image_path, border_size=border_size, display=False)
+# img_rgb, scale = s0_prepare_img(uploaded_image_path, border_size=border_size, display=False, target_width=20.0, line_width=0.1, return_scale=True)
+# s6_generate_output(sequenced_paths, waypoints_output_filename, scale=scale, border_size=border_size)
 
 """# **Step 1: Reduce RGBs To Main Colors**
 
 ###### **s1_reduce_img_rgbs**
 
-###### The s1_reduce_img_rgbs function takes an RGB image as input and uses k-means clustering to establish k RGB clusters within which each pixel belongs. The centers of these clusters, which can be interpreted as the average colors, are deemed as 'selected' rgbs. For each pixel within the image, the closest center to the given pixel's original color is assigned in its place. This ultimately yields a full RGB image reduced to only k colors.
+###### The s1_reduce_img_rgbs function takes an RGB image as input and uses k-means clustering to establish k RGB clusters within which each pixel belongs. The centers of these clusters, which can be interpreted as the average colors, are deemed as 'selected' rgbs. For each pixel within the image, the index of the closest center to the given pixel's original color is assigned in its place. This ultimately yields a uint8 label image, which together with the selected rgbs represents the full RGB image reduced to only k colors (labels_to_rgb rebuilds the RGB image for display).
 """
 
-# img_reduced_rgb = s1_reduce_img_rgbs(img_rgb, k=k, display=False)
+# img_labels, selected_rgbs = s1_reduce_img_rgbs(img_rgb, k=k, display=False)
 
 # pre_reduction_unique = len(set(list(map(tuple, img_rgb.reshape(-1, 3)))))
-# post_reduction_unique = len(set(list(map(tuple, img_reduced_rgb.reshape(-1, 3)))))
+# post_reduction_unique = len(np.unique(img_labels))
 # print('Number of Unique RGB Triples (Colors) Before Reduction: ', pre_reduction_unique)
 # print('Number of Unique RGB Triples (Colors) After Reduction: ', post_reduction_unique)
 # print('Reduction %: ', round((1 - (post_reduction_unique / pre_reduction_unique)) * 100, 4))
@@ -389,10 +1014,10 @@ def s7_animate_output(paths, animation_output_filename):
 """# **Step 2: Detect and Isolate Image Edges**
 ###### **s2_generate_edges**
 
-###### The s2_generate_edges function takes an RGB image as input, and iterates through every pixel within the image. For each pixel, the function identifies and tracks the RGBs present within the 2x2 kernel beginning at the pixel itself. If more than one RGB is represented within this four-pixel set, the pixel is deemed an 'edge' and is assigned a value of 255 in the ouput binary image. If the pixel's corresponding 2x2 kernel is monochromatic, it is not considered an edge and assigned a value of 0. Note that the effectiveness of this function is dependent on having already reduced the image's original RGB set. Providing this function with a raw image may lead to all pixel assignments as 'edges' due to subtle variability in RGB values.
+###### The s2_generate_edges function takes the s1 label image as input, and compares every pixel within the image against its neighbors at once by comparing the image with shifted copies of itself. For each pixel, the function checks the labels (reduced RGBs) present within the 2x2 kernel beginning at the pixel itself. If more than one RGB is represented within this four-pixel set, the pixel is deemed an 'edge' and is assigned a value of 255 in the ouput binary image. If the pixel's corresponding 2x2 kernel is monochromatic, it is not considered an edge and assigned a value of 0. Note that the effectiveness of this function is dependent on having already reduced the image's original RGB set. Providing this function with a raw image may lead to all pixel assignments as 'edges' due to subtle variability in RGB values.
 """
 
-# img_edges = s2_generate_edges(img_reduced_rgb, display=False)
+# img_edges = s2_generate_edges(img_labels, display=False)
 
 """# **Step 3: Group Adjacent Edge Pixels**
 ###### **s3_group_edges**
@@ -410,12 +1035,13 @@ def s7_animate_output(paths, animation_output_filename):
 ###### The algorithm begins by arbitrarily selecting a starting pixel. It then iteratively adds its closest pixel to the list of pixels and updates its current pixel until there are no longer untraversed pixels within a set distance. At this stage, the algorithm reverts to the original starting pixel and runs the same algorithm, adding pixels to the start of the pixel list instead, once again until there are no longer untraversed pixels within the distance range. This list of pixels is added to the full waypoints list and a new starting position is selected.
 
 ###### This ensures that complex multi-color image edges are able to processed, including edges that have multiple line intersections.
+
+###### Alternatively, engine='skeleton' thins each edge to a one-pixel-wide skeleton and splits it into strokes at its endpoints and junctions, which avoids breaking thick or intersecting edges into many short sections.
 """
 
 # ordered_edges = s4_order_edges(grouped_edges, dist_thresh=max_dist_betw_points, section_size_thresh=min_section_size)
 
 # """## **4.1:  Ordering Edges with Complicated Input**"""
-# sys.setrecursionlimit(20000)
 # mw2_path = 'minnesota_wild.png'
 # mw2_k = 5
 # mw2_border_size = 2
@@ -423,17 +1049,89 @@ def s7_animate_output(paths, animation_output_filename):
 # mw2_max_dist_betw_points = 5
 # mw2_min_section_size = 10
 # mw2_img_rgb = s0_prepare_img(mw2_path, border_size=mw2_border_size, display=False)
-# mw2_img_reduced_rgb = s1_reduce_img_rgbs(mw2_img_rgb, k=mw2_k, display=False)
-# mw2_img_edges = s2_generate_edges(mw2_img_reduced_rgb, display=False)
+# mw2_img_labels, mw2_selected_rgbs = s1_reduce_img_rgbs(mw2_img_rgb, k=mw2_k, display=False)
+# mw2_img_edges = s2_generate_edges(mw2_img_labels, display=False)
 # mw2_grouped_edges = s3_group_edges(mw2_img_edges, edge_threshold=mw2_min_points_per_edge)
 # mw2_ordered_edges = s4_order_edges(mw2_grouped_edges, dist_thresh=mw2_max_dist_betw_points, section_size_thresh=mw2_min_section_size)
 
+"""## **2-4 (Alternative): Contour Mode**
+###### **s234_trace_contours**
+
+###### For clean flat-color images, the s234_trace_contours function can replace steps 2 to 4. It traces the boundary of every color region in the s1 label image with cv2.findContours, which returns each boundary as an ordered closed path (holes included), so no edge grouping or ordering is needed. Its output can be passed straight to s5_simplify_path.
+"""
+
+# ordered_edges = s234_trace_contours(img_labels, edge_threshold=min_points_per_edge)
+
+"""###### **s234_boundary_graph**
+
+###### Where three or more colors meet, the edges from s2 (and the contours above) cover the same boundary once for every region that touches it. The s234_boundary_graph function instead builds the graph of boundaries between neighboring pixels of different colors, and splits it at the points where three or more regions meet. Each boundary between two colors is returned once, tagged with the pair of labels it separates. Where only the color on one side of a boundary changes, the pieces are joined into one stroke so the robot does not stop there (each piece keeps its tag), and networks of connected boundaries with fewer than edge_threshold pixels in total are dropped, so that boundaries between junctions are never lost on their own. As these boundaries are generally open, their waypoints should be written with s6_generate_output(..., close_paths=False).
+"""
+
+# ordered_edges, boundary_labels, piece_offsets = s234_boundary_graph(img_labels, edge_threshold=min_points_per_edge)
+
 """# **Step 5: Simplify Edge Pixels to Waypoints**
 ###### **s5_simplify_path**
 
 ###### The s5_simplify_path function uses the Ramer-Douglas-Peucker algorithm to reduce the number of points in a curve/edge while prserving its overall shape, therefore creating a list of waypoints that can sufficiently represent the image eduges while being distant from one another to allow robot following. The algorithm takes as input the first and last points of the edge. It then calculates the shortest distance between other points and the line between the first and last points for all points. It takes the point with the greatest distance, compares it to the predetermined epsilon thresold value, and keeps it if the distance exceeds it. The curve is the split into two segments, between the first point and the new point, and between the new point and the final point. The algorithm is run for the two new line segments and all subsequently generated line segments until all new possible points are within the epsilon threshold distance away from the curve.
+
+###### The algorithm is implemented in simplify.py rather than with the rdp package. The segments still waiting to be split are kept on an explicit stack instead of being handled recursively, and the segments of all sections are split together, one level at a time, with the point distances computed as whole arrays. The waypoints are the same as rdp(section, epsilon=epsilon) returns.
 """
 
 # simplified_paths = s5_simplify_path(ordered_edges, epsilon=1.4)
 
-# s6_generate_output(simplified_paths, waypoints_output_filename)
+"""## **5 (Alternative): Waypoint Budget**
+###### **s5_simplify_path with max_waypoints**
+
+###### When the robot can only store a limited number of waypoints, s5_simplify_path can instead be given a max_waypoints budget for the whole image. All points of all sections are ranked in one priority queue and the most significant are kept until the budget is used up. With budget_method 'rdp', the ranking is by RDP distance: the split that removes the largest remaining error anywhere in the image is made first. With 'visvalingam', it is by the triangle area each point spans with its neighbors. Every section keeps its end points, and closed loops also keep their point farthest from the start, so a loop never collapses to a single point. Whole sections are ranked in the same queue by how far they reach, so the budget is never exceeded: a section is dropped when leaving it out costs less error than the splits its points would otherwise pay for. Sections whose ends are within loop_gap are closed before counting, as s56_sequence_strokes closes them, so the budget still holds after sequencing; when s6_generate_output closes every path (close_paths=True), pass loop_gap=np.inf. The worst-case distance from the original edge pixels to the simplified paths, including the pixels of dropped sections, is printed along with the number of sections dropped. RDP ranking usually gives the smaller worst-case error for the same budget.
+"""
+
+# simplified_paths = s5_simplify_path(ordered_edges, epsilon=1.4, max_waypoints=1000)
+
+"""# **Step 5.5: Sequence Strokes**
+###### **s56_sequence_strokes**
+
+###### The s56_sequence_strokes function takes every simplified section as a stroke and chooses the order in which they are painted, along with the end each open stroke is started from and the point each closed loop is started at, to minimize the distance the robot travels with its paint off. It starts from a nearest-neighbor tour and improves it with 2-opt and Or-opt moves, reporting the travel distance before and after. Closed strokes are already closed, so the waypoints are written without closing paths.
+"""
+
+# sequenced_paths, travel = s56_sequence_strokes(simplified_paths, start_point=(0, 0))
+
+# s6_generate_output(sequenced_paths, waypoints_output_filename, close_paths=False)
+
+"""###### s6_generate_output writes the waypoints as text lines by default. With output_format='binary' it instead writes a versioned binary file: a header, a table of path offsets, then the packed coordinates and painting toggles. The file is written in a few bulk writes and read back in place with waypoint_file.read_waypoints (np.memmap), which keeps large jobs fast to save and load and several times smaller on disk.
+"""
+
+# s6_generate_output(sequenced_paths, 'image_waypoints.wpt', close_paths=False, output_format='binary')
+
+"""# **Step 5.7 (Optional): Fit Curves**
+###### **s57_fit_curves**
+
+###### Curved edges reach the robot as many short line segments. The s57_fit_curves function replaces each run of waypoints that a single line or circular arc passes within tolerance of (including the segments between the waypoints) with that primitive, which gives far fewer commands and smoother motion along curves. s6_generate_curve_output writes the primitives as "M" (move to a path start), "L" (line to) and "A" (arc to, with center and direction) commands, and CurveBuffer.to_paths samples the arcs back into waypoints for consumers of the original format. It can also be given the ordered edge pixels from step 4 in place of the s5 waypoints: the fit then follows the edges themselves and compresses much further (on the bundled logos, 20 to 50 times fewer commands than edge pixels, against under 2 times fewer than s5 waypoints).
+"""
+
+# curves = s57_fit_curves(sequenced_paths, tolerance=1.0)
+# s6_generate_curve_output(curves, 'image_curves.txt')
+
+"""## **4-6 (Alternative): Streaming Mode**
+###### **s45_stream_strokes, s6_stream_output**
+
+###### For large jobs, the robot does not have to wait for the whole image to be planned. s45_stream_strokes is a generator that orders and simplifies one edge at a time, nearest to the robot first, and yields each finished stroke right away. s6_stream_output writes and flushes every stroke as it arrives, so the first strokes can be painted while later ones are still being planned. It reports the time to the first and last waypoint. The strokes are ordered greedily as they are planned, so the travel is not improved further as in s56_sequence_strokes.
+"""
+
+# stream_stats = s6_stream_output(s45_stream_strokes(grouped_edges, dist_thresh=max_dist_betw_points, section_size_thresh=min_section_size, epsilon=1.4, start_point=(0, 0)), waypoints_output_filename)
+
+"""# **Step 5.8 (Optional): Generate a Trajectory**
+###### **s58_generate_trajectory**
+
+###### The waypoints alone say nothing about timing, so a robot following them as given stops at every corner. The s58_generate_trajectory function turns the sequenced paths into positions, velocities and painting states sampled at a fixed control rate. Each segment gets a trapezoidal speed profile, capped separately for painting and travel. Corners are taken at the speed of an arc that blends them within corner_tolerance, and the robot stops only at path starts and ends, where the painting toggle changes. The profile is then smoothed into a jerk-limited one, which rounds the corners itself, so the samples stay within max_accel and max_jerk (trajectory.estimate_job_time(..., max_jerk=None) estimates the unsmoothed plan, which is never sampled as it would turn instantly at corners). Speeds are in waypoint units (pixels) per second. The estimated job time makes it possible to compare planner settings by painting time; trajectory.estimate_job_time gives the same estimate without sampling.
+"""
+
+# robot_trajectory = s58_generate_trajectory(sequenced_paths, start_point=(0, 0), paint_speed=3.0, travel_speed=6.0, max_accel=3.0, max_jerk=20.0)
+
+"""# **Step 8 (Optional): Stream Waypoints to the Robot**
+###### **robot_link.send_waypoints**
+
+###### Instead of copying the waypoint file to the robot by hand, robot_link.send_waypoints streams the waypoints over TCP or a byte pipe. The robot acknowledges waypoints as it paints them. The sender never has more waypoints unacknowledged than the robot's buffer holds, so the buffer cannot overflow. The acknowledged count is checkpointed to a file, so a job cut off by a dropped link resumes where it stopped. Waypoint indices are absolute, so the job also resumes from the checkpoint on a robot that has lost track of it. While painting, the robot also acknowledges at least every heartbeat seconds, and a link that stays silent past the sender's timeout raises ConnectionError (after checkpointing every acknowledged waypoint). robot_link.StandInRobot is a local stand-in for the robot's onboard computer, used for testing.
+"""
+
+# waypoints, path_offsets, toggles = waypoint_file.read_waypoints('image_waypoints.wpt')
+# link_stats = robot_link.send_waypoints(robot_link.connect_tcp(('robot.local', 9000)), waypoints, toggles, window=256, checkpoint_file='robot_checkpoint.json')
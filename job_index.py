@@ -0,0 +1,92 @@
+import json
+import os
+import cv2
+import numpy as np
+from stage_cache import pack_result, unpack_result
+from atomic_file import write_atomic
+
+# Index of previously processed images, matched by perceptual hash rather than file bytes, so that re-exported or
+# resized copies of the same artwork are recognized. For each job it keeps the image's hash and shape, the pipeline
+# parameters, the s1 palette and the s5 waypoints. The hashes of all jobs are held in one array and compared at once,
+# which keeps lookups fast for tens of thousands of jobs.
+
+# Input: RGB image of shape (h, w, 3)
+# Output: 64-bit perceptual hash (DCT hash of the downscaled grayscale image)
+def perceptual_hash(img_rgb):
+    gray = cv2.cvtColor(np.ascontiguousarray(img_rgb), cv2.COLOR_RGB2GRAY).astype(np.float32)
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA)
+    # Keep the lowest 8x8 frequencies and set a bit for each one above their median
+    low_frequencies = cv2.dct(small)[:8, :8].ravel()
+    bits = low_frequencies > np.median(low_frequencies[1:])
+    return np.uint64(int(''.join('1' if bit else '0' for bit in bits), 2))
+
+# Helper function: Number of differing bits between one hash and an array of hashes
+def hamming_distances(hashes, image_hash):
+    differences = np.bitwise_xor(hashes, np.uint64(image_hash))
+    return np.unpackbits(differences.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+# Helper function: Rescale the coordinates of paths planned on an image of one shape to an image of another shape
+# Input: PathBuffer, tuple (planned image height and width), tuple (new image height and width)
+# Output: PathBuffer
+def rescale_paths(paths, from_shape, to_shape):
+    scale = np.array(to_shape[:2], dtype=float) / np.array(from_shape[:2], dtype=float)
+    coords = np.round(paths.coords * scale).astype(np.int32)
+    return type(paths)(coords, paths.path_offsets, paths.edge_offsets)
+
+class JobIndex:
+    def __init__(self, index_dir = 'job_index', max_distance = 6, max_aspect_change = 0.02):
+        self.index_dir = index_dir
+        self.max_distance = max_distance
+        self.max_aspect_change = max_aspect_change
+        os.makedirs(index_dir, exist_ok=True)
+        self.index_path = os.path.join(index_dir, 'index.npz')
+        if os.path.exists(self.index_path):
+            with np.load(self.index_path) as data:
+                self.hashes = data['hashes']
+                self.log_aspects = data['log_aspects']
+        else:
+            self.hashes = np.empty(0, dtype=np.uint64)
+            self.log_aspects = np.empty(0, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def job_path(self, job_id):
+        return os.path.join(self.index_dir, f'job_{job_id}.npz')
+
+    # Find the closest previous job whose image is a near match (same aspect ratio, few differing hash bits)
+    # Output: Job id, hash distance (or None, None)
+    def find(self, img_rgb):
+        if len(self.hashes) == 0:
+            return None, None
+        distances = hamming_distances(self.hashes, perceptual_hash(img_rgb))
+        log_aspect = np.log(img_rgb.shape[1] / img_rgb.shape[0])
+        distances[np.abs(self.log_aspects - log_aspect) > self.max_aspect_change] = 65
+        job_id = int(np.argmin(distances))
+        if distances[job_id] > self.max_distance:
+            return None, None
+        return job_id, int(distances[job_id])
+
+    # Load a job's record: image shape, pipeline parameters, palette RGBs and simplified paths
+    def load(self, job_id):
+        with np.load(self.job_path(job_id)) as data:
+            arrays = dict(data)
+        return {
+            'shape': tuple(arrays.pop('shape').tolist()),
+            'params': json.loads(str(arrays.pop('params'))),
+            'selected_rgbs': arrays.pop('selected_rgbs'),
+            'simplified_paths': unpack_result(arrays),
+        }
+
+    # Record a processed image and return its job id
+    def add(self, img_rgb, params, selected_rgbs, simplified_paths):
+        job_id = len(self.hashes)
+        arrays = pack_result(simplified_paths)
+        arrays['shape'] = np.array(img_rgb.shape[:2])
+        arrays['params'] = np.array(json.dumps(params, sort_keys=True))
+        arrays['selected_rgbs'] = np.asarray(selected_rgbs)
+        write_atomic(self.job_path(job_id), lambda file: np.savez_compressed(file, **arrays))
+        self.hashes = np.append(self.hashes, perceptual_hash(img_rgb))
+        self.log_aspects = np.append(self.log_aspects, np.log(img_rgb.shape[1] / img_rgb.shape[0]))
+        write_atomic(self.index_path, lambda file: np.savez(file, hashes=self.hashes, log_aspects=self.log_aspects))
+        return job_id
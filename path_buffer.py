@@ -0,0 +1,107 @@
+import numpy as np
+
+# Compact container for the edges and paths passed between stages s3 to s6.
+# All pixel coordinates live in one flat (n, 2) int32 buffer. path_offsets[j]:path_offsets[j + 1] is the
+# block of coordinates for path (section) j, and edge_offsets[i]:edge_offsets[i + 1] is the range of paths
+# belonging to edge (group) i. Indexing an edge or a path returns views into the buffer, never copies.
+
+class PathBuffer:
+    def __init__(self, coords, path_offsets, edge_offsets):
+        self.coords = np.asarray(coords, dtype=np.int32).reshape(-1, 2)
+        self.path_offsets = np.asarray(path_offsets, dtype=np.int64)
+        self.edge_offsets = np.asarray(edge_offsets, dtype=np.int64)
+
+    # Build a buffer from a list of edges, each a list of paths (arrays or lists of (y, x) pairs)
+    @classmethod
+    def from_edges(cls, edges):
+        paths = [np.asarray(path, dtype=np.int32).reshape(-1, 2) for edge in edges for path in edge]
+        path_lengths = [len(path) for path in paths]
+        edge_lengths = [len(edge) for edge in edges]
+        coords = np.concatenate(paths) if paths else np.empty((0, 2), dtype=np.int32)
+        path_offsets = np.concatenate([[0], np.cumsum(path_lengths, dtype=np.int64)])
+        edge_offsets = np.concatenate([[0], np.cumsum(edge_lengths, dtype=np.int64)])
+        return cls(coords, path_offsets, edge_offsets)
+
+    # Build a buffer of single-path edges from a flat coordinate buffer and its path offsets
+    @classmethod
+    def from_paths(cls, coords, path_offsets):
+        return cls(coords, path_offsets, np.arange(len(path_offsets), dtype=np.int64))
+
+    # Join buffers into one, keeping their edges in order
+    @classmethod
+    def concatenate(cls, buffers):
+        coords = np.concatenate([buffer.coords for buffer in buffers] or [np.empty((0, 2), dtype=np.int32)])
+        path_offsets = [np.zeros(1, dtype=np.int64)]
+        edge_offsets = [np.zeros(1, dtype=np.int64)]
+        num_points, num_paths = 0, 0
+        for buffer in buffers:
+            path_offsets.append(buffer.path_offsets[1:] - buffer.path_offsets[0] + num_points)
+            edge_offsets.append(buffer.edge_offsets[1:] - buffer.edge_offsets[0] + num_paths)
+            num_points += buffer.num_points
+            num_paths += buffer.num_paths
+        return cls(coords, np.concatenate(path_offsets), np.concatenate(edge_offsets))
+
+    @property
+    def num_edges(self):
+        return len(self.edge_offsets) - 1
+
+    @property
+    def num_paths(self):
+        return len(self.path_offsets) - 1
+
+    @property
+    def num_points(self):
+        return len(self.coords)
+
+    def path_lengths(self):
+        return np.diff(self.path_offsets)
+
+    # Zero-copy view of the coordinates of path j
+    def path(self, j):
+        return self.coords[self.path_offsets[j]:self.path_offsets[j + 1]]
+
+    # Iterate over the coordinate views of every path, in order
+    def paths(self):
+        for j in range(self.num_paths):
+            yield self.path(j)
+
+    # Zero-copy views of the paths belonging to edge i
+    def edge_paths(self, i):
+        return [self.path(j) for j in range(self.edge_offsets[i], self.edge_offsets[i + 1])]
+
+    # Zero-copy view of all coordinates belonging to edge i, across its paths
+    def edge_coords(self, i):
+        start = self.path_offsets[self.edge_offsets[i]]
+        end = self.path_offsets[self.edge_offsets[i + 1]]
+        return self.coords[start:end]
+
+    def __len__(self):
+        return self.num_edges
+
+    def __iter__(self):
+        for i in range(self.num_edges):
+            yield self.edge_paths(i)
+
+    # buf[i] returns the paths of edge i; buf[a:b] returns a buffer of those edges sharing the coordinates
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.num_edges)
+            if step != 1:
+                raise ValueError('Invalid slice step for PathBuffer')
+            stop = max(start, stop)
+            edge_offsets = self.edge_offsets[start:stop + 1]
+            path_offsets = self.path_offsets[edge_offsets[0]:edge_offsets[-1] + 1]
+            coords = self.coords[path_offsets[0]:path_offsets[-1]]
+            return PathBuffer(coords, path_offsets - path_offsets[0], edge_offsets - edge_offsets[0])
+        if index < 0:
+            index += self.num_edges
+        if not 0 <= index < self.num_edges:
+            raise IndexError('Invalid edge index')
+        return self.edge_paths(index)
+
+    # Convert back to nested lists of (y, x) tuples, as used before the buffer existed
+    def to_lists(self):
+        return [[list(map(tuple, path.tolist())) for path in edge] for edge in self]
+
+    def __repr__(self):
+        return f'PathBuffer(edges={self.num_edges}, paths={self.num_paths}, points={self.num_points})'
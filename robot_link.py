@@ -0,0 +1,313 @@
+import hashlib
+import json
+import os
+import select
+import socket
+import struct
+import threading
+import time
+from collections import deque
+import numpy as np
+from atomic_file import write_atomic
+
+# Streaming of waypoints to the robot over a byte stream: a TCP socket, or any serial-like pipe with sendall and recv
+# (see FdLink).
+# Every message is a frame starting with a header of a type byte and three integers (a, b, c):
+#   HELLO (sender -> robot): a = total waypoints, b = waypoint to resume from, c = job key
+#   READY (robot -> sender): a = waypoint the robot continues from (the larger of b and its own count for the job)
+#   DATA  (sender -> robot): a = index of the first waypoint, b = number of waypoints, followed by the waypoints
+#   ACK   (robot -> sender): a = index of the waypoint after the last one painted; also sent as a heartbeat at least
+#                            every heartbeat seconds while the robot has waypoints left to paint
+# All indices are absolute positions in the job, so a robot that lost track of a job (e.g. after a restart) picks it
+# up from the sender's checkpoint rather than from 0.
+# Flow control: the robot acknowledges waypoints once it has painted them, and the sender never has more than window
+# waypoints unacknowledged, so with window no larger than the robot's buffer the buffer cannot overflow; when the
+# window is full the sender waits for acknowledgements (back-pressure). The sender checkpoints the acknowledged count
+# to a file (every checkpoint_every acknowledged waypoints and when the link drops), so a job interrupted by a dropped
+# link resumes where it stopped when sent again. A link that stays silent for longer than the sender's timeout, which
+# must exceed the robot's heartbeat interval, is treated as dropped.
+
+hello_frame = 1
+ready_frame = 2
+data_frame = 3
+ack_frame = 4
+frame_header = struct.Struct('<BIIQ')
+waypoint_dtype = np.dtype([('y', '<i4'), ('x', '<i4'), ('toggle', 'u1')])
+
+# Byte pipe link over a pair of file descriptors (e.g. from os.pipe or an opened serial device), with the same
+# sendall, recv and settimeout methods as a socket
+class FdLink:
+    def __init__(self, read_fd, write_fd):
+        self.read_fd = read_fd
+        self.write_fd = write_fd
+        self.timeout = None
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def sendall(self, data):
+        view = memoryview(data)
+        while len(view):
+            view = view[os.write(self.write_fd, view):]
+
+    def recv(self, num_bytes):
+        if self.timeout is not None and not select.select([self.read_fd], [], [], self.timeout)[0]:
+            raise TimeoutError('Timed out')
+        return os.read(self.read_fd, num_bytes)
+
+    def close(self):
+        for fd in {self.read_fd, self.write_fd}:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+# Helper function: Read exactly num_bytes from a link, raising ConnectionError if it closes or times out first
+def recv_exact(link, num_bytes):
+    chunks = []
+    while num_bytes:
+        try:
+            chunk = link.recv(num_bytes)
+        except TimeoutError:
+            raise ConnectionError('Link timed out')
+        if not chunk:
+            raise ConnectionError('Link closed')
+        chunks.append(chunk)
+        num_bytes -= len(chunk)
+    return b''.join(chunks)
+
+def send_frame(link, frame_type, a = 0, b = 0, c = 0, payload = b''):
+    try:
+        link.sendall(frame_header.pack(frame_type, a, b, c) + payload)
+    except TimeoutError:
+        raise ConnectionError('Link timed out')
+
+# Output: Frame type, a, b, c, payload (the waypoints of a DATA frame, empty otherwise)
+def recv_frame(link):
+    frame_type, a, b, c = frame_header.unpack(recv_exact(link, frame_header.size))
+    payload = recv_exact(link, b * waypoint_dtype.itemsize) if frame_type == data_frame else b''
+    return frame_type, a, b, c, payload
+
+# Helper function: Waypoints as sent in DATA frames
+# Input: Arrays of waypoint coordinates of shape (n, 2) and painting toggles of shape (n,)
+# Output: Array of waypoint_dtype
+def pack_waypoints(coords, toggles):
+    waypoints = np.zeros(len(coords), dtype=waypoint_dtype)
+    waypoints['y'], waypoints['x'] = np.asarray(coords).reshape(-1, 2).T
+    waypoints['toggle'] = toggles
+    return waypoints
+
+# Helper function: 64-bit key identifying a job by its waypoints
+def job_key(waypoints):
+    return int.from_bytes(hashlib.sha256(waypoints.tobytes()).digest()[:8], 'little')
+
+# Helper function: Number of waypoints of a job acknowledged in an earlier run (0 if there is no checkpoint)
+def load_checkpoint(checkpoint_file, key):
+    try:
+        with open(checkpoint_file) as file:
+            checkpoint = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return 0
+    return checkpoint['acked'] if checkpoint.get('job_key') == key else 0
+
+def save_checkpoint(checkpoint_file, key, acked):
+    write_atomic(checkpoint_file, lambda file: file.write(json.dumps({'job_key': key, 'acked': acked}).encode()))
+
+# Input: Link, arrays of waypoint coordinates of shape (n, 2) and painting toggles of shape (n,), int (most
+#        unacknowledged waypoints, at most the robot's buffer size), int (waypoints per frame), string, int, float
+#        (seconds to wait for the robot before giving up, None to wait forever)
+# Output: Dict of the waypoint counts, elapsed time, throughput and acknowledgement round-trip latencies
+# Raises ConnectionError if the link drops or times out; sending again with the same checkpoint file resumes the job
+def send_waypoints(link, coords, toggles, window = 256, frame_size = 32, checkpoint_file = None,
+                   checkpoint_every = 1024, timeout = 10.0):
+    waypoints = pack_waypoints(coords, toggles)
+    total = len(waypoints)
+    key = job_key(waypoints)
+
+    link.settimeout(timeout)
+    acked = load_checkpoint(checkpoint_file, key) if checkpoint_file else 0
+    send_frame(link, hello_frame, total, acked, key)
+    frame_type, robot_acked, _, _, _ = recv_frame(link)
+    if frame_type != ready_frame:
+        raise ConnectionError(f'Invalid frame type: {frame_type}')
+    # The robot may have painted waypoints whose acknowledgement was lost, and may have lost track of ones it painted
+    acked = resumed_from = max(acked, robot_acked)
+
+    start = time.perf_counter()
+    next_send = acked
+    in_flight = deque()  # (end index of a DATA frame, time it was sent)
+    round_trips = []
+    last_checkpoint = acked
+    try:
+        while acked < total:
+            while next_send < total and next_send - acked < window:
+                count = min(frame_size, total - next_send, window - (next_send - acked))
+                send_frame(link, data_frame, next_send, count,
+                           payload=waypoints[next_send:next_send + count].tobytes())
+                in_flight.append((next_send + count, time.perf_counter()))
+                next_send += count
+
+            frame_type, robot_acked, _, _, _ = recv_frame(link)
+            if frame_type != ack_frame:
+                raise ConnectionError(f'Invalid frame type: {frame_type}')
+            acked = max(acked, robot_acked)
+            now = time.perf_counter()
+            while in_flight and in_flight[0][0] <= acked:
+                round_trips.append(now - in_flight.popleft()[1])
+            if checkpoint_file and (acked - last_checkpoint >= checkpoint_every or acked == total):
+                save_checkpoint(checkpoint_file, key, acked)
+                last_checkpoint = acked
+    finally:
+        # Whatever stopped the job, the checkpoint records every acknowledged waypoint
+        if checkpoint_file and acked > last_checkpoint:
+            save_checkpoint(checkpoint_file, key, acked)
+
+    elapsed = time.perf_counter() - start
+    round_trips = np.array(round_trips) if round_trips else np.zeros(1)
+    return {'total': total, 'resumed_from': resumed_from, 'sent': total - resumed_from, 'elapsed': elapsed,
+            'throughput': (total - resumed_from) / elapsed if elapsed > 0 else float('inf'),
+            'mean_round_trip': float(round_trips.mean()), 'p95_round_trip': float(np.percentile(round_trips, 95))}
+
+# Helper function: Close both directions of a link so that a blocked reader on either end wakes up
+def shutdown(link):
+    if isinstance(link, socket.socket):
+        try:
+            link.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    else:
+        link.close()
+
+# Local stand-in for the robot's onboard computer, for testing: holds received waypoints in a buffer of
+# buffer_size, paints them at paint_rate waypoints per second (instantly if None) and acknowledges them every
+# ack_every waypoints, whenever its buffer empties and at least every heartbeat seconds. It remembers how far each job got across connections, and
+# with drop_after it closes the connection once after painting that many waypoints, to simulate a dropped link.
+# Forgetting a job (deleting it from progress) simulates a robot restart
+class StandInRobot:
+    def __init__(self, buffer_size = 256, paint_rate = None, ack_every = 32, drop_after = None, heartbeat = 1.0):
+        self.buffer_size = buffer_size
+        self.paint_rate = paint_rate
+        self.ack_every = ack_every
+        self.heartbeat = heartbeat
+        self.drop_after = drop_after
+        self.painted = {}  # job key -> list of waypoints painted by this robot
+        self.progress = {}  # job key -> index of the waypoint after the last one painted
+        self.max_buffered = 0
+        self.overflowed = False
+        self.server = None
+
+    # Serve one connection over a link until the sender closes it (or the drop is simulated)
+    def serve_link(self, link):
+        buffer = deque()
+        condition = threading.Condition()
+        state = {'closed': False, 'key': None, 'done': 0}
+
+        # Paint buffered waypoints and acknowledge them, on its own thread so that receiving never waits for painting
+        def paint():
+            unacked = 0
+            next_paint_time = time.perf_counter()
+            last_ack_time = time.perf_counter()
+            while True:
+                with condition:
+                    while not buffer and not state['closed']:
+                        condition.wait()
+                    if state['closed']:
+                        return
+                    waypoint = buffer.popleft()
+                    buffer_empty = not buffer
+                if self.paint_rate:
+                    # Paint on a fixed schedule (not a fixed sleep per waypoint) so the rate holds despite overheads,
+                    # sending heartbeats while waiting
+                    next_paint_time = max(next_paint_time + 1 / self.paint_rate, time.perf_counter() - 0.01)
+                    while time.perf_counter() < next_paint_time:
+                        now = time.perf_counter()
+                        if now - last_ack_time >= self.heartbeat:
+                            last_ack_time = now
+                            try:
+                                send_frame(link, ack_frame, state['done'])
+                            except OSError:
+                                return
+                        time.sleep(max(0.0, min(next_paint_time, last_ack_time + self.heartbeat) - now))
+                self.painted[state['key']].append(waypoint)
+                with condition:
+                    state['done'] += 1
+                    self.progress[state['key']] = state['done']
+                unacked += 1
+                if unacked >= self.ack_every or buffer_empty:
+                    unacked = 0
+                    last_ack_time = time.perf_counter()
+                    try:
+                        send_frame(link, ack_frame, state['done'])
+                    except OSError:
+                        return
+                if self.drop_after is not None and sum(map(len, self.painted.values())) >= self.drop_after:
+                    self.drop_after = None
+                    with condition:
+                        state['closed'] = True
+                    shutdown(link)
+                    return
+
+        painter = threading.Thread(target=paint, daemon=True)
+        try:
+            frame_type, total, resume_from, key, _ = recv_frame(link)
+            if frame_type != hello_frame:
+                return
+            state['key'] = key
+            self.painted.setdefault(key, [])
+            # Waypoints the sender has checkpointed were painted, even if this robot has lost track of them
+            state['done'] = self.progress[key] = max(self.progress.get(key, 0), resume_from)
+            send_frame(link, ready_frame, state['done'])
+            painter.start()
+            while True:
+                frame_type, first, count, _, payload = recv_frame(link)
+                if frame_type != data_frame:
+                    return
+                waypoints = np.frombuffer(payload, dtype=waypoint_dtype)
+                with condition:
+                    # Waypoints the robot has already painted (resent after a lost acknowledgement) are skipped
+                    skip = max(0, state['done'] + len(buffer) - first)
+                    buffer.extend(waypoints[skip:].tolist())
+                    if len(buffer) > self.buffer_size:
+                        self.overflowed = True
+                    self.max_buffered = max(self.max_buffered, len(buffer))
+                    condition.notify()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with condition:
+                state['closed'] = True
+                condition.notify()
+            if painter.is_alive():
+                painter.join()
+
+    # Listen for TCP connections on localhost (port 0 picks a free port) and serve them one at a time
+    def start_tcp(self, port = 0):
+        self.server = socket.create_server(('127.0.0.1', port))
+        self.address = self.server.getsockname()
+
+        def accept():
+            while True:
+                try:
+                    connection, _ = self.server.accept()
+                except OSError:
+                    return
+                connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with connection:
+                    self.serve_link(connection)
+
+        threading.Thread(target=accept, daemon=True).start()
+        return self.address
+
+    def stop(self):
+        if self.server is not None:
+            self.server.close()
+
+    def painted_waypoints(self, key):
+        return np.array(self.painted.get(key, []), dtype=waypoint_dtype)
+
+# Input: Tuple (host and port)
+# Output: Connected TCP socket
+def connect_tcp(address):
+    connection = socket.create_connection(address)
+    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return connection
@@ -0,0 +1,299 @@
+import heapq
+import numpy as np
+from path_buffer import PathBuffer
+
+# Path simplification for s5, working on the flat coordinates of a PathBuffer.
+# Ramer-Douglas-Peucker keeps a path's end points and, while the point farthest from the line through a range's end
+# points is more than epsilon away, keeps that point and splits the range there. The pending ranges of every path are
+# held on one explicit stack and processed together, one split level at a time, with the distances of all their
+# points computed in a single vectorized pass, so there is neither recursion nor a Python loop over points. The
+# result matches rdp(path, epsilon=epsilon) from the rdp package point for point.
+# For a waypoint budget, points are instead ranked over all paths with one priority queue, either by RDP distance
+# (ranked_rdp_mask) or by Visvalingam-Whyatt area (visvalingam_mask), and the worst-case error is measured afterwards.
+# Every kept path keeps its end points, and closed loops also keep their point farthest from the start, so a loop is
+# never reduced to a single point. The budget is a hard limit: paths whose omission costs less error than the splits
+# the budget still allows are dropped, and paths that will be painted as loops are closed before counting, so the
+# closing points are paid for too.
+
+# Helper function: Distance of each point to the line through its range's start and end points (to the start point
+# if they coincide), computed as in rdp.pldist so that ties are broken the same way
+# Input: Arrays of point, start and end y and x coordinates of shape (n, 2)
+# Output: Array of distances of shape (n,)
+def line_distances(points, starts, ends):
+    if np.issubdtype(points.dtype, np.integer):
+        points, starts, ends = points.astype(np.int64), starts.astype(np.int64), ends.astype(np.int64)
+    direction = ends - starts
+    offset = starts - points
+    cross = np.abs(direction[:, 0] * offset[:, 1] - direction[:, 1] * offset[:, 0]).astype(np.float64)
+    length = np.sqrt((direction * direction).sum(axis=1).astype(np.float64))
+    coincident = length == 0
+    if coincident.any():
+        cross[coincident] = np.sqrt((offset[coincident] * offset[coincident]).sum(axis=1).astype(np.float64))
+        length[coincident] = 1.0
+    return cross / length
+
+# Input: Array of coordinates of shape (n, 2), array of path offsets of shape (m + 1,), float
+# Output: Boolean array of shape (n,) marking the points kept by RDP in each path
+def rdp_mask(coords, path_offsets, epsilon):
+    coords = np.asarray(coords).reshape(-1, 2)
+    path_offsets = np.asarray(path_offsets, dtype=np.int64)
+    keep = np.zeros(len(coords), dtype=bool)
+    starts, ends = path_offsets[:-1], path_offsets[1:] - 1
+    nonempty = ends >= starts
+    keep[starts[nonempty]] = True
+    keep[ends[nonempty]] = True
+
+    # Stack of pending ranges (first and last point index); only ranges with interior points need a split
+    stack_starts, stack_ends = starts[ends - starts >= 2], ends[ends - starts >= 2]
+    while len(stack_starts):
+        # Interior point indices of every pending range, laid out range after range
+        interior_counts = stack_ends - stack_starts - 1
+        range_ids = np.repeat(np.arange(len(stack_starts)), interior_counts)
+        first_interior = np.concatenate([[0], np.cumsum(interior_counts)[:-1]])
+        point_ids = np.arange(len(range_ids)) - first_interior[range_ids] + stack_starts[range_ids] + 1
+
+        distances = line_distances(coords[point_ids], coords[stack_starts[range_ids]], coords[stack_ends[range_ids]])
+        max_distances = np.maximum.reduceat(distances, first_interior)
+        # Split each range at its first farthest point, like rdp's strict comparison
+        is_max = distances == max_distances[range_ids]
+        max_positions = np.flatnonzero(is_max)
+        first_max = max_positions[np.concatenate([[True], np.diff(range_ids[max_positions]) != 0])]
+        split = max_distances > epsilon
+        split_points = point_ids[first_max][split]
+        keep[split_points] = True
+
+        # Replace each split range with its two halves, dropping halves without interior points
+        new_starts = np.concatenate([stack_starts[split], split_points])
+        new_ends = np.concatenate([split_points, stack_ends[split]])
+        pending = new_ends - new_starts >= 2
+        stack_starts, stack_ends = new_starts[pending], new_ends[pending]
+    return keep
+
+# Input: Array of path y and x coordinates of shape (n, 2), float
+# Output: Array of the kept coordinates
+def rdp_path(path, epsilon):
+    path = np.asarray(path).reshape(-1, 2)
+    return path[rdp_mask(path, [0, len(path)], epsilon)]
+
+# Input: PathBuffer, float
+# Output: PathBuffer with the same edges and paths, each simplified with RDP
+def rdp_buffer(paths, epsilon):
+    return apply_mask(paths, rdp_mask(paths.coords, paths.path_offsets, epsilon))
+
+# Helper function: Largest distance from any original point to the simplified segment spanning it
+# Input: Array of coordinates of shape (n, 2), array of path offsets, boolean array of kept points of shape (n,)
+# Output: float
+def max_deviation(coords, path_offsets, keep):
+    if len(coords) == 0:
+        return 0.0
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    point_ids = np.arange(len(coords))
+    # Closest kept point at or before and at or after each point (every path's end points are kept)
+    previous_kept = np.maximum.accumulate(np.where(keep, point_ids, 0))
+    next_kept = np.minimum.accumulate(np.where(keep, point_ids, len(coords) - 1)[::-1])[::-1]
+    starts, ends = coords[previous_kept], coords[next_kept]
+    direction = ends - starts
+    length_squared = (direction ** 2).sum(axis=1)
+    t = np.divide(((coords - starts) * direction).sum(axis=1), length_squared, out=np.zeros(len(coords)),
+                  where=length_squared > 0)
+    closest = starts + np.clip(t, 0, 1)[:, None] * direction
+    return float(np.sqrt(((coords - closest) ** 2).sum(axis=1)).max())
+
+# Input: Array of coordinates of shape (n, 2), array of path offsets of shape (m + 1,), int, boolean array of points
+#        that are never removed of shape (n,)
+# Output: Boolean array of shape (n,) marking the points kept
+# Visvalingam-Whyatt with one priority queue over all paths: the interior point whose triangle with its two
+# neighbors has the smallest area is removed first, wherever it is, and its neighbors' areas are updated, until
+# at most max_waypoints points remain. Path end points are never removed. A point's area is never less than that
+# of a point removed before it, so points are removed in order of significance
+def visvalingam_mask(coords, path_offsets, max_waypoints, fixed = None):
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    path_offsets = np.asarray(path_offsets, dtype=np.int64)
+    num_points = len(coords)
+    keep = np.ones(num_points, dtype=bool)
+    # Neighbors of each point in its path (-1 at path ends)
+    previous_ids = np.arange(num_points) - 1
+    next_ids = np.arange(num_points) + 1
+    starts, ends = path_offsets[:-1], path_offsets[1:] - 1
+    nonempty = ends >= starts
+    previous_ids[starts[nonempty]] = -1
+    next_ids[ends[nonempty]] = -1
+    removable = (previous_ids >= 0) & (next_ids >= 0)
+    if fixed is not None:
+        removable &= ~fixed
+    interior = np.flatnonzero(removable)
+
+    def triangle_area(i):
+        (y0, x0), (y1, x1), (y2, x2) = points[previous_ids[i]], points[i], points[next_ids[i]]
+        return abs((y1 - y0) * (x2 - x0) - (y2 - y0) * (x1 - x0)) / 2
+
+    a, b, c = coords[previous_ids[interior]], coords[interior], coords[next_ids[interior]]
+    areas = np.abs((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1])) / 2
+    current_areas = np.full(num_points, np.inf)
+    current_areas[interior] = areas
+    heap = list(zip(areas.tolist(), interior.tolist()))
+    heapq.heapify(heap)
+
+    num_kept = num_points
+    # The removal loop runs point by point, so it works on Python lists rather than arrays
+    points, previous_ids, next_ids = coords.tolist(), previous_ids.tolist(), next_ids.tolist()
+    current_areas, removable = current_areas.tolist(), removable.tolist()
+    while num_kept > max_waypoints and heap:
+        area, i = heapq.heappop(heap)
+        # Skip entries made stale by a later update of the point's area
+        if not keep[i] or area != current_areas[i]:
+            continue
+        keep[i] = False
+        num_kept -= 1
+        previous_id, next_id = previous_ids[i], next_ids[i]
+        next_ids[previous_id], previous_ids[next_id] = next_id, previous_id
+        for neighbor in (previous_id, next_id):
+            if removable[neighbor]:
+                current_areas[neighbor] = max(triangle_area(neighbor), area)
+                heapq.heappush(heap, (current_areas[neighbor], neighbor))
+    return keep
+
+# Input: Array of coordinates of shape (n, 2), array of path offsets of shape (m + 1,), int
+# Output: Boolean array of shape (n,) marking the points kept (none for paths dropped to fit the budget)
+# Error-ranked RDP: RDP splits, but taken in order of distance over all paths through one priority queue instead of
+# path by path down to epsilon. Whole paths are ranked in the same queue by how far they reach from their start point,
+# the error of leaving them out: adding a path keeps its required points (see required_points) and opens its ranges
+# for splitting. The most significant path or split is taken first, skipping paths whose required points no longer fit,
+# until max_waypoints points are kept or every remaining point lies on its range's line
+def ranked_rdp_mask(coords, path_offsets, max_waypoints):
+    coords = np.asarray(coords).reshape(-1, 2)
+    path_offsets = np.asarray(path_offsets, dtype=np.int64)
+    keep = np.zeros(len(coords), dtype=bool)
+    required = required_points(coords, path_offsets)
+    num_kept = 0
+
+    # Helper function: Heap entry of a range, keyed by its farthest point's distance (negated for heapq)
+    def range_entry(start, end):
+        points = coords[start + 1:end]
+        distances = line_distances(points, np.broadcast_to(coords[start], points.shape),
+                                   np.broadcast_to(coords[end], points.shape))
+        farthest = int(np.argmax(distances))
+        return (-float(distances[farthest]), start, end, start + 1 + farthest)
+
+    # Path entries have an end of -1 to tell them from ranges
+    heap = []
+    for start, end in zip(path_offsets[:-1].tolist(), path_offsets[1:].tolist()):
+        if end > start:
+            offsets = coords[start:end].astype(np.float64) - coords[start]
+            heap.append((-float(np.sqrt((offsets ** 2).sum(axis=1).max())), start, -1, end))
+    heapq.heapify(heap)
+    while num_kept < max_waypoints and heap:
+        distance, start, end, split_point = heapq.heappop(heap)
+        if end == -1:
+            path_required = np.flatnonzero(required[start:split_point]) + start
+            if num_kept + len(path_required) > max_waypoints:
+                continue
+            keep[path_required] = True
+            num_kept += len(path_required)
+            ranges = zip(path_required[:-1].tolist(), path_required[1:].tolist())
+        elif distance < 0:
+            keep[split_point] = True
+            num_kept += 1
+            ranges = ((start, split_point), (split_point, end))
+        else:
+            continue
+        for new_start, new_end in ranges:
+            if new_end - new_start >= 2:
+                heapq.heappush(heap, range_entry(new_start, new_end))
+    return keep
+
+# Helper function: Largest distance from any of the points to the polylines of the paths (inf if there are none)
+# Input: Array of coordinates of shape (n, 2), PathBuffer
+# Output: float
+def max_distance_to_paths(points, paths, chunk_size = 1 << 22):
+    if len(points) == 0:
+        return 0.0
+    if paths.num_points == 0:
+        return float('inf')
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    coords = paths.coords.astype(np.float64)
+    # Segments between consecutive points of a path, and a zero-length segment for each single-point path
+    path_lengths = paths.path_lengths()
+    path_ends = paths.path_offsets[1:] - 1
+    segment_starts = np.flatnonzero(np.isin(np.arange(len(coords)), path_ends, invert=True))
+    single_points = paths.path_offsets[:-1][path_lengths == 1]
+    starts = coords[np.concatenate([segment_starts, single_points])]
+    ends = coords[np.concatenate([segment_starts + 1, single_points])]
+    direction = ends - starts
+    length_squared = (direction ** 2).sum(axis=1)
+    distances = np.empty(len(points))
+    # Points are processed in chunks so that the point-segment distance matrix stays within chunk_size entries
+    step = max(1, chunk_size // len(starts))
+    for first in range(0, len(points), step):
+        offsets = points[first:first + step, None, :] - starts[None, :, :]
+        t = np.divide((offsets * direction).sum(axis=2), length_squared, out=np.zeros(offsets.shape[:2]),
+                      where=length_squared > 0)
+        closest = np.clip(t, 0, 1)[:, :, None] * direction
+        distances[first:first + step] = np.sqrt(((offsets - closest) ** 2).sum(axis=2)).min(axis=1)
+    return float(distances.max())
+
+# Helper function: Append its start point to every path whose end lies within loop_gap of (but not on) its start, as
+# s56 closes strokes (and s6 with close_paths=True closes every path, as with loop_gap=inf)
+# Input: PathBuffer, float
+# Output: PathBuffer with the same edges and paths
+def close_loops(paths, loop_gap):
+    starts, ends = paths.path_offsets[:-1], paths.path_offsets[1:] - 1
+    close = ends > starts
+    gaps = np.hypot(*(paths.coords[ends[close]] - paths.coords[starts[close]]).astype(np.float64).T)
+    close[close] = (gaps > 0) & (gaps <= loop_gap)
+    coords = np.insert(paths.coords, ends[close] + 1, paths.coords[starts[close]], axis=0)
+    path_offsets = paths.path_offsets + np.concatenate([[0], np.cumsum(close, dtype=np.int64)])
+    return PathBuffer(coords, path_offsets, paths.edge_offsets)
+
+# Helper function: Keep the marked points of a PathBuffer, keeping its edges and paths
+def apply_mask(paths, keep):
+    kept_before = np.concatenate([[0], np.cumsum(keep, dtype=np.int64)])
+    return PathBuffer(paths.coords[keep], kept_before[paths.path_offsets], paths.edge_offsets)
+
+# Helper function: Points every path keeps whatever the budget: its end points and, for a closed loop, its point
+# farthest from the start
+# Output: Boolean array of shape (n,)
+def required_points(coords, path_offsets):
+    coords = np.asarray(coords).reshape(-1, 2)
+    required = np.zeros(len(coords), dtype=bool)
+    starts, ends = path_offsets[:-1], path_offsets[1:] - 1
+    nonempty = ends >= starts
+    required[starts[nonempty]] = True
+    required[ends[nonempty]] = True
+    closed = nonempty & (ends - starts >= 2)
+    closed[closed] = np.all(coords[starts[closed]] == coords[ends[closed]], axis=1)
+    for start, end in zip(starts[closed].tolist(), ends[closed].tolist()):
+        offsets = coords[start:end + 1].astype(np.float64) - coords[start]
+        required[start + int(np.argmax((offsets ** 2).sum(axis=1)))] = True
+    return required
+
+# Helper function: The paths of a PathBuffer that have a kept point, with their edges
+# Output: PathBuffer, boolean array of the kept paths' points of shape (n,)
+def select_paths(paths, keep):
+    path_ids = np.repeat(np.arange(paths.num_paths), paths.path_lengths())
+    kept_paths = np.bincount(path_ids[keep], minlength=paths.num_paths) > 0
+    kept_points = kept_paths[path_ids]
+    kept_before = np.concatenate([[0], np.cumsum(kept_paths, dtype=np.int64)])
+    path_offsets = np.concatenate([[0], np.cumsum(paths.path_lengths()[kept_paths], dtype=np.int64)])
+    return PathBuffer(paths.coords[kept_points], path_offsets, kept_before[paths.edge_offsets]), kept_points
+
+# Input: PathBuffer, int, string ('rdp' for error-ranked RDP or 'visvalingam' for Visvalingam-Whyatt), float (paths
+#        whose ends are within loop_gap are closed before counting, None to leave every path as it is)
+# Output: PathBuffer with at most max_waypoints points in total, float (largest distance from an original point to
+#         the simplified paths, including the points of dropped paths), int (number of paths dropped to fit the budget)
+# The paths to drop are chosen by error-ranked RDP with either method
+def budget_buffer(paths, max_waypoints, method = 'rdp', loop_gap = None):
+    if method not in ('rdp', 'visvalingam'):
+        raise ValueError(f'Invalid budget method: {method}')
+    if loop_gap is not None:
+        paths = close_loops(paths, loop_gap)
+    keep = ranked_rdp_mask(paths.coords, paths.path_offsets, max_waypoints)
+    kept_paths, kept_points = select_paths(paths, keep)
+    keep = keep[kept_points]
+    if method == 'visvalingam':
+        keep = visvalingam_mask(kept_paths.coords, kept_paths.path_offsets, max_waypoints,
+                                fixed=required_points(kept_paths.coords, kept_paths.path_offsets))
+    simplified_paths = apply_mask(kept_paths, keep)
+    max_error = max(max_deviation(kept_paths.coords, kept_paths.path_offsets, keep),
+                    max_distance_to_paths(paths.coords[~kept_points], simplified_paths))
+    return simplified_paths, max_error, paths.num_paths - kept_paths.num_paths
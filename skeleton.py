@@ -0,0 +1,109 @@
+import numpy as np
+
+# Offsets of the 8 neighbors of a pixel
+neighbor_offsets = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+# Input: Binary mask of shape (h, w)
+# Output: Binary mask of shape (h, w) thinned to a one-pixel-wide, 8-connected skeleton
+def thin_mask(mask):
+    img = np.pad(mask.astype(bool), 1).astype(np.uint8)
+    while True:
+        changed = False
+        # Zhang-Suen thinning: two sub-iterations peeling boundary pixels from opposite sides, applied to the
+        # whole image at once
+        for step in range(2):
+            # Neighbors P2 to P9, clockwise from the pixel above
+            p2, p3, p4 = img[:-2, 1:-1], img[:-2, 2:], img[1:-1, 2:]
+            p5, p6, p7 = img[2:, 2:], img[2:, 1:-1], img[2:, :-2]
+            p8, p9 = img[1:-1, :-2], img[:-2, :-2]
+            ring = [p2, p3, p4, p5, p6, p7, p8, p9, p2]
+            # Number of set neighbors and number of 0 -> 1 transitions around the ring
+            num_neighbors = sum(p.astype(np.int32) for p in ring[:-1])
+            transitions = sum(((ring[i] == 0) & (ring[i + 1] == 1)).astype(np.int32) for i in range(8))
+            if step == 0:
+                side = ((p2 & p4 & p6) == 0) & ((p4 & p6 & p8) == 0)
+            else:
+                side = ((p2 & p4 & p8) == 0) & ((p2 & p6 & p8) == 0)
+            remove = (img[1:-1, 1:-1] == 1) & (num_neighbors >= 2) & (num_neighbors <= 6) & (transitions == 1) & side
+            if remove.any():
+                img[1:-1, 1:-1][remove] = 0
+                changed = True
+        if not changed:
+            break
+
+    # Remove the inner corner pixel of 4-connected staircases so that diagonal runs have degree 2.
+    # Each pattern is applied on its own so that two pixels of one staircase are never removed together
+    for (ya, xa), (yb, xb) in [((-1, 0), (0, 1)), ((-1, 0), (0, -1)), ((1, 0), (0, 1)), ((1, 0), (0, -1))]:
+        center = img[1:-1, 1:-1]
+        first = img[1 + ya:img.shape[0] - 1 + ya, 1 + xa:img.shape[1] - 1 + xa]
+        second = img[1 + yb:img.shape[0] - 1 + yb, 1 + xb:img.shape[1] - 1 + xb]
+        opposite_first = img[1 - ya:img.shape[0] - 1 - ya, 1 - xa:img.shape[1] - 1 - xa]
+        opposite_second = img[1 - yb:img.shape[0] - 1 - yb, 1 - xb:img.shape[1] - 1 - xb]
+        opposite_corner = img[1 - ya - yb:img.shape[0] - 1 - ya - yb, 1 - xa - xb:img.shape[1] - 1 - xa - xb]
+        remove = (center == 1) & (first == 1) & (second == 1) & (opposite_first == 0) & (opposite_second == 0) \
+            & (opposite_corner == 0)
+        center[remove] = 0
+    return img[1:-1, 1:-1].astype(bool)
+
+# Input: Binary skeleton mask of shape (h, w)
+# Output: List of strokes (lists of pixel y and x coordinate tuples)
+# Skeleton pixels form an 8-connected graph. Endpoints (one neighbor) and junctions (three or more) are nodes, and
+# each stroke is a walk between two nodes along pixels with exactly two neighbors. Closed loops without nodes are
+# walked from an arbitrary pixel back to itself. Every pixel-to-pixel link is walked once, so tracing is linear
+def trace_skeleton(skeleton):
+    pixels = set(map(tuple, np.argwhere(skeleton).tolist()))
+
+    def neighbors(point):
+        return [(point[0] + y_offset, point[1] + x_offset) for y_offset, x_offset in neighbor_offsets
+                if (point[0] + y_offset, point[1] + x_offset) in pixels]
+
+    def link(a, b):
+        return (a, b) if a < b else (b, a)
+
+    nodes = sorted(point for point in pixels if len(neighbors(point)) != 2)
+    node_set = set(nodes)
+    visited_links = set()
+    visited_pixels = set()
+    strokes = []
+
+    # Helper function: Walk from start through next_point until reaching a node or running out of unvisited links
+    def walk(start, next_point):
+        stroke = [start, next_point]
+        visited_links.add(link(start, next_point))
+        prev, curr = start, next_point
+        while curr not in node_set and curr != start:
+            following = [point for point in neighbors(curr) if point != prev and link(curr, point) not in visited_links]
+            if not following:
+                break
+            prev, curr = curr, following[0]
+            visited_links.add(link(prev, curr))
+            stroke.append(curr)
+        visited_pixels.update(stroke)
+        return stroke
+
+    # Strokes starting and ending at endpoints or junctions
+    for node in nodes:
+        node_neighbors = neighbors(node)
+        if not node_neighbors and node not in visited_pixels:
+            visited_pixels.add(node)
+            strokes.append([node])
+        for point in node_neighbors:
+            if link(node, point) not in visited_links:
+                strokes.append(walk(node, point))
+
+    # Closed loops made only of pixels with two neighbors
+    for point in sorted(pixels - visited_pixels):
+        if point not in visited_pixels:
+            strokes.append(walk(point, neighbors(point)[0]))
+    return strokes
+
+# Input: Array of edge pixel y and x coordinates of shape (n, 2)
+# Output: List of strokes (lists of pixel y and x coordinate tuples) tracing the edge's skeleton
+def trace_edge(edge_points):
+    origin = edge_points.min(axis=0)
+    local_points = edge_points - origin
+    mask = np.zeros(local_points.max(axis=0) + 1, dtype=bool)
+    mask[local_points[:, 0], local_points[:, 1]] = True
+    strokes = trace_skeleton(thin_mask(mask))
+    y_origin, x_origin = origin.tolist()
+    return [[(y + y_origin, x + x_origin) for y, x in stroke] for stroke in strokes]
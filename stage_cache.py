@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import time
+import numpy as np
+from path_buffer import PathBuffer
+from atomic_file import write_atomic
+
+# Content-addressed, on-disk cache of pipeline stage results.
+# Each stage result is stored as a compressed .npz file named by a key that hashes the key of the stage's input
+# (ultimately the image bytes), the stage name and the stage parameters. Changing a parameter therefore changes the
+# key of that stage and of every stage downstream of it, while upstream results are still found. Files are evicted
+# least recently used first once the cache grows past max_bytes.
+
+class StageCache:
+    def __init__(self, cache_dir = 'stage_cache', max_bytes = 512 * 1024 ** 2):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.time_saved = 0.0
+        self.last_compute_time = 0.0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # Key of the raw input file, hashed from its bytes
+    @staticmethod
+    def file_key(file_path):
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    # Key of a stage result, from its input key, name and parameters
+    @staticmethod
+    def stage_key(upstream_key, stage, params):
+        fingerprint = json.dumps({'upstream': upstream_key, 'stage': stage, 'params': params}, sort_keys=True,
+                                 default=repr)
+        return hashlib.sha256(fingerprint.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.npz')
+
+    def contains(self, key):
+        return os.path.exists(self.path(key))
+
+    # Load a stored result, or return None on a miss (an unreadable entry is removed and counts as a miss).
+    # With count False the load is not counted in the hit, miss and time saved statistics
+    def load(self, key, count = True):
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                arrays = dict(data)
+            result = unpack_result(arrays)
+        except FileNotFoundError:
+            self.misses += count
+            return None
+        except Exception:
+            os.remove(path)
+            self.misses += count
+            return None
+        # Touch the file so eviction sees it as recently used
+        os.utime(path)
+        self.last_compute_time = float(arrays['__compute_time'])
+        if count:
+            self.hits += 1
+            self.time_saved += self.last_compute_time
+        return result
+
+    # Store a result along with the time it took to compute
+    def save(self, key, result, compute_time):
+        arrays = pack_result(result)
+        arrays['__compute_time'] = np.float64(compute_time)
+        write_atomic(self.path(key), lambda file: np.savez_compressed(file, **arrays))
+        self.evict()
+
+    # Return the cached result of a stage, computing and storing it on a miss
+    def run(self, key, function, *args, **kwargs):
+        result = self.load(key)
+        if result is None:
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            self.save(key, result, time.perf_counter() - start)
+        return result
+
+    # Remove the least recently used entries until the cache fits in max_bytes
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz'):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.cache_dir, name))
+            total_bytes -= size
+
+    def report(self):
+        return f'Stage cache: {self.hits} hits, {self.misses} misses, {self.time_saved:.2f}s saved'
+
+# Helper function: Keys of the results of a chain of stages (see run_cached_stages), in order
+def stage_keys(input_key, stages):
+    keys = []
+    upstream_key = input_key
+    for stage, params, _ in stages:
+        upstream_key = StageCache.stage_key(upstream_key, stage, params)
+        keys.append(upstream_key)
+    return keys
+
+# Run a chain of stages, each taking the previous stage's result, and return the last stage's result along with a dict
+# of the results of the stages named in keep.
+# Input: StageCache, string (key of the chain's input), input value, list of (stage name, params, function), names
+# Only the stages after the last one with a cached result are computed; the stages before it are not loaded unless
+# they are kept. A cached result is only used if the results of the kept stages before it are cached too, so a kept
+# result that was evicted is recomputed along with the stages after it. Entries store the compute time of their stage
+# plus all the stages before it, which is the time a hit saves
+def run_cached_stages(cache, input_key, input_value, stages, keep = ()):
+    keys = stage_keys(input_key, stages)
+
+    result, compute_time, first_stage = input_value, 0.0, 0
+    kept = {}
+    for i in reversed(range(len(stages))):
+        if not cache.contains(keys[i]):
+            continue
+        earlier = {stages[j][0]: cache.load(keys[j], count=False) for j in range(i) if stages[j][0] in keep}
+        if any(value is None for value in earlier.values()):
+            continue
+        loaded = cache.load(keys[i])
+        if loaded is not None:
+            result, compute_time, first_stage = loaded, cache.last_compute_time, i + 1
+            kept = earlier
+            break
+
+    if first_stage and stages[first_stage - 1][0] in keep:
+        kept[stages[first_stage - 1][0]] = result
+    for i in range(first_stage, len(stages)):
+        start = time.perf_counter()
+        result = stages[i][2](result)
+        compute_time += time.perf_counter() - start
+        cache.misses += 1
+        cache.save(keys[i], result, compute_time)
+        if stages[i][0] in keep:
+            kept[stages[i][0]] = result
+    return result, kept
+
+# Helper function: Flatten a stage result (array, PathBuffer or tuple of them) into named arrays
+def pack_result(result):
+    items = result if isinstance(result, tuple) else (result,)
+    arrays = {'__tuple': np.bool_(isinstance(result, tuple))}
+    kinds = []
+    for i, item in enumerate(items):
+        if isinstance(item, PathBuffer):
+            kinds.append('path_buffer')
+            arrays[f'{i}_coords'] = item.coords
+            arrays[f'{i}_path_offsets'] = item.path_offsets
+            arrays[f'{i}_edge_offsets'] = item.edge_offsets
+        else:
+            kinds.append('array')
+            arrays[f'{i}_array'] = np.asarray(item)
+    arrays['__kinds'] = np.array(kinds)
+    return arrays
+
+# Helper function: Rebuild a stage result from the arrays written by pack_result
+def unpack_result(arrays):
+    items = []
+    for i, kind in enumerate(arrays['__kinds'].tolist()):
+        if kind == 'path_buffer':
+            items.append(PathBuffer(arrays[f'{i}_coords'], arrays[f'{i}_path_offsets'], arrays[f'{i}_edge_offsets']))
+        else:
+            items.append(arrays[f'{i}_array'])
+    return tuple(items) if arrays['__tuple'] else items[0]
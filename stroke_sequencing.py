@@ -0,0 +1,237 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Pen-up travel minimization: choose the order in which strokes are painted, the end each open stroke starts from and
+# the vertex each closed loop starts (and ends) at. A stroke's entry is the point the robot arrives at and its exit the
+# point it leaves from; travel is the sum of the distances from each exit to the next entry, starting at start_point.
+
+# Helper function: Close strokes whose ends are within loop_gap of each other and flag them as loops
+# Input: List of arrays of y and x coordinates, float
+# Output: List of arrays of y and x coordinates, list of bools
+def prepare_strokes(paths, loop_gap):
+    strokes = []
+    is_loop = []
+    for path in paths:
+        path = np.asarray(path, dtype=np.int32).reshape(-1, 2)
+        loop = len(path) > 2 and np.hypot(*(path[-1] - path[0]).astype(float)) <= loop_gap
+        if loop and np.any(path[-1] != path[0]):
+            path = np.vstack([path, path[:1]])
+        strokes.append(path)
+        is_loop.append(bool(loop))
+    return strokes, is_loop
+
+# Helper function: Rotate a closed loop so that it starts and ends at the given vertex
+def rotate_loop(stroke, vertex):
+    return np.vstack([stroke[vertex:-1], stroke[:vertex + 1]])
+
+# Helper function: Entry and exit points of each position of a sequence
+# Input: Arrays of stroke first and last points of shape (n, 2), arrays of stroke order and flips of shape (n,)
+# Output: Arrays of entry and exit points of shape (n, 2)
+def entries_and_exits(first_points, last_points, order, flipped):
+    entries = np.where(flipped[:, None], last_points[order], first_points[order])
+    exits = np.where(flipped[:, None], first_points[order], last_points[order])
+    return entries, exits
+
+# Helper function: Total pen-up travel of a sequence
+def travel_distance(first_points, last_points, order, flipped, start_point):
+    if len(order) == 0:
+        return 0.0
+    entries, exits = entries_and_exits(first_points, last_points, order, flipped)
+    departures = np.vstack([np.asarray(start_point, dtype=float)[None, :], exits[:-1]])
+    return float(np.sqrt(((entries - departures) ** 2).sum(axis=1)).sum())
+
+# Helper class: Nearest point of an unfinished owner (stroke or edge) among a fixed set of candidate points
+# The candidates are held in a KD-tree; points of finished owners are skipped when queried and the tree is rebuilt from
+# the unfinished candidates when all k queried points are finished
+class NearestUnfinished:
+    # Input: Array of candidate y and x coordinates, array of candidate owner indices, int (points queried at once)
+    def __init__(self, points, owners, k = 8):
+        self.points = np.asarray(points, dtype=float)
+        self.owners = owners
+        self.k = k
+        self.alive = np.arange(len(self.points))
+        self.tree = cKDTree(self.points)
+
+    # Input: Point, array of bools (finished owners)
+    # Output: Index of the closest candidate whose owner is unfinished, None if there is none
+    def query(self, point, finished):
+        k = self.k
+        while True:
+            k = min(k, len(self.alive))
+            _, nearest = self.tree.query(point, k=k)
+            nearest = self.alive[np.atleast_1d(nearest)]
+            unfinished = nearest[~finished[self.owners[nearest]]]
+            if len(unfinished):
+                return unfinished[0]
+            if k == len(self.alive):
+                return None
+            # Most close candidates belong to finished owners: rebuild the tree without them
+            self.alive = self.alive[~finished[self.owners[self.alive]]]
+            if len(self.alive) == 0:
+                return None
+            self.tree = cKDTree(self.points[self.alive])
+            k = self.k
+
+# Helper function: Build a sequence by repeatedly moving to the closest unpainted stroke
+# Loops can be entered at any vertex and open strokes at either end; candidate entry points are searched with
+# NearestUnfinished
+# Input: List of strokes, list of bools, start point
+# Output: List of strokes (loops rotated to their chosen start), arrays of stroke order and flips
+def nearest_neighbor_sequence(strokes, is_loop, start_point):
+    strokes = list(strokes)
+    candidate_points, candidate_owners, candidate_tags = [], [], []
+    for s, stroke in enumerate(strokes):
+        # Loops are tagged with the vertex they would start at, open strokes with the end (0 first, 1 last)
+        tags = np.arange(len(stroke) - 1) if is_loop[s] else np.array([0, len(stroke) - 1])
+        candidate_points.append(stroke[tags])
+        candidate_owners.append(np.full(len(tags), s))
+        candidate_tags.append(np.where(is_loop[s], tags, tags > 0))
+    candidate_points = np.concatenate(candidate_points).astype(float)
+    candidate_owners = np.concatenate(candidate_owners)
+    candidate_tags = np.concatenate(candidate_tags)
+
+    painted = np.zeros(len(strokes), dtype=bool)
+    search = NearestUnfinished(candidate_points, candidate_owners)
+    order = []
+    flipped = []
+    curr = np.asarray(start_point, dtype=float)
+    for _ in range(len(strokes)):
+        candidate = search.query(curr, painted)
+        s = candidate_owners[candidate]
+        painted[s] = True
+        order.append(s)
+        if is_loop[s]:
+            strokes[s] = rotate_loop(strokes[s], candidate_tags[candidate])
+            flipped.append(False)
+        else:
+            flipped.append(bool(candidate_tags[candidate]))
+        curr = (strokes[s][0] if flipped[-1] else strokes[s][-1]).astype(float)
+    return strokes, np.array(order, dtype=np.int64), np.array(flipped, dtype=bool)
+
+# Helper function: Improve a sequence with 2-opt (reversing a run of strokes) and Or-opt (moving a run of up to three
+# strokes elsewhere, in either direction) moves. Only moves joining a point to one of its neighbor_count closest
+# stroke ends are tried
+# Input: Arrays of stroke first and last points, arrays of stroke order and flips, start point, int, int
+# Output: Arrays of stroke order and flips
+def improve_sequence(first_points, last_points, order, flipped, start_point, max_passes = 10, neighbor_count = 8):
+    num_strokes = len(order)
+    if num_strokes < 2:
+        return order, flipped
+    order, flipped = order.copy(), flipped.copy()
+    start_point = np.asarray(start_point, dtype=float)
+    end_points = np.vstack([first_points, last_points]).astype(float)
+    end_owners = np.concatenate([np.arange(num_strokes), np.arange(num_strokes)])
+    tree = cKDTree(end_points)
+    neighbor_count = min(neighbor_count, len(end_points))
+
+    def dist(a, b):
+        return float(np.hypot(a[0] - b[0], a[1] - b[1]))
+
+    for _ in range(max_passes):
+        improved = False
+        entries, exits = entries_and_exits(first_points, last_points, order, flipped)
+        positions = np.empty(num_strokes, dtype=np.int64)
+        positions[order] = np.arange(num_strokes)
+
+        # Exit of position p, where position -1 is the start point
+        def exit_at(p):
+            return start_point if p < 0 else exits[p]
+
+        # 2-opt: cut after positions p and q (p < q) and reverse the strokes in between (flipping a single stroke
+        # when q = p + 1)
+        for i in range(-1, num_strokes - 1):
+            _, nearby = tree.query(exit_at(i), k=neighbor_count)
+            for j in np.unique(positions[end_owners[np.atleast_1d(nearby)]]):
+                p, q = min(i, j), max(i, j)
+                if q == p:
+                    continue
+                before = dist(exit_at(p), entries[p + 1])
+                after = dist(exit_at(p), exits[q])
+                if q + 1 < num_strokes:
+                    before += dist(exits[q], entries[q + 1])
+                    after += dist(entries[p + 1], entries[q + 1])
+                if after < before - 1e-9:
+                    order[p + 1:q + 1] = order[p + 1:q + 1][::-1].copy()
+                    flipped[p + 1:q + 1] = ~flipped[p + 1:q + 1][::-1]
+                    entries, exits = entries_and_exits(first_points, last_points, order, flipped)
+                    positions[order] = np.arange(num_strokes)
+                    improved = True
+
+        # Or-opt: move the run of strokes at positions s..e to just after position p, forward or reversed
+        for length in range(1, 4):
+            s = 0
+            while s + length <= num_strokes:
+                e = s + length - 1
+                removed_gain = dist(exit_at(s - 1), entries[s])
+                if e + 1 < num_strokes:
+                    removed_gain += dist(exits[e], entries[e + 1]) - dist(exit_at(s - 1), entries[e + 1])
+                _, nearby = tree.query(entries[s], k=neighbor_count)
+                best = None
+                for c in np.unique(end_owners[np.atleast_1d(nearby)]):
+                    for p in (positions[c] - 1, positions[c]):
+                        if s - 1 <= p <= e:
+                            continue
+                        for reverse in (False, True):
+                            run_entry, run_exit = (exits[e], entries[s]) if reverse else (entries[s], exits[e])
+                            added_cost = dist(exit_at(p), run_entry)
+                            if p + 1 < num_strokes:
+                                added_cost += dist(run_exit, entries[p + 1]) - dist(exit_at(p), entries[p + 1])
+                            gain = removed_gain - added_cost
+                            if gain > 1e-9 and (best is None or gain > best[0]):
+                                best = (gain, p, reverse)
+                if best is not None:
+                    _, p, reverse = best
+                    run_order, run_flipped = order[s:e + 1].copy(), flipped[s:e + 1].copy()
+                    if reverse:
+                        run_order, run_flipped = run_order[::-1], ~run_flipped[::-1]
+                    rest_order = np.delete(order, np.arange(s, e + 1))
+                    rest_flipped = np.delete(flipped, np.arange(s, e + 1))
+                    insert_at = p + 1 if p < s else p + 1 - length
+                    order = np.insert(rest_order, insert_at, run_order)
+                    flipped = np.insert(rest_flipped, insert_at, run_flipped)
+                    entries, exits = entries_and_exits(first_points, last_points, order, flipped)
+                    positions[order] = np.arange(num_strokes)
+                    improved = True
+                s += 1
+
+        if not improved:
+            break
+    return order, flipped
+
+# Input: List of paths (arrays of y and x coordinates), start point, float, int
+# Output: List of oriented strokes in painting order, dict of travel distances
+def sequence_strokes(paths, start_point = (0, 0), loop_gap = 5, max_passes = 10):
+    strokes, is_loop = prepare_strokes(paths, loop_gap)
+    if not strokes:
+        return [], {'original': 0.0, 'nearest_neighbor': 0.0, 'improved': 0.0}
+    first_points = np.array([stroke[0] for stroke in strokes], dtype=float)
+    last_points = np.array([stroke[-1] for stroke in strokes], dtype=float)
+    identity = np.arange(len(strokes))
+    travel = {'original': travel_distance(first_points, last_points, identity, np.zeros(len(strokes), dtype=bool),
+                                          start_point)}
+
+    strokes, order, flipped = nearest_neighbor_sequence(strokes, is_loop, start_point)
+    first_points = np.array([stroke[0] for stroke in strokes], dtype=float)
+    last_points = np.array([stroke[-1] for stroke in strokes], dtype=float)
+    travel['nearest_neighbor'] = travel_distance(first_points, last_points, order, flipped, start_point)
+
+    order, flipped = improve_sequence(first_points, last_points, order, flipped, start_point, max_passes=max_passes)
+
+    # Re-pick the start vertex of every loop now that its neighbors in the sequence are fixed
+    curr = np.asarray(start_point, dtype=float)
+    for p, s in enumerate(order):
+        if is_loop[s]:
+            following = None
+            if p + 1 < len(order):
+                following = last_points[order[p + 1]] if flipped[p + 1] else first_points[order[p + 1]]
+            vertices = strokes[s][:-1].astype(float)
+            cost = np.hypot(*(vertices - curr).T)
+            if following is not None:
+                cost += np.hypot(*(vertices - following).T)
+            strokes[s] = rotate_loop(strokes[s], int(np.argmin(cost)))
+            first_points[s] = last_points[s] = strokes[s][0]
+        curr = first_points[s] if flipped[p] else last_points[s]
+    travel['improved'] = travel_distance(first_points, last_points, order, flipped, start_point)
+
+    sequenced = [strokes[s][::-1] if flip else strokes[s] for s, flip in zip(order, flipped)]
+    return sequenced, travel
@@ -0,0 +1,77 @@
+import os
+import numpy as np
+import pytest
+import image_processing as img_processing
+from benchmark import legacy_s2_generate_edges
+
+# Regression tests for s2_generate_edges: the vectorized detector must match the original per-pixel 2x2 scan, and
+# thin edges must mark exactly one side of every color change, including at the image border
+
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+bundled_images = [('penn_logo_sharp.png', 3), ('minnesota_wild.png', 5)]
+# Neighbors compared with thin=True, as (y, x) offsets
+thin_offsets = {None: [(0, 1), (1, 0), (1, 1), (0, -1), (-1, 0), (-1, -1)],
+                4: [(0, 1), (1, 0), (0, -1), (-1, 0)],
+                8: [(0, 1), (1, 0), (0, -1), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]}
+
+# Helper function: Label images covering the border cases: single pixels, single rows and columns, and color changes
+# only in the last row or column
+def border_case_labels():
+    rng = np.random.default_rng(0)
+    cases = [rng.integers(0, 3, size=shape).astype(np.uint8) for shape in [(1, 1), (1, 7), (7, 1), (2, 2), (5, 9)]]
+    last_column = np.zeros((4, 5), dtype=np.uint8)
+    last_column[:, -1] = 1
+    last_row = np.zeros((5, 4), dtype=np.uint8)
+    last_row[-1, :] = 2
+    corner = np.zeros((3, 3), dtype=np.uint8)
+    corner[-1, -1] = 1
+    return cases + [last_column, last_row, corner, np.zeros((3, 4), dtype=np.uint8)]
+
+# Helper function: Shifted views of a label image and its neighbors at an offset (pairs outside the image are skipped)
+def neighbor_pairs(img_labels, y_offset, x_offset):
+    img_height, img_width = img_labels.shape
+    pixels = (slice(max(-y_offset, 0), img_height - max(y_offset, 0)),
+              slice(max(-x_offset, 0), img_width - max(x_offset, 0)))
+    neighbors = (slice(max(y_offset, 0), img_height - max(-y_offset, 0)),
+                 slice(max(x_offset, 0), img_width - max(-x_offset, 0)))
+    return pixels, img_labels[pixels], img_labels[neighbors]
+
+def prepared_labels(image_name, k):
+    img_rgb = img_processing.s0_prepare_img(os.path.join(repo_dir, image_name), border_size=2)
+    return img_processing.s1_reduce_img_rgbs(img_rgb, k=k, fit_mode='unique')
+
+@pytest.mark.parametrize('image_name, k', bundled_images)
+def test_matches_legacy_on_bundled_images(image_name, k):
+    img_labels, selected_rgbs = prepared_labels(image_name, k)
+    legacy_edges = legacy_s2_generate_edges(img_processing.labels_to_rgb(img_labels, selected_rgbs))
+    assert np.array_equal(img_processing.s2_generate_edges(img_labels), legacy_edges)
+
+def test_matches_legacy_on_border_cases():
+    palette = np.array([[0, 0, 0], [255, 0, 0], [0, 0, 255]])
+    for img_labels in border_case_labels():
+        legacy_edges = legacy_s2_generate_edges(img_processing.labels_to_rgb(img_labels, palette))
+        assert np.array_equal(img_processing.s2_generate_edges(img_labels), legacy_edges), img_labels
+
+@pytest.mark.parametrize('connectivity', [None, 4, 8])
+def test_thin_edges_mark_the_lower_label_side(connectivity):
+    images = border_case_labels() + [prepared_labels(image_name, k)[0] for image_name, k in bundled_images]
+    for img_labels in images:
+        thin_edges = img_processing.s2_generate_edges(img_labels, connectivity=connectivity, thin=True) > 0
+        # Every change between 4-neighbors is marked on its lower-label side
+        for y_offset, x_offset in [(0, 1), (1, 0), (0, -1), (-1, 0)]:
+            pixels, pixel_labels, neighbor_labels = neighbor_pairs(img_labels, y_offset, x_offset)
+            assert np.all(thin_edges[pixels][pixel_labels < neighbor_labels])
+        # Only pixels with a higher-label neighbor are marked
+        has_higher_neighbor = np.zeros(img_labels.shape, dtype=bool)
+        for y_offset, x_offset in thin_offsets[connectivity]:
+            pixels, pixel_labels, neighbor_labels = neighbor_pairs(img_labels, y_offset, x_offset)
+            has_higher_neighbor[pixels] |= pixel_labels < neighbor_labels
+        assert np.array_equal(thin_edges, has_higher_neighbor)
+
+@pytest.mark.parametrize('connectivity', [None, 4, 8])
+def test_thin_edges_are_one_pixel_wide(connectivity):
+    for img_labels in [np.repeat([[1, 1, 1, 0, 0, 0]], 6, axis=0), np.repeat([[0, 0, 0, 1, 1, 1]], 6, axis=0)]:
+        for labels in [img_labels, img_labels.T]:
+            thin_edges = img_processing.s2_generate_edges(labels.astype(np.uint8), connectivity=connectivity,
+                                                          thin=True)
+            assert np.count_nonzero(thin_edges) == 6
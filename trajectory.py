@@ -0,0 +1,204 @@
+import numpy as np
+
+# Time-parameterized trajectories for the robot, sampled at a fixed control rate. Distances are in waypoint units
+# (pixels) and times in seconds.
+# The job is one polyline: travel (painting off) from the start point to each path's first waypoint, then painting
+# along the path. The robot stops at every path start and end, where the painting toggle changes, and dwells there for
+# toggle_dwell while the paint valve switches. Every segment has a trapezoidal speed profile (constant acceleration,
+# cruise, constant deceleration), capped at paint_speed on painting segments and travel_speed on travel segments.
+# Instead of stopping at every corner, the robot takes it at the speed it could hold on an arc that blends the two
+# segments within corner_tolerance of the corner with max_accel, as junction deviation planners do. The vertex speeds
+# then come from a forward (acceleration) and a backward (deceleration) pass; each pass reduces to a running minimum,
+# so both are computed vectorized over the whole job.
+# The trajectory is then passed through two moving averages of max_accel / max_jerk seconds each, which round its
+# corners and ramp its acceleration. Corner speeds are then limited by the rounded corner's deviation and
+# turning acceleration instead, and stops are held at least as long as the filters so they are still reached. Speed
+# changes along the path and turns at corners can overlap, so each is given half of max_accel, which keeps the total
+# within max_accel and jerk within max_jerk.
+# Without max_jerk only the job time of the plan can be estimated: its samples would go straight through each corner at
+# the speed of the blend arc, turning instantly, so generate_trajectory requires max_jerk.
+
+# A sampled trajectory: positions (in the same coordinate order as the waypoints), velocities and painting states at
+# times, one sample per control period, with the estimated job time and the time spent painting
+class Trajectory:
+    def __init__(self, times, positions, velocities, painting, job_time):
+        self.times = times
+        self.positions = positions
+        self.velocities = velocities
+        self.painting = painting
+        self.job_time = job_time
+
+    @property
+    def num_samples(self):
+        return len(self.times)
+
+    @property
+    def paint_time(self):
+        if len(self.times) < 2:
+            return 0.0
+        return float(self.painting.sum() * (self.times[1] - self.times[0]))
+
+    def __repr__(self):
+        return (f'Trajectory(samples={self.num_samples}, job_time={self.job_time:.1f}s, '
+                f'paint_time={self.paint_time:.1f}s)')
+
+# Helper function: The job's polyline, with zero-length segments dropped
+# Input: PathBuffer, tuple (robot start coordinates)
+# Output: Array of vertex coordinates of shape (n + 1, 2), boolean arrays of painting segments of shape (n,) and of
+#         vertices the robot stops at of shape (n + 1,)
+def job_polyline(paths, start_point):
+    path_starts, path_ends = paths.path_offsets[:-1], paths.path_offsets[1:]
+    nonempty = path_ends > path_starts
+    vertices = np.concatenate([np.asarray(start_point, dtype=np.float64).reshape(1, 2),
+                               paths.coords.astype(np.float64)])
+    # Segment i runs from vertex i to vertex i + 1, and waypoint i is vertex i + 1; a segment paints unless it ends at
+    # a path's first waypoint
+    painting = np.ones(len(vertices) - 1, dtype=bool)
+    painting[path_starts[nonempty]] = False
+    stops = np.zeros(len(vertices), dtype=bool)
+    stops[path_starts[nonempty] + 1] = True
+    stops[path_ends[nonempty]] = True
+
+    # Repeated vertices are merged, keeping the painting state of the segment that reaches them
+    kept = np.flatnonzero(np.concatenate([[True], np.any(vertices[1:] != vertices[:-1], axis=1)]))
+    return vertices[kept], painting[kept[1:] - 1], np.logical_or.reduceat(stops, kept)
+
+# Helper function: Fastest speed through each interior vertex of the polyline
+# Input: Array of segment unit directions of shape (n, 2), float (acceleration limit for path speed changes and turns),
+#        float, float (smoothing time, 0 without max_jerk)
+# Output: Array of speed limits of shape (n - 1,) (inf for straight vertices)
+def corner_speed_limits(directions, max_accel, corner_tolerance, smoothing_time):
+    cos_turn = np.clip((directions[:-1] * directions[1:]).sum(axis=1), -1, 1)
+    with np.errstate(divide='ignore'):
+        if smoothing_time == 0:
+            # An arc tangent to both segments that passes corner_tolerance from the corner has radius
+            # corner_tolerance * s / (1 - s), with s the sine of half the angle between the segments
+            sin_half_angle = np.sqrt((1 + cos_turn) / 2)
+            radii = np.full(len(cos_turn), np.inf)
+            curved = sin_half_angle < 1
+            radii[curved] = corner_tolerance * sin_half_angle[curved] / (1 - sin_half_angle[curved])
+            return np.sqrt(max_accel * radii)
+        # Through the two moving averages, a corner taken at speed v changes velocity by 2 * v * sin(turn / 2) over
+        # smoothing_time (which must stay within max_accel) and is cut by v * smoothing_time * sin(turn / 2) / 3
+        sin_half_turn = np.sqrt((1 - cos_turn) / 2)
+        limits = np.full(len(cos_turn), np.inf)
+        turned = sin_half_turn > 0
+        limits[turned] = np.minimum(max_accel * smoothing_time / (2 * sin_half_turn[turned]),
+                                    3 * corner_tolerance / (smoothing_time * sin_half_turn[turned]))
+        return limits
+
+# Helper function: Trapezoidal speed profile of every move of the job (segments and dwells, in order)
+# Input: PathBuffer, tuple, floats (see generate_trajectory, with max_accel the limit for path speed changes and
+#        turns), float (smoothing time)
+# Output: Dict of arrays over moves: start positions, unit directions, lengths, start, peak and end speeds,
+#         acceleration, cruise and deceleration times, and whether the move paints
+def plan_moves(paths, start_point, paint_speed, travel_speed, max_accel, corner_tolerance, toggle_dwell,
+               smoothing_time):
+    vertices, painting, stops = job_polyline(paths, start_point)
+    deltas = np.diff(vertices, axis=0)
+    lengths = np.hypot(deltas[:, 0], deltas[:, 1])
+    directions = deltas / lengths[:, None] if len(lengths) else deltas
+    max_speeds = np.where(painting, paint_speed, travel_speed)
+
+    # Speed limit at each vertex: no faster than either segment allows and the corner allows, stopped at path ends
+    vertex_limits = np.zeros(len(vertices))
+    if len(lengths) > 1:
+        vertex_limits[1:-1] = np.minimum(np.minimum(max_speeds[:-1], max_speeds[1:]),
+                                         corner_speed_limits(directions, max_accel, corner_tolerance, smoothing_time))
+    vertex_limits[stops] = 0
+
+    # Forward pass: v[i] ** 2 = min over j <= i of limit[j] ** 2 + 2 * max_accel * (s[i] - s[j]), with s the distance
+    # along the polyline, is a running minimum; the backward pass is one over the reversed vertices
+    squared_limits = vertex_limits ** 2
+    reach = 2 * max_accel * np.concatenate([[0], np.cumsum(lengths)])
+    forward = reach + np.minimum.accumulate(squared_limits - reach)
+    backward = np.minimum.accumulate((squared_limits + reach)[::-1])[::-1] - reach
+    speeds = np.sqrt(np.clip(np.minimum(forward, backward), 0, None))
+
+    start_speeds, end_speeds = speeds[:-1], speeds[1:]
+    peak_speeds = np.minimum(max_speeds, np.sqrt(max_accel * lengths + (start_speeds ** 2 + end_speeds ** 2) / 2))
+    peak_speeds = np.maximum(peak_speeds, np.maximum(start_speeds, end_speeds))
+    accel_lengths = (peak_speeds ** 2 - start_speeds ** 2) / (2 * max_accel)
+    decel_lengths = (peak_speeds ** 2 - end_speeds ** 2) / (2 * max_accel)
+    cruise_lengths = np.maximum(lengths - accel_lengths - decel_lengths, 0)
+    moves = {'starts': vertices[:-1], 'directions': directions, 'lengths': lengths, 'start_speeds': start_speeds,
+             'peak_speeds': peak_speeds, 'accel_times': (peak_speeds - start_speeds) / max_accel,
+             'cruise_times': cruise_lengths / peak_speeds, 'decel_times': (peak_speeds - end_speeds) / max_accel,
+             'painting': painting}
+
+    # Dwells are moves that hold a stop's position, placed before the segment leaving the stop
+    dwell_time = max(toggle_dwell, 2 * smoothing_time)
+    dwell_vertices = np.flatnonzero(stops) if dwell_time > 0 else np.empty(0, dtype=np.int64)
+    num_dwells = len(dwell_vertices)
+    dwells = {'starts': vertices[dwell_vertices], 'directions': np.zeros((num_dwells, 2)),
+              'cruise_times': np.full(num_dwells, float(dwell_time)), 'painting': np.zeros(num_dwells, dtype=bool)}
+    order = np.argsort(np.concatenate([2 * np.arange(len(lengths)) + 1, 2 * dwell_vertices]), kind='stable')
+    return {key: np.concatenate([moves[key], dwells.get(key, np.zeros(num_dwells))])[order] for key in moves}
+
+# Helper function: Causal moving average over window samples of each column, starting from rest at the first sample
+def moving_average(values, window):
+    padded = np.concatenate([np.repeat(values[:1], window, axis=0), values])
+    sums = np.cumsum(padded, axis=0)
+    return (sums[window:] - sums[:-window]) / window
+
+# Helper function: Number of samples in each moving average (0 without max_jerk), and the acceleration limit for path
+# speed changes and for turns
+def smoothing(max_accel, max_jerk, control_rate):
+    window = int(round(max_accel / max_jerk * control_rate)) if max_jerk else 0
+    return window, max_accel / 2 if window else max_accel
+
+# Input: PathBuffer (sequenced paths, in painting order), tuple (robot start coordinates), floats (painting and travel
+#        speed limits, acceleration limit, jerk limit or None for the unsmoothed trapezoidal plan, largest distance a
+#        corner may be cut by, samples per second, seconds held at each stop)
+# Output: float (estimated job time in seconds), without sampling the trajectory
+def estimate_job_time(paths, start_point = (0, 0), paint_speed = 3.0, travel_speed = 6.0, max_accel = 3.0,
+                      max_jerk = 20.0, corner_tolerance = 0.25, control_rate = 50, toggle_dwell = 0.1):
+    window, path_accel = smoothing(max_accel, max_jerk, control_rate)
+    smoothing_time = window / control_rate
+    moves = plan_moves(paths, start_point, paint_speed, travel_speed, path_accel, corner_tolerance, toggle_dwell,
+                       smoothing_time)
+    return float((moves['accel_times'] + moves['cruise_times'] + moves['decel_times']).sum() + 2 * smoothing_time)
+
+# Input: PathBuffer (sequenced paths, in painting order), tuple, floats (as estimate_job_time, with max_jerk required)
+# Output: Trajectory sampled every 1 / control_rate seconds from the start point until the robot stops at the end
+def generate_trajectory(paths, start_point = (0, 0), paint_speed = 3.0, travel_speed = 6.0, max_accel = 3.0,
+                        max_jerk = 20.0, corner_tolerance = 0.25, control_rate = 50, toggle_dwell = 0.1):
+    window, path_accel = smoothing(max_accel, max_jerk, control_rate)
+    if not window:
+        raise ValueError('Invalid jerk limit: trajectories are only sampled with jerk-limited smoothing')
+    smoothing_time = window / control_rate
+    moves = plan_moves(paths, start_point, paint_speed, travel_speed, path_accel, corner_tolerance, toggle_dwell,
+                       smoothing_time)
+    accel_times, cruise_times, decel_times = moves['accel_times'], moves['cruise_times'], moves['decel_times']
+    end_times = np.cumsum(accel_times + cruise_times + decel_times)
+    job_time = float(end_times[-1] if len(end_times) else 0.0) + 2 * smoothing_time
+
+    # Evaluate every sample's move in closed form: its phase and the time into that phase
+    times = np.arange(int(np.ceil(job_time * control_rate - 1e-9)) + 1) / control_rate
+    if len(end_times) == 0:
+        positions = np.repeat(np.asarray(start_point, dtype=np.float64).reshape(1, 2), len(times), axis=0)
+        return Trajectory(times, positions, np.zeros_like(positions), np.zeros(len(times), dtype=bool), job_time)
+    move_ids = np.minimum(np.searchsorted(end_times, times, side='right'), len(end_times) - 1)
+    move_accel_times, move_cruise_times = accel_times[move_ids], cruise_times[move_ids]
+    move_times = move_accel_times + move_cruise_times + decel_times[move_ids]
+    elapsed = np.clip(times - (end_times[move_ids] - move_times), 0, move_times)
+    accel_elapsed = np.minimum(elapsed, move_accel_times)
+    cruise_elapsed = np.clip(elapsed - move_accel_times, 0, move_cruise_times)
+    decel_elapsed = np.clip(elapsed - move_accel_times - move_cruise_times, 0, None)
+    start_speeds, peak_speeds = moves['start_speeds'][move_ids], moves['peak_speeds'][move_ids]
+    distances = (start_speeds * accel_elapsed + path_accel * accel_elapsed ** 2 / 2 + peak_speeds * cruise_elapsed +
+                 peak_speeds * decel_elapsed - path_accel * decel_elapsed ** 2 / 2)
+    distances = np.minimum(distances, moves['lengths'][move_ids])
+    speeds = np.maximum(start_speeds + path_accel * (accel_elapsed - decel_elapsed), 0)
+    directions = moves['directions'][move_ids]
+    positions = moves['starts'][move_ids] + directions * distances[:, None]
+    velocities = directions * speeds[:, None]
+    painting = moves['painting'][move_ids] & (times < end_times[-1])
+
+    # The filters delay the trajectory by up to 2 * window samples; painting starts when the delayed trajectory starts
+    # a painting move and stops when it finishes one, both while it is held at a stop
+    positions = moving_average(moving_average(positions, window), window)
+    velocities = moving_average(moving_average(velocities, window), window)
+    delayed = np.concatenate([np.zeros(2 * window, dtype=bool), painting[:-2 * window]])
+    painting = painting | delayed
+    return Trajectory(times, positions, velocities, painting, job_time)
@@ -0,0 +1,93 @@
+import numpy as np
+
+# Binary waypoint file format, written in bulk and readable in place with np.memmap.
+# Layout (little-endian):
+#   header       32 bytes: magic b'WAYPOINT', format version (uint32), coordinate type (uint32, 0 int32 or
+#                1 float32), number of paths (uint64), number of waypoints (uint64)
+#   path offsets int64 of shape (num_paths + 1,): path j is waypoints path_offsets[j]:path_offsets[j + 1]
+#   coordinates  int32 or float32 of shape (num_waypoints, 2), in the same order as the text format's columns
+#   toggles      uint8 of shape (num_waypoints,): painting toggle of each waypoint, as in the text format
+
+magic = b'WAYPOINT'
+format_version = 1
+header_dtype = np.dtype([('magic', 'S8'), ('version', '<u4'), ('coord_type', '<u4'), ('num_paths', '<u8'),
+                         ('num_waypoints', '<u8')])
+coord_dtypes = [np.dtype('<i4'), np.dtype('<f4')]
+
+# Input: String (output file path), array of coordinates of shape (n, 2), array of path offsets of shape (m + 1,),
+#        array of painting toggles of shape (n,)
+def write_waypoints(output_file, coords, path_offsets, toggles):
+    coords = np.asarray(coords).reshape(-1, 2)
+    coord_type = 0 if np.issubdtype(coords.dtype, np.integer) else 1
+    header = np.zeros(1, dtype=header_dtype)
+    header['magic'] = magic
+    header['version'] = format_version
+    header['coord_type'] = coord_type
+    header['num_paths'] = len(path_offsets) - 1
+    header['num_waypoints'] = len(coords)
+    with open(output_file, 'wb') as file:
+        file.write(header.tobytes())
+        file.write(np.ascontiguousarray(path_offsets, dtype='<i8').tobytes())
+        file.write(np.ascontiguousarray(coords, dtype=coord_dtypes[coord_type]).tobytes())
+        file.write(np.ascontiguousarray(toggles, dtype=np.uint8).tobytes())
+
+# Helper function: Whether a file starts with the binary waypoint format's magic bytes
+def is_waypoint_file(input_file):
+    with open(input_file, 'rb') as file:
+        return file.read(len(magic)) == magic
+
+# Input: String (file written by write_waypoints)
+# Output: Arrays of coordinates of shape (n, 2), path offsets of shape (m + 1,) and toggles of shape (n,), all mapped
+#         read-only from the file rather than loaded
+def read_waypoints(input_file):
+    header = np.fromfile(input_file, dtype=header_dtype, count=1)
+    if len(header) == 0 or header['magic'][0] != magic:
+        raise ValueError(f'Invalid waypoint file: {input_file}')
+    if header['version'][0] != format_version:
+        raise ValueError(f'Invalid waypoint file version: {header["version"][0]}')
+    num_paths, num_waypoints = int(header['num_paths'][0]), int(header['num_waypoints'][0])
+    coord_dtype = coord_dtypes[int(header['coord_type'][0])]
+
+    # np.memmap cannot map zero-length arrays, so empty sections are returned as empty arrays
+    def mapped(dtype, offset, shape):
+        if np.prod(shape) == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(input_file, dtype=dtype, mode='r', offset=offset, shape=shape)
+
+    offset = header_dtype.itemsize
+    path_offsets = mapped('<i8', offset, (num_paths + 1,))
+    offset += 8 * (num_paths + 1)
+    coords = mapped(coord_dtype, offset, (num_waypoints, 2))
+    offset += coord_dtype.itemsize * 2 * num_waypoints
+    toggles = mapped(np.uint8, offset, (num_waypoints,))
+    return coords, path_offsets, toggles
+
+# Input: String (path of a binary waypoint file, a text waypoint file of "x, y, toggle" lines as written by
+#        s6_generate_output, or a path file of "x y" lines like path.txt)
+# Output: Array of coordinates of shape (n, 2), array of painting toggles of shape (n,) (None for path files)
+# Text files are parsed in bulk rather than line by line; blank lines are ignored
+def load_waypoints(input_file):
+    if is_waypoint_file(input_file):
+        coords, _, toggles = read_waypoints(input_file)
+        return np.array(coords, dtype=np.float64), np.array(toggles, dtype=np.int32)
+
+    with open(input_file, 'rb') as file:
+        first_line = b''
+        for line in file:
+            if line.strip():
+                first_line = line
+                break
+    if not first_line:
+        return np.empty((0, 2)), None
+    if b',' in first_line:
+        num_columns, delimiter = 3, ','
+    elif len(first_line.split()) == 2:
+        num_columns, delimiter = 2, None
+    else:
+        raise ValueError(f'Invalid waypoint file: {input_file}')
+    # numpy's C text parser reads the whole file in one call (and skips blank lines)
+    values = np.loadtxt(input_file, delimiter=delimiter, ndmin=2)
+    if values.shape[1] != num_columns:
+        raise ValueError(f'Invalid waypoint file: {input_file}')
+    toggles = values[:, 2].astype(np.int32) if num_columns == 3 else None
+    return values[:, :2], toggles